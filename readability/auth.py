@@ -22,12 +22,11 @@ except ImportError:
     from urlparse import parse_qs
 
 
-import requests
-
-from oauthlib.oauth1 import Client
-
 from readability.clients import DEFAULT_READER_URL_TEMPLATE
-from readability.core import required_from_env
+from readability.core import lazy_import, required_from_env
+from readability.transports import make_transport
+
+oauth1 = lazy_import('oauthlib.oauth1')
 
 logger = logging.getLogger(__name__)
 ACCESS_TOKEN_URL = 'oauth/access_token/'
@@ -43,6 +42,9 @@ def xauth(base_url_template=DEFAULT_READER_URL_TEMPLATE, **xargs):
     :param consumer_secret: Readability consumer secret, otherwise read from READABILITY_CONSUMER_SECRET.
     :param username: A username, otherwise read from READABILITY_USERNAME.
     :param password: A password, otherwise read from READABILITY_PASSWORD.
+    :param transport (optional): `readability.transports` transport, or the
+        name of one, used to send the request. Defaults to a
+        `RequestsTransport`.
 
     """
     consumer_key = xargs.get('consumer_key') or required_from_env('READABILITY_CONSUMER_KEY')
@@ -50,7 +52,7 @@ def xauth(base_url_template=DEFAULT_READER_URL_TEMPLATE, **xargs):
     username = xargs.get('username') or required_from_env('READABILITY_USERNAME')
     password = xargs.get('password') or required_from_env('READABILITY_PASSWORD')
 
-    client = Client(consumer_key, client_secret=consumer_secret, signature_type='BODY')
+    client = oauth1.Client(consumer_key, client_secret=consumer_secret, signature_type='BODY')
     url = base_url_template.format(ACCESS_TOKEN_URL)
     headers = {'Content-Type': 'application/x-www-form-urlencoded'}
     params = {
@@ -64,7 +66,12 @@ def xauth(base_url_template=DEFAULT_READER_URL_TEMPLATE, **xargs):
         body=urlencode(params),
         headers=headers)
 
-    response = requests.post(uri, data=body)
+    transport = make_transport(xargs.get('transport'))
+    try:
+        response = transport.request('POST', uri, data=body, headers=headers)
+    finally:
+        if transport is not xargs.get('transport'):
+            transport.close()
     logger.debug('POST to %s.', uri)
 
     token = parse_qs(response.content)
@@ -0,0 +1,461 @@
+# -*- coding: utf-8 -*-
+
+"""
+readability.benchmarks
+~~~~~~~~~~~~~~~~~~~~~~
+
+This module provides a benchmark suite for the client hot paths. Benchmarks
+run against a local `readability.testing.FakeReadabilityServer`, results are
+stored as JSON and two result files can be compared to flag regressions:
+
+    python -m readability.benchmarks run --output before.json
+    python -m readability.benchmarks run --output after.json
+    python -m readability.benchmarks compare before.json after.json
+
+"""
+
+import argparse
+import json
+import logging
+import platform
+import sys
+import time
+
+from collections import OrderedDict
+from datetime import datetime
+
+try:
+    from concurrent.futures import ThreadPoolExecutor
+except ImportError:
+    ThreadPoolExecutor = None
+
+from readability import jsonlib
+from readability.auth import xauth
+from readability.bitmaps import BookmarkIndex
+from readability.clients import ParserClient, ReaderClient, ACCEPTED_BOOKMARK_FILTERS
+from readability.testing import FakeReadabilityServer
+from readability.transports import TRANSPORTS
+from readability.utils import filter_args_to_dict
+
+
+logger = logging.getLogger(__name__)
+
+# Use the highest resolution clock available.
+timer = getattr(time, 'perf_counter', time.time)
+
+# Registry of benchmark names to benchmark functions, in definition order.
+BENCHMARKS = OrderedDict()
+
+# Metrics compared between runs and whether a higher value is better.
+COMPARED_METRICS = {
+    'throughput': True,
+    'p50': False,
+    'p99': False,
+}
+
+
+def benchmark(name):
+    """
+    Register the decorated function as the benchmark `name`.
+
+    Benchmark functions receive a `BenchmarkContext` and return a list of
+    per-operation latencies in seconds, or a `(latencies, operations)` tuple
+    when each latency covers more than one operation.
+    """
+    def register(func):
+        BENCHMARKS[name] = func
+        return func
+    return register
+
+
+def percentile(sorted_values, fraction):
+    """
+    Nearest-rank percentile of an already sorted list of values.
+
+    :param sorted_values: values sorted in ascending order.
+    :param fraction: the percentile wanted, between 0 and 1.
+    """
+    if not sorted_values:
+        return None
+    index = int(round(fraction * (len(sorted_values) - 1)))
+    return sorted_values[index]
+
+
+def timed(func, *args, **kwargs):
+    """
+    Call `func` and return how long it took in seconds.
+    """
+    start = timer()
+    func(*args, **kwargs)
+    return timer() - start
+
+
+def summarize(latencies, elapsed, operations=None):
+    """
+    Build the result entry of one benchmark.
+
+    :param latencies: per-operation latencies in seconds.
+    :param elapsed: wall clock seconds the benchmark took as a whole.
+    :param operations (optional): number of operations performed, if not
+        one per latency.
+    """
+    ordered = sorted(latencies)
+    if operations is None:
+        operations = len(ordered)
+    return OrderedDict([
+        ('operations', operations),
+        ('elapsed', elapsed),
+        ('throughput', operations / elapsed if elapsed else None),
+        ('mean', sum(ordered) / len(ordered) if ordered else None),
+        ('p50', percentile(ordered, 0.50)),
+        ('p99', percentile(ordered, 0.99)),
+        ('max', ordered[-1] if ordered else None),
+    ])
+
+
+class BenchmarkContext(object):
+    """
+    Fake server and clients shared by the benchmarks of one run.
+
+    :param iterations: number of operations each benchmark performs.
+    :param concurrency: number of worker threads for concurrent benchmarks.
+    :param bookmark_count: number of bookmarks the fake user starts with.
+    :param latency: server side latency, see `FakeReadabilityServer`.
+    :param micro_iterations: number of calls made by micro benchmarks.
+    :param transport: name of the transport the clients use, see
+        `readability.transports.TRANSPORTS`.
+    """
+    def __init__(self, iterations=200, concurrency=8, bookmark_count=500,
+        latency=0, micro_iterations=10000, transport='requests'):
+        self.transport = transport
+        self.iterations = iterations
+        self.concurrency = concurrency
+        self.micro_iterations = micro_iterations
+        self.server = FakeReadabilityServer(bookmark_count=bookmark_count,
+            latency=latency)
+
+    def __enter__(self):
+        self.server.start()
+        token_key, token_secret = self.server.token_for('user')
+        self.reader_client = ReaderClient(token_key, token_secret,
+            transport=self.transport, **self.server.client_kwargs('reader'))
+        self.parser_client = ParserClient(transport=self.transport,
+            **self.server.client_kwargs('parser'))
+        return self
+
+    def __exit__(self, *exc_info):
+        self.reader_client.transport.close()
+        self.parser_client.transport.close()
+        self.server.stop()
+
+    def article_urls(self, prefix):
+        return ['http://example.com/{0}/{1}.html'.format(prefix, index)
+            for index in range(self.iterations)]
+
+
+@benchmark('parser.get_article.serial')
+def bench_get_article_serial(context):
+    client = context.parser_client
+    return [timed(client.get_article, url=url)
+        for url in context.article_urls('serial')]
+
+
+@benchmark('parser.get_article.concurrent')
+def bench_get_article_concurrent(context):
+    if ThreadPoolExecutor is None:
+        raise RuntimeError('concurrent.futures is required for concurrent benchmarks.')
+    client = context.parser_client
+    with ThreadPoolExecutor(max_workers=context.concurrency) as executor:
+        return list(executor.map(
+            lambda url: timed(client.get_article, url=url),
+            context.article_urls('concurrent')))
+
+
+@benchmark('reader.get_bookmarks.pagination')
+def bench_get_bookmarks_pagination(context):
+    client = context.reader_client
+    latencies = []
+    page = 1
+    num_pages = 1
+    while len(latencies) < context.iterations:
+        start = timer()
+        response = client.get_bookmarks(page=page, per_page=50)
+        latencies.append(timer() - start)
+        num_pages = response.json()['meta']['num_pages']
+        page = page % num_pages + 1
+    return latencies
+
+
+@benchmark('reader.add_bookmark.bulk')
+def bench_add_bookmark_bulk(context):
+    client = context.reader_client
+    return [timed(client.add_bookmark, url)
+        for url in context.article_urls('bulk')]
+
+
+@benchmark('auth.xauth')
+def bench_xauth(context):
+    server = context.server
+    iterations = max(context.iterations // 4, 1)
+    return [timed(xauth, base_url_template=server.reader_url_template,
+            consumer_key=server.consumer_key,
+            consumer_secret=server.consumer_secret,
+            username='user', password='password',
+            transport=context.reader_client.transport)
+        for _ in range(iterations)]
+
+
+def micro_benchmark(context, func):
+    """
+    Time `func` in batches of 100 calls and report per-call latencies.
+    """
+    batch = 100
+    latencies = []
+    for _ in range(max(context.micro_iterations // batch, 1)):
+        start = timer()
+        for _ in range(batch):
+            func()
+        latencies.append((timer() - start) / batch)
+    return latencies, len(latencies) * batch
+
+
+@benchmark('utils.filter_args_to_dict')
+def bench_filter_args_to_dict(context):
+    filters = {
+        'archive': True,
+        'favorite': False,
+        'domain': 'example.com',
+        'page': 2,
+        'per_page': 50,
+        'tags': 'one,two',
+        'added_since': datetime(2013, 1, 1),
+    }
+    return micro_benchmark(context,
+        lambda: filter_args_to_dict(filters, ACCEPTED_BOOKMARK_FILTERS))
+
+
+@benchmark('reader._generate_url')
+def bench_reader_generate_url(context):
+    client = context.reader_client
+    params = {'archive': 1, 'page': 2, 'per_page': 50}
+    return micro_benchmark(context,
+        lambda: client._generate_url('bookmarks', query_params=params))
+
+
+@benchmark('parser._generate_url')
+def bench_parser_generate_url(context):
+    client = context.parser_client
+    params = {'url': 'http://example.com/article.html', 'max_pages': 25}
+    return micro_benchmark(context,
+        lambda: client._generate_url('parser', query_params=params))
+
+
+def bookmark_index(context):
+    """
+    `BookmarkIndex` of 20000 bookmarks, shared by the benchmarks of a run.
+    """
+    index = getattr(context, 'bookmark_index', None)
+    if index is None:
+        index = context.bookmark_index = BookmarkIndex()
+        for bookmark_id in range(20000):
+            index.update({
+                'id': bookmark_id,
+                'favorite': bookmark_id % 5 == 0,
+                'archive': bookmark_id % 3 == 0,
+                'date_added': '2015-{0:02d}-{1:02d} {2:02d}:{3:02d}:00'.format(
+                    bookmark_id % 12 + 1, bookmark_id % 28 + 1, bookmark_id % 24,
+                    bookmark_id % 60),
+                'article': {'domain': 'example{0}.com'.format(bookmark_id % 50)},
+                'tags': [{'text': 'tag{0}'.format(bookmark_id % 200)}, {'text': 'common'}],
+            })
+    return index
+
+
+@benchmark('bitmaps.BookmarkIndex.match')
+def bench_bookmark_index_match(context):
+    index = bookmark_index(context)
+    return micro_benchmark(context, lambda: index.match(favorite=1, archive=0,
+        tags='common', domain='example5.com', added_since='2015-06-01 00:00:00'))
+
+
+@benchmark('bitmaps.BookmarkIndex.match_dates')
+def bench_bookmark_index_match_dates(context):
+    index = bookmark_index(context)
+    return micro_benchmark(context, lambda: index.match(favorite=1,
+        added_since='2015-03-01', added_until='2015-10-31'))
+
+
+@benchmark('bitmaps.BookmarkIndex.filter_page')
+def bench_bookmark_index_filter_page(context):
+    index = bookmark_index(context)
+    return micro_benchmark(context, lambda: index.filter(favorite=1, page=2, per_page=20))
+
+
+def json_payloads(context):
+    """
+    Raw JSON of a full page of bookmarks and of an article, as served.
+    """
+    payloads = getattr(context, 'json_payloads', None)
+    if payloads is None:
+        payloads = context.json_payloads = {
+            'bookmarks': context.reader_client.get_bookmarks(per_page=50).content,
+            'article': context.parser_client.get_article(
+                url='http://example.com/json/article.html').content,
+        }
+    return payloads
+
+
+def json_benchmark(payload, backend):
+    def bench(context):
+        loads = jsonlib.import_backend(backend)
+        data = json_payloads(context)[payload]
+        return micro_benchmark(context, lambda: loads(data))
+    return bench
+
+
+# One decoding benchmark per payload and installed backend, so that runs
+# show what each backend is worth on this machine.
+for _backend in jsonlib.available_backends():
+    for _payload in ('bookmarks', 'article'):
+        benchmark('jsonlib.{0}.{1}'.format(_payload, _backend))(json_benchmark(_payload, _backend))
+
+
+def run_benchmarks(names=None, **context_kwargs):
+    """
+    Run benchmarks and return the results as a JSON serializable dict.
+
+    :param names (optional): names of the benchmarks to run. All registered
+        benchmarks are run by default.
+    :param context_kwargs: passed to `BenchmarkContext`.
+    """
+    names = names or list(BENCHMARKS)
+    unknown = [name for name in names if name not in BENCHMARKS]
+    if unknown:
+        raise ValueError('Unknown benchmarks: {0}'.format(', '.join(unknown)))
+
+    results = OrderedDict()
+    with BenchmarkContext(**context_kwargs) as context:
+        for name in names:
+            logger.debug('Running benchmark %s', name)
+            start = timer()
+            latencies = BENCHMARKS[name](context)
+            operations = None
+            if isinstance(latencies, tuple):
+                latencies, operations = latencies
+            results[name] = summarize(latencies, timer() - start, operations)
+    return OrderedDict([
+        ('meta', OrderedDict([
+            ('created', datetime.utcnow().isoformat()),
+            ('python', platform.python_version()),
+            ('implementation', platform.python_implementation()),
+            ('platform', platform.platform()),
+            ('parameters', context_kwargs),
+        ])),
+        ('results', results),
+    ])
+
+
+def save_results(results, path):
+    with open(path, 'w') as result_file:
+        json.dump(results, result_file, indent=2)
+
+
+def load_results(path):
+    with open(path) as result_file:
+        return json.load(result_file)
+
+
+def compare_results(baseline, current, threshold=0.10):
+    """
+    Compare two benchmark runs.
+
+    Returns a list of `(benchmark, metric, baseline, current, change)` tuples,
+    one per metric that got worse by more than `threshold`. `change` is the
+    relative change, positive when the current run is worse.
+
+    :param baseline: results of the reference run.
+    :param current: results of the run being checked.
+    :param threshold: relative change tolerated before flagging a regression.
+    """
+    regressions = []
+    for name, current_result in current['results'].items():
+        baseline_result = baseline['results'].get(name)
+        if baseline_result is None:
+            continue
+        for metric, higher_is_better in COMPARED_METRICS.items():
+            before = baseline_result.get(metric)
+            after = current_result.get(metric)
+            if not before or after is None:
+                continue
+            change = (after - before) / float(before)
+            if higher_is_better:
+                change = -change
+            if change > threshold:
+                regressions.append((name, metric, before, after, change))
+    return regressions
+
+
+def format_results(results):
+    lines = ['{0:<34} {1:>12} {2:>12} {3:>12}'.format(
+        'benchmark', 'ops/s', 'p50 (ms)', 'p99 (ms)')]
+    for name, result in results['results'].items():
+        lines.append('{0:<34} {1:>12.1f} {2:>12.4f} {3:>12.4f}'.format(
+            name, result['throughput'], result['p50'] * 1000, result['p99'] * 1000))
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m readability.benchmarks',
+        description='Benchmark the Readability API clients against a local fake server.')
+    subparsers = parser.add_subparsers(dest='command')
+
+    run_parser = subparsers.add_parser('run', help='run benchmarks')
+    run_parser.add_argument('benchmarks', nargs='*', help='names of benchmarks to run')
+    run_parser.add_argument('-o', '--output', help='write JSON results to this file')
+    run_parser.add_argument('-n', '--iterations', type=int, default=200)
+    run_parser.add_argument('-c', '--concurrency', type=int, default=8)
+    run_parser.add_argument('--bookmarks', type=int, default=500)
+    run_parser.add_argument('--latency', type=float, default=0,
+        help='server side latency in seconds')
+    run_parser.add_argument('--transport', default='requests',
+        choices=sorted(TRANSPORTS), help='transport used by the clients')
+
+    compare_parser = subparsers.add_parser('compare', help='compare two result files')
+    compare_parser.add_argument('baseline')
+    compare_parser.add_argument('current')
+    compare_parser.add_argument('-t', '--threshold', type=float, default=0.10,
+        help='relative change tolerated before flagging a regression')
+
+    subparsers.add_parser('list', help='list available benchmarks')
+
+    args = parser.parse_args(argv)
+    if args.command == 'list':
+        for name in BENCHMARKS:
+            print(name)
+        return 0
+    if args.command == 'compare':
+        regressions = compare_results(load_results(args.baseline),
+            load_results(args.current), threshold=args.threshold)
+        for name, metric, before, after, change in regressions:
+            print('REGRESSION {0} {1}: {2:.6g} -> {3:.6g} ({4:+.1%})'.format(
+                name, metric, before, after, change))
+        if not regressions:
+            print('No regressions above {0:.0%}.'.format(args.threshold))
+        return 1 if regressions else 0
+    if args.command == 'run':
+        results = run_benchmarks(args.benchmarks or None,
+            iterations=args.iterations,
+            concurrency=args.concurrency,
+            bookmark_count=args.bookmarks,
+            latency=args.latency,
+            transport=args.transport)
+        print(format_results(results))
+        if args.output:
+            save_results(results, args.output)
+        return 0
+    parser.print_help()
+    return 2
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,565 @@
+# -*- coding: utf-8 -*-
+
+"""
+readability.bitmaps
+~~~~~~~~~~~~~~~~~~~
+
+This module provides an in-memory index answering `get_bookmarks` filters
+locally.
+
+`BookmarkIndex` keeps a compressed bitmap of bookmarks for every tag,
+domain and flag, and a sorted array per date field, so that any
+combination of filters is a few bitmap intersections:
+
+    index = BookmarkIndex.from_client(client)
+    index.filter(favorite=1, tags='python,async', added_since='2015-01-01')
+
+Bitmaps are split in chunks of 65536 bits stored as integers, with empty
+chunks left out, so that sparse tags cost little and intersections only
+touch chunks present in both operands. Date ranges are unions of cached
+bitmaps of runs of consecutive dates, and pages are read off the dates in
+order, so that neither costs a pass over every matching bookmark.
+
+"""
+
+import binascii
+import bisect
+import calendar
+import heapq
+import itertools
+import re
+import threading
+
+from datetime import datetime
+
+from readability.utils import dateutil_parser, filter_type_map
+
+CHUNK_BITS = 16
+CHUNK_MASK = (1 << CHUNK_BITS) - 1
+CHUNK_BYTES = (1 << CHUNK_BITS) // 8
+
+#: Date filter prefixes, as in `added_since`, to bookmark fields.
+DATE_FIELDS = {
+    'added': 'date_added',
+    'archived': 'date_archived',
+    'favorited': 'date_favorited',
+    'opened': 'date_opened',
+    'updated': 'date_updated',
+}
+FLAGS = ('archive', 'favorite')
+# Format of the dates in Reader API responses, and of plain days.
+API_DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+DAY_FORMAT = '%Y-%m-%d'
+ORDERS = ('date_added', 'date_updated')
+
+
+if hasattr(int, 'bit_count'):
+    def popcount(value):
+        return value.bit_count()
+else:
+    def popcount(value):
+        return bin(value).count('1')
+
+if hasattr(int, 'from_bytes'):
+    def from_bytes(data):
+        return int.from_bytes(bytes(data), 'little')
+
+    def to_bytes(value):
+        return value.to_bytes((value.bit_length() + 7) // 8, 'little')
+else:
+    def from_bytes(data):
+        return int(binascii.hexlify(bytes(data[::-1])), 16)
+
+    def to_bytes(value):
+        digits = '%x' % value
+        return binascii.unhexlify('0' * (len(digits) % 2) + digits)[::-1]
+
+# Positions of the bits set in every byte value.
+BYTE_BITS = [tuple(bit for bit in range(8) if byte >> bit & 1) for byte in range(256)]
+NONZERO_BYTE = re.compile(b'[^\x00]')
+
+
+class Bitmap(object):
+    """
+    Set of non-negative integers stored as chunked bitmaps.
+
+    :param values (optional): integers to add.
+    """
+    __slots__ = ('chunks',)
+
+    def __init__(self, values=()):
+        self.chunks = {}
+        # Bits are set in byte buffers and turned into integers once, rather
+        # than rebuilding a large integer for every value.
+        buffers = {}
+        for value in values:
+            key = value >> CHUNK_BITS
+            buffer = buffers.get(key)
+            if buffer is None:
+                buffer = buffers[key] = bytearray(CHUNK_BYTES)
+            low = value & CHUNK_MASK
+            buffer[low >> 3] |= 1 << (low & 7)
+        for key, buffer in buffers.items():
+            self.chunks[key] = from_bytes(buffer)
+
+    def add(self, value):
+        key = value >> CHUNK_BITS
+        self.chunks[key] = self.chunks.get(key, 0) | (1 << (value & CHUNK_MASK))
+
+    def discard(self, value):
+        key = value >> CHUNK_BITS
+        bits = self.chunks.get(key)
+        if bits is not None:
+            bits &= ~(1 << (value & CHUNK_MASK))
+            if bits:
+                self.chunks[key] = bits
+            else:
+                del self.chunks[key]
+
+    def __contains__(self, value):
+        return bool(self.chunks.get(value >> CHUNK_BITS, 0) >> (value & CHUNK_MASK) & 1)
+
+    def __len__(self):
+        return sum(popcount(bits) for bits in self.chunks.values())
+
+    def __bool__(self):
+        return bool(self.chunks)
+
+    __nonzero__ = __bool__
+
+    def __iter__(self):
+        for key in sorted(self.chunks):
+            data = bytearray(to_bytes(self.chunks[key]))
+            base = key << CHUNK_BITS
+            # Skip the empty bytes in C, shifting a large integer per value
+            # would copy it every time.
+            for match in NONZERO_BYTE.finditer(data):
+                index = match.start()
+                offset = base + (index << 3)
+                for bit in BYTE_BITS[data[index]]:
+                    yield offset + bit
+
+    def __eq__(self, other):
+        return isinstance(other, Bitmap) and self.chunks == other.chunks
+
+    def __ne__(self, other):
+        return not self == other
+
+    def copy(self):
+        bitmap = Bitmap()
+        bitmap.chunks = dict(self.chunks)
+        return bitmap
+
+    def __and__(self, other):
+        if len(self.chunks) > len(other.chunks):
+            self, other = other, self
+        result = Bitmap()
+        for key, bits in self.chunks.items():
+            bits &= other.chunks.get(key, 0)
+            if bits:
+                result.chunks[key] = bits
+        return result
+
+    def __or__(self, other):
+        result = self.copy()
+        result |= other
+        return result
+
+    def __ior__(self, other):
+        chunks = self.chunks
+        for key, bits in other.chunks.items():
+            chunks[key] = chunks.get(key, 0) | bits
+        return self
+
+    def __sub__(self, other):
+        result = Bitmap()
+        for key, bits in self.chunks.items():
+            bits &= ~other.chunks.get(key, 0)
+            if bits:
+                result.chunks[key] = bits
+        return result
+
+    def __repr__(self):
+        return '<Bitmap of {0} values>'.format(len(self))
+
+
+def membership(bitmap):
+    """
+    Function telling whether a value is in `bitmap`, for many lookups:
+    `in` shifts the whole chunk of the value every time.
+    """
+    views = dict((key, bytearray(to_bytes(bits))) for key, bits in bitmap.chunks.items())
+    empty = bytearray()
+
+    def contains(value):
+        data = views.get(value >> CHUNK_BITS, empty)
+        low = value & CHUNK_MASK
+        return (low >> 3) < len(data) and data[low >> 3] >> (low & 7) & 1
+
+    return contains
+
+
+def timestamp(value):
+    """
+    Seconds since the epoch of a date filter value or a bookmark date, both
+    taken as UTC.
+    """
+    if value is None or value == '':
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    if not isinstance(value, datetime):
+        try:
+            value = datetime.strptime(value, API_DATE_FORMAT if len(value) > 10 else DAY_FORMAT)
+        except ValueError:
+            value = dateutil_parser.parse(value)
+    if value.tzinfo is not None:
+        value = value.replace(tzinfo=None) - value.utcoffset()
+    return calendar.timegm(value.timetuple()) + value.microsecond / 1e6
+
+
+class SortedDates(object):
+    """
+    Document numbers sorted by a date, for range queries, and the date of
+    each document, as a timestamp, for ordering.
+
+    Ranges are answered from bitmaps of blocks of consecutive keys, built
+    on first use and kept until a key is added or removed before their end.
+    Blocks hold at least `MIN_BLOCK` keys, and there are about `BLOCKS` of
+    them, so that they take about `BLOCKS` times the memory of a bitmap of
+    every document.
+    """
+    MIN_BLOCK = 256
+    BLOCKS = 64
+
+    def __init__(self):
+        self.keys = []
+        self.dates = {}
+        self.blocks = []
+        self.block_size = self.MIN_BLOCK
+
+    def add(self, when, docnum):
+        index = bisect.bisect_left(self.keys, (when, docnum))
+        self.keys.insert(index, (when, docnum))
+        self.dates[docnum] = when
+        del self.blocks[index // self.block_size:]
+
+    def remove(self, docnum):
+        when = self.dates.pop(docnum, None)
+        if when is None:
+            return
+        index = bisect.bisect_left(self.keys, (when, docnum))
+        if index < len(self.keys) and self.keys[index] == (when, docnum):
+            del self.keys[index]
+            del self.blocks[index // self.block_size:]
+
+    def block(self, number):
+        """
+        Bitmap of the documents of the `number`th block of keys, which must
+        be a full one.
+        """
+        blocks = self.blocks
+        if not blocks:
+            self.block_size = max(self.MIN_BLOCK, len(self.keys) // self.BLOCKS)
+        size = self.block_size
+        while len(blocks) <= number:
+            start = len(blocks) * size
+            blocks.append(Bitmap(docnum for _, docnum in self.keys[start:start + size]))
+        return blocks[number]
+
+    def bounds(self, since=None, until=None):
+        low = 0 if since is None else bisect.bisect_left(self.keys, (since, -1))
+        high = len(self.keys) if until is None else bisect.bisect_right(self.keys, (until, float('inf')))
+        return low, max(low, high)
+
+    def between(self, since=None, until=None):
+        """
+        Bitmap of the documents dated between `since` and `until`, both
+        inclusive and optional.
+        """
+        return self.range(*self.bounds(since, until))
+
+    def range(self, low, high):
+        """
+        Bitmap of the documents of `keys[low:high]`.
+        """
+        if not self.blocks:
+            self.block_size = max(self.MIN_BLOCK, len(self.keys) // self.BLOCKS)
+        size = self.block_size
+        # Full blocks within the range, and the keys on either side of them.
+        first, last = -(-low // size), high // size
+        if first >= last:
+            return Bitmap(docnum for _, docnum in self.keys[low:high])
+        keys = self.keys
+        result = Bitmap(docnum for _, docnum in itertools.chain(
+            keys[low:first * size], keys[last * size:high]))
+        for number in range(first, last):
+            result |= self.block(number)
+        return result
+
+    def restrict(self, bitmap, since=None, until=None):
+        """
+        Documents of `bitmap` dated between `since` and `until`. Checks the
+        documents one by one when there are few of them.
+        """
+        low, high = self.bounds(since, until)
+        if min(high - low, self.block_size) <= len(bitmap):
+            return bitmap & self.range(low, high)
+        dates = self.dates
+        return Bitmap(docnum for docnum in bitmap if docnum in dates
+            and (since is None or dates[docnum] >= since)
+            and (until is None or dates[docnum] <= until))
+
+
+class BookmarkIndex(object):
+    """
+    In-memory index of bookmarks answering the `get_bookmarks` filters.
+
+    Bookmarks are added from listings with `update` or `add_many` and kept
+    up to date with further `update` and `remove` calls.
+    """
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.bookmarks = {}
+        self.docnums = {}
+        self.ids = []
+        self.free = []
+        self.live = Bitmap()
+        self.deleted = Bitmap()
+        self.flags = dict((flag, Bitmap()) for flag in FLAGS)
+        self.tags = {}
+        self.domains = {}
+        self.dates = dict((field, SortedDates()) for field in DATE_FIELDS.values())
+
+    @classmethod
+    def from_client(cls, client, per_page=50, **filters):
+        """
+        Build an index from all the bookmarks of a `ReaderClient`'s user.
+
+        :param filters: `get_bookmarks` filters restricting what is loaded.
+        """
+        index = cls()
+        page = num_pages = 1
+        while page <= num_pages:
+            response = client.get_bookmarks(page=page, per_page=per_page, **filters)
+            response.raise_for_status()
+            data = response.json()
+            index.add_many(data.get('bookmarks') or [],
+                deleted=bool(int(filters.get('only_deleted') or 0)))
+            num_pages = int((data.get('meta') or {}).get('num_pages') or 1)
+            page += 1
+        return index
+
+    def __len__(self):
+        return len(self.bookmarks)
+
+    def __contains__(self, bookmark_id):
+        return bookmark_id in self.bookmarks
+
+    def add_many(self, bookmarks, deleted=False):
+        """
+        Add or update bookmarks.
+
+        :param bookmarks: list of bookmarks, or a `get_bookmarks` response
+            or its JSON.
+        """
+        if hasattr(bookmarks, 'json'):
+            bookmarks = bookmarks.json()
+        if isinstance(bookmarks, dict):
+            bookmarks = bookmarks.get('bookmarks') or []
+        for bookmark in bookmarks:
+            self.update(bookmark, deleted=deleted)
+
+    def update(self, bookmark, deleted=False):
+        """
+        Add a bookmark, or replace the indexed version of it.
+
+        :param bookmark: bookmark as returned by the Reader API.
+        :param deleted: whether the bookmark is deleted, i.e. it was listed
+            with `only_deleted`.
+        """
+        with self.lock:
+            bookmark_id = bookmark['id']
+            if bookmark_id in self.bookmarks:
+                self._unindex(bookmark_id)
+            if self.free:
+                docnum = self.free.pop()
+                self.ids[docnum] = bookmark_id
+            else:
+                docnum = len(self.ids)
+                self.ids.append(bookmark_id)
+            self.docnums[bookmark_id] = docnum
+            self.bookmarks[bookmark_id] = bookmark
+            if deleted:
+                self.deleted.add(docnum)
+            else:
+                self.live.add(docnum)
+            for flag in FLAGS:
+                if bookmark.get(flag):
+                    self.flags[flag].add(docnum)
+            for tag in self._tags(bookmark):
+                self.tags.setdefault(tag, Bitmap()).add(docnum)
+            domain = self._domain(bookmark)
+            if domain:
+                self.domains.setdefault(domain, Bitmap()).add(docnum)
+            for field, dates in self.dates.items():
+                when = timestamp(bookmark.get(field))
+                if when is not None:
+                    dates.add(when, docnum)
+
+    def remove(self, bookmark_id):
+        """
+        Forget a bookmark, e.g. once it was permanently deleted.
+        """
+        with self.lock:
+            if bookmark_id in self.bookmarks:
+                self._unindex(bookmark_id)
+
+    def _unindex(self, bookmark_id):
+        bookmark = self.bookmarks.pop(bookmark_id)
+        docnum = self.docnums.pop(bookmark_id)
+        self.ids[docnum] = None
+        self.free.append(docnum)
+        self.live.discard(docnum)
+        self.deleted.discard(docnum)
+        for bitmap in self.flags.values():
+            bitmap.discard(docnum)
+        for tag in self._tags(bookmark):
+            self._discard(self.tags, tag, docnum)
+        domain = self._domain(bookmark)
+        if domain:
+            self._discard(self.domains, domain, docnum)
+        for dates in self.dates.values():
+            dates.remove(docnum)
+
+    @staticmethod
+    def _discard(bitmaps, key, docnum):
+        bitmap = bitmaps.get(key)
+        if bitmap is not None:
+            bitmap.discard(docnum)
+            if not bitmap:
+                del bitmaps[key]
+
+    @staticmethod
+    def _tags(bookmark):
+        return set(tag['text'] if isinstance(tag, dict) else tag
+            for tag in bookmark.get('tags') or [])
+
+    @staticmethod
+    def _domain(bookmark):
+        return (bookmark.get('article') or {}).get('domain')
+
+    def match(self, **filters):
+        """
+        Bitmap of the document numbers matching `filters`, which use the
+        `get_bookmarks` vocabulary. Paging and ordering filters are ignored.
+
+        The bitmap is the caller's own, changing it leaves the index alone.
+        """
+        unknown = set(filters) - set(filter_type_map)
+        if unknown:
+            raise ValueError('Unknown bookmark filters: {0}'.format(', '.join(sorted(unknown))))
+        with self.lock:
+            bitmaps = []
+            if int(filters.get('only_deleted') or 0):
+                base = self.deleted
+            else:
+                base = self.live
+            for flag in FLAGS:
+                value = filters.get(flag)
+                if value is not None and value != '':
+                    if int(value):
+                        bitmaps.append(self.flags[flag])
+                    else:
+                        base = base - self.flags[flag]
+            bitmaps.append(base)
+            if filters.get('domain'):
+                bitmaps.append(self.domains.get(filters['domain'], Bitmap()))
+            tags = filters.get('tags')
+            if tags:
+                if not isinstance(tags, (list, tuple, set)):
+                    tags = tags.split(',')
+                for tag in tags:
+                    if tag.strip():
+                        bitmaps.append(self.tags.get(tag.strip(), Bitmap()))
+            # Intersect the smallest bitmaps first so intermediate results
+            # stay small.
+            bitmaps.sort(key=len)
+            result = bitmaps[0]
+            for bitmap in bitmaps[1:]:
+                if not result:
+                    break
+                result = result & bitmap
+            if result is bitmaps[0]:
+                # Not intersected with anything: one of the index's own.
+                result = result.copy()
+            for prefix, field in DATE_FIELDS.items():
+                since = timestamp(filters.get(prefix + '_since'))
+                until = timestamp(filters.get(prefix + '_until'))
+                if result and (since is not None or until is not None):
+                    result = self.dates[field].restrict(result, since, until)
+            return result
+
+    def count(self, **filters):
+        return len(self.match(**filters))
+
+    def filter(self, **filters):
+        """
+        Bookmarks matching `filters`, ordered and paged like `get_bookmarks`:
+        by `order` (`'-date_added'` by default), then `page` and `per_page`
+        when given.
+        """
+        order = filters.pop('order', None) or '-date_added'
+        page = filters.pop('page', None)
+        per_page = filters.pop('per_page', None)
+        filters.pop('exclude_accessibility', None)
+        reverse = order.startswith('-')
+        key = order.lstrip('-')
+        if key not in ORDERS:
+            key = 'date_added'
+        start = end = None
+        if page or per_page:
+            page = max(int(page or 1), 1)
+            per_page = int(per_page or 20)
+            start, end = (page - 1) * per_page, page * per_page
+        with self.lock:
+            result = self.match(**filters)
+            docnums = self._ordered(result, key, reverse, end)
+            return [self.bookmarks[self.ids[docnum]] for docnum in docnums[start:end]]
+
+    def _ordered(self, result, key, reverse, limit=None):
+        """
+        Document numbers of `result` by date `key` then id, or the first
+        `limit` of them.
+        """
+        sorted_dates = self.dates[key]
+        # Dates were parsed once, when the bookmarks were indexed.
+        dates, ids = sorted_dates.dates, self.ids
+        sort_key = lambda docnum: (dates.get(docnum, 0), ids[docnum])
+        if limit is None:
+            return sorted(result, key=sort_key, reverse=reverse)
+        first = heapq.nlargest if reverse else heapq.nsmallest
+        count = len(result)
+        keys = sorted_dates.keys
+        # Reading the dates in order until `limit` documents matched takes
+        # about `limit * len(keys) / count` steps, going through the
+        # matches about `count`: the dates are read in order when that is
+        # well below, and given up on past `count` steps. Documents without
+        # a date sort first, so every document must have one.
+        if len(dates) < len(self.bookmarks) or 2 * limit * len(keys) > count * count:
+            return first(limit, result, key=sort_key)
+        found = []
+        boundary = None
+        contains = membership(result)
+        for step, (when, docnum) in enumerate(reversed(keys) if reverse else keys):
+            if boundary is not None and when != boundary:
+                break
+            if step > count:
+                # Many documents are dated alike.
+                return first(limit, result, key=sort_key)
+            if contains(docnum):
+                found.append(docnum)
+                if len(found) == limit:
+                    # Documents dated like the last one may have a lower id.
+                    boundary = when
+        return sorted(found, key=sort_key, reverse=reverse)[:limit]
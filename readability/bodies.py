@@ -0,0 +1,267 @@
+# -*- coding: utf-8 -*-
+
+"""
+readability.bodies
+~~~~~~~~~~~~~~~~~~
+
+This module provides the request body encodings used when POSTing documents
+to the Parser API.
+
+`'form'` is the classic `application/x-www-form-urlencoded` body. Percent
+encoding inflates HTML by up to 3x, so two alternatives send the document
+as is: `'raw'` sends it as the whole `text/html` body and `'multipart'`
+sends it as a file part of a `multipart/form-data` body. Any of them can be
+compressed with gzip or deflate, announced with `Content-Encoding`.
+
+Documents read from files, file-like objects or memory-mapped buffers are
+streamed instead: `document_stream` returns the body as an iterator of
+chunks, so that memory use stays bounded by the chunk size rather than
+growing with the document.
+
+"""
+
+import gzip
+import io
+import mmap
+import uuid
+import zlib
+
+try:
+    from urllib.parse import quote_plus, urlencode
+except ImportError:
+    from urllib import quote_plus, urlencode
+
+FORM_CONTENT_TYPE = 'application/x-www-form-urlencoded'
+HTML_CONTENT_TYPE = 'text/html; charset=utf-8'
+BODY_FORMATS = ('form', 'raw', 'multipart')
+COMPRESSIONS = ('gzip', 'deflate')
+
+# Responses are compressed by the server when the client allows it.
+ACCEPT_ENCODING = 'gzip, deflate'
+
+# Size of the chunks streamed documents are read and sent in.
+DEFAULT_CHUNK_SIZE = 64 * 1024
+
+
+def to_bytes(value):
+    if isinstance(value, bytes):
+        return value
+    if not isinstance(value, str):
+        value = str(value)
+    return value.encode('utf-8')
+
+
+def form_body(fields):
+    """
+    Encode `fields` as an `application/x-www-form-urlencoded` body.
+
+    :param fields: dict of field names to values.
+    """
+    return urlencode(fields), FORM_CONTENT_TYPE
+
+
+def multipart_body(fields, files, boundary=None):
+    """
+    Encode a `multipart/form-data` body. File contents are sent verbatim.
+
+    :param fields: dict of plain field names to values.
+    :param files: dict of field names to `(filename, content, content_type)`
+        tuples.
+    :param boundary (optional): boundary to use, random by default.
+    """
+    boundary = boundary or uuid.uuid4().hex
+    body = io.BytesIO()
+    body.write(multipart_fields(fields, boundary))
+    for name, (filename, content, content_type) in sorted(files.items()):
+        body.write(multipart_file_header(boundary, name, filename, content_type))
+        body.write(to_bytes(content))
+        body.write(b'\r\n')
+    body.write(multipart_end(boundary))
+    return body.getvalue(), multipart_content_type(boundary)
+
+
+def multipart_content_type(boundary):
+    return 'multipart/form-data; boundary={0}'.format(boundary)
+
+
+def multipart_fields(fields, boundary):
+    return b''.join(to_bytes(
+        '--{0}\r\nContent-Disposition: form-data; name="{1}"\r\n\r\n'.format(boundary, name))
+        + to_bytes(value) + b'\r\n' for name, value in sorted(fields.items()))
+
+
+def multipart_file_header(boundary, name, filename, content_type):
+    return to_bytes(
+        '--{0}\r\nContent-Disposition: form-data; name="{1}"; filename="{2}"\r\n'
+        'Content-Type: {3}\r\n\r\n'.format(boundary, name, filename, content_type))
+
+
+def multipart_end(boundary):
+    return to_bytes('--{0}--\r\n'.format(boundary))
+
+
+def compress_body(body, compression):
+    """
+    Compress `body` with `'gzip'` or `'deflate'`.
+    """
+    body = to_bytes(body)
+    if compression == 'gzip':
+        out = io.BytesIO()
+        with gzip.GzipFile(fileobj=out, mode='wb', mtime=0) as gzip_file:
+            gzip_file.write(body)
+        return out.getvalue()
+    if compression == 'deflate':
+        return zlib.compress(body)
+    raise ValueError('Unknown compression {0!r}, expected one of {1}'.format(
+        compression, ', '.join(COMPRESSIONS)))
+
+
+def document_body(document, fields, body_format='form', compression=None):
+    """
+    Build the body of a request POSTing `document`.
+
+    Returns a `(body, headers, query_params)` tuple. `query_params` holds the
+    fields that have to travel in the query string because the body has no
+    room for them (the `'raw'` format).
+
+    :param document: the document, as text or bytes.
+    :param fields: other fields to send along, e.g. `max_pages`.
+    :param body_format: one of `BODY_FORMATS`.
+    :param compression (optional): one of `COMPRESSIONS`.
+    """
+    query_params = {}
+    if body_format == 'form':
+        form = dict(fields)
+        form['doc'] = document
+        body, content_type = form_body(form)
+    elif body_format == 'raw':
+        body, content_type = to_bytes(document), HTML_CONTENT_TYPE
+        query_params = fields
+    elif body_format == 'multipart':
+        body, content_type = multipart_body(fields,
+            {'doc': ('doc.html', document, HTML_CONTENT_TYPE)})
+    else:
+        raise ValueError('Unknown body format {0!r}, expected one of {1}'.format(
+            body_format, ', '.join(BODY_FORMATS)))
+    headers = {'Content-Type': content_type}
+    if compression is not None:
+        body = compress_body(body, compression)
+        headers['Content-Encoding'] = compression
+    return body, headers, query_params
+
+
+def is_streamable(document):
+    """
+    Whether `document` is streamed rather than sent as a whole: a path
+    object (e.g. `pathlib.Path`), a file-like object or a buffer such as an
+    `mmap.mmap`, `bytearray` or `memoryview`. Plain strings are always
+    treated as the document itself, never as a path.
+    """
+    return (isinstance(document, (bytearray, memoryview, mmap.mmap))
+        or hasattr(document, 'read') or hasattr(document, '__fspath__'))
+
+
+def iter_document(document, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Read a streamable `document` as an iterator of byte chunks.
+
+    Buffers are sliced, which for an `mmap.mmap` only pages in the part of
+    the file being sent. Paths are opened when iteration starts and closed
+    once it ends.
+
+    :param document: see `is_streamable`.
+    :param chunk_size: maximum size of the chunks.
+    """
+    if isinstance(document, (bytearray, memoryview, mmap.mmap)):
+        for offset in range(0, len(document), chunk_size):
+            yield bytes(document[offset:offset + chunk_size])
+        return
+    if hasattr(document, '__fspath__'):
+        with open(document.__fspath__(), 'rb') as document_file:
+            for chunk in iter_document(document_file, chunk_size):
+                yield chunk
+        return
+    while True:
+        chunk = document.read(chunk_size)
+        if not chunk:
+            break
+        yield to_bytes(chunk)
+
+
+def form_stream(chunks, fields):
+    """
+    Stream an `application/x-www-form-urlencoded` body with `fields` and a
+    `doc` field made of `chunks`. Percent-encoding works byte by byte, so
+    each chunk is encoded on its own.
+    """
+    yield to_bytes(urlencode(fields) + '&doc=' if fields else 'doc=')
+    for chunk in chunks:
+        yield to_bytes(quote_plus(chunk))
+
+
+def multipart_stream(chunks, fields, name, filename, content_type, boundary):
+    """
+    Stream a `multipart/form-data` body with `fields` followed by a file
+    part made of `chunks`.
+    """
+    yield multipart_fields(fields, boundary) + multipart_file_header(
+        boundary, name, filename, content_type)
+    for chunk in chunks:
+        yield chunk
+    yield b'\r\n' + multipart_end(boundary)
+
+
+def compress_stream(chunks, compression):
+    """
+    Compress an iterator of chunks with `'gzip'` or `'deflate'`.
+    """
+    if compression == 'gzip':
+        compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    elif compression == 'deflate':
+        compressor = zlib.compressobj()
+    else:
+        raise ValueError('Unknown compression {0!r}, expected one of {1}'.format(
+            compression, ', '.join(COMPRESSIONS)))
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def document_stream(document, fields, body_format='form', compression=None,
+    chunk_size=DEFAULT_CHUNK_SIZE, boundary=None):
+    """
+    Like `document_body`, but for a streamable `document` (see
+    `is_streamable`). The body returned is an iterator of byte chunks, which
+    transports send with chunked transfer encoding.
+
+    :param document: path object, file-like object or buffer.
+    :param fields: other fields to send along, e.g. `max_pages`.
+    :param body_format: one of `BODY_FORMATS`.
+    :param compression (optional): one of `COMPRESSIONS`.
+    :param chunk_size: size of the chunks `document` is read in.
+    :param boundary (optional): multipart boundary, random by default.
+    """
+    query_params = {}
+    if body_format not in BODY_FORMATS:
+        raise ValueError('Unknown body format {0!r}, expected one of {1}'.format(
+            body_format, ', '.join(BODY_FORMATS)))
+    if compression is not None and compression not in COMPRESSIONS:
+        raise ValueError('Unknown compression {0!r}, expected one of {1}'.format(
+            compression, ', '.join(COMPRESSIONS)))
+    chunks = iter_document(document, chunk_size)
+    if body_format == 'form':
+        body, content_type = form_stream(chunks, fields), FORM_CONTENT_TYPE
+    elif body_format == 'raw':
+        body, content_type = chunks, HTML_CONTENT_TYPE
+        query_params = fields
+    else:
+        boundary = boundary or uuid.uuid4().hex
+        body = multipart_stream(chunks, fields, 'doc', 'doc.html', HTML_CONTENT_TYPE, boundary)
+        content_type = multipart_content_type(boundary)
+    headers = {'Content-Type': content_type}
+    if compression is not None:
+        body = compress_stream(body, compression)
+        headers['Content-Encoding'] = compression
+    return body, headers, query_params
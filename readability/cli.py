@@ -0,0 +1,312 @@
+# -*- coding: utf-8 -*-
+
+"""
+readability.cli
+~~~~~~~~~~~~~~~
+
+This module provides the `readability` command line tool.
+
+`readability export` writes a user's bookmarks, and optionally the full
+articles, to gzip-compressed JSON Lines:
+
+    readability export bookmarks.jsonl.gz --articles --concurrency 16
+
+Pages of bookmarks and their articles are fetched in parallel, a bounded
+number of pages ahead of the one being written, so memory use does not
+grow with the size of the library. Bookmarks are exported oldest first.
+Every page is written as its own gzip member followed by a checkpoint of
+the last bookmark written; an interrupted export started again with the
+same arguments resumes with the bookmarks added after it, so bookmarks
+added or deleted in the meantime neither shift pages nor cause skips.
+
+"""
+
+from __future__ import print_function
+
+import argparse
+import gzip
+import json
+import logging
+import os
+import sys
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from readability.auth import xauth
+from readability.clients import DEFAULT_READER_URL_TEMPLATE, ReaderClient
+from readability.transports import TRANSPORTS
+from readability.utils import write_json_atomic
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_VERSION = 2
+
+
+class ExportError(Exception):
+    """
+    The export could not be completed or resumed.
+    """
+
+
+def bookmark_position(record):
+    """
+    Where a bookmark comes in an export: its date added, then its id.
+    """
+    return (record.get('date_added') or '', record['id'])
+
+
+class BookmarkExporter(object):
+    """
+    Export the bookmarks of a `ReaderClient`'s user to gzip-compressed JSON
+    Lines, one bookmark per line.
+
+    :param client: `ReaderClient` of the user.
+    :param output: path of the output file.
+    :param checkpoint (optional): path of the checkpoint file. Defaults to
+        the output path with a `.checkpoint` suffix.
+    :param articles: replace the article summary of every bookmark by the
+        full article from `ReaderClient.get_article`.
+    :param concurrency: number of article requests in flight at once.
+    :param per_page: bookmarks per page, at most 50.
+    :param lookahead: number of pages fetched ahead of the one being
+        written. Bounds memory use to about `lookahead` pages.
+    :param filters (optional): dict of `ReaderClient.get_bookmarks` filters,
+        other than `order`.
+    """
+    def __init__(self, client, output, checkpoint=None, articles=False,
+        concurrency=8, per_page=50, lookahead=2, filters=None):
+        self.client = client
+        self.output = output
+        self.checkpoint = checkpoint or output + '.checkpoint'
+        self.articles = articles
+        self.concurrency = concurrency
+        self.per_page = per_page
+        self.lookahead = max(lookahead, 1)
+        self.filters = dict(filters or {})
+        if self.filters.pop('order', 'date_added') != 'date_added':
+            raise ExportError('Bookmarks are exported in date_added order.')
+        self.stats = {'pages': 0, 'bookmarks': 0, 'articles': 0, 'article_errors': 0}
+
+    def settings(self):
+        """
+        What an export has to match to be resumed from a checkpoint.
+        """
+        return {
+            'articles': self.articles,
+            'filters': self.filters,
+            'per_page': self.per_page,
+        }
+
+    def load_checkpoint(self):
+        if not os.path.exists(self.checkpoint):
+            return None
+        with open(self.checkpoint) as checkpoint_file:
+            state = json.load(checkpoint_file)
+        if state.get('version') != CHECKPOINT_VERSION:
+            raise ExportError('Unsupported checkpoint version {0!r}'.format(state.get('version')))
+        if state['settings'] != json.loads(json.dumps(self.settings())):
+            raise ExportError('{0} was written by an export with different settings; '
+                'remove it to start over'.format(self.checkpoint))
+        if not os.path.exists(self.output) or os.path.getsize(self.output) < state['offset']:
+            raise ExportError('{0} is missing or shorter than its checkpoint'.format(self.output))
+        return state
+
+    def save_checkpoint(self, last, offset, complete=False):
+        write_json_atomic(self.checkpoint, {
+            'version': CHECKPOINT_VERSION,
+            'settings': self.settings(),
+            'last': last,
+            'offset': offset,
+            'complete': complete,
+        })
+
+    def fetch_page(self, page, article_executor, filters, after=None):
+        """
+        Fetch a page of bookmarks and, if wanted, their articles. Returns
+        the page's `meta` and its records.
+
+        :param after (optional): `bookmark_position` of the last bookmark
+            written. Bookmarks up to it are left out.
+        """
+        response = self.client.get_bookmarks(page=page, per_page=self.per_page, **filters)
+        if response.status_code != 200:
+            raise ExportError('Fetching page {0} of bookmarks answered {1}'.format(
+                page, response.status_code))
+        data = response.json()
+        records = data.get('bookmarks') or []
+        if after is not None:
+            records = [record for record in records if bookmark_position(record) > after]
+        if self.articles:
+            records = [future.result() for future in
+                [article_executor.submit(self.fetch_article, record) for record in records]]
+        return data.get('meta') or {}, records
+
+    def fetch_article(self, record):
+        record = dict(record)
+        article_id = (record.get('article') or {}).get('id')
+        if article_id is None:
+            return record
+        response = self.client.get_article(article_id)
+        if response.status_code == 200:
+            record['article'] = response.json()
+        else:
+            record['article_error'] = response.status_code
+        return record
+
+    def write_page(self, out, records):
+        # Each page is a complete gzip member: the file stays a valid gzip
+        # stream after every page, which is what makes resuming possible.
+        member = gzip.GzipFile(fileobj=out, mode='wb', mtime=0)
+        try:
+            for record in records:
+                member.write(json.dumps(record, sort_keys=True).encode('utf-8'))
+                member.write(b'\n')
+        finally:
+            member.close()
+        out.flush()
+        os.fsync(out.fileno())
+        return out.tell()
+
+    def run(self):
+        """
+        Run or resume the export. Returns a dict of counts for this run.
+        """
+        state = self.load_checkpoint()
+        if state is not None and state['complete']:
+            logger.info('%s is already complete', self.output)
+            return self.stats
+        filters = dict(self.filters, order='date_added')
+        last = None
+        if state is None:
+            out = open(self.output, 'wb')
+        else:
+            out = open(self.output, 'r+b')
+            out.truncate(state['offset'])
+            out.seek(state['offset'])
+            if state['last'] is not None:
+                last = tuple(state['last'])
+                # Bookmarks written all satisfy any added_since filter.
+                filters['added_since'] = last[0]
+                logger.info('Resuming export to %s after bookmark %s', self.output, last[1])
+
+        page_executor = ThreadPoolExecutor(max_workers=self.lookahead)
+        article_executor = ThreadPoolExecutor(max_workers=self.concurrency)
+        try:
+            num_pages = None
+            pending = deque()
+            next_page = 1
+            while True:
+                while len(pending) < self.lookahead and (num_pages is None and not pending
+                        or num_pages is not None and next_page <= num_pages):
+                    pending.append(page_executor.submit(self.fetch_page, next_page,
+                        article_executor, filters, last))
+                    next_page += 1
+                if not pending:
+                    break
+                meta, records = pending.popleft().result()
+                num_pages = max(int(meta.get('num_pages') or 1), 1)
+                offset = self.write_page(out, records)
+                if records:
+                    last = bookmark_position(records[-1])
+                self.stats['pages'] += 1
+                self.stats['bookmarks'] += len(records)
+                if self.articles:
+                    errors = sum(1 for record in records if 'article_error' in record)
+                    self.stats['article_errors'] += errors
+                    self.stats['articles'] += len(records) - errors
+                self.save_checkpoint(last, offset)
+            self.save_checkpoint(last, out.tell(), complete=True)
+        finally:
+            for future in pending:
+                future.cancel()
+            page_executor.shutdown(wait=True)
+            article_executor.shutdown(wait=True)
+            out.close()
+        return self.stats
+
+
+def parse_filters(values):
+    filters = {}
+    for value in values or []:
+        name, separator, filter_value = value.partition('=')
+        if not separator:
+            raise argparse.ArgumentTypeError('Filters are given as name=value, got {0!r}'.format(value))
+        filters[name] = filter_value
+    return filters
+
+
+def reader_client(args):
+    """
+    Build a `ReaderClient` from command line arguments, exchanging a
+    username and password for a token if no token was given.
+    """
+    kwargs = {'base_url_template': args.base_url_template, 'transport': args.transport}
+    if args.consumer_key:
+        kwargs['consumer_key'] = args.consumer_key
+    if args.consumer_secret:
+        kwargs['consumer_secret'] = args.consumer_secret
+    token_key, token_secret = args.token_key, args.token_secret
+    if not (token_key and token_secret):
+        if not (args.username and args.password):
+            raise ExportError('Either a token or a username and password are required.')
+        token_key, token_secret = xauth(username=args.username, password=args.password, **kwargs)
+    return ReaderClient(token_key, token_secret, **kwargs)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='readability',
+        description='Command line tools for the Readability APIs.')
+    subparsers = parser.add_subparsers(dest='command')
+
+    export_parser = subparsers.add_parser('export',
+        help="export a user's bookmarks to gzip-compressed JSON Lines")
+    export_parser.add_argument('output', help='output file, e.g. bookmarks.jsonl.gz')
+    export_parser.add_argument('--checkpoint',
+        help='checkpoint file, defaults to the output file with a .checkpoint suffix')
+    export_parser.add_argument('--articles', action='store_true',
+        help='include the full articles')
+    export_parser.add_argument('-c', '--concurrency', type=int, default=8,
+        help='article requests in flight at once')
+    export_parser.add_argument('--per-page', type=int, default=50)
+    export_parser.add_argument('--filter', action='append', dest='filters', metavar='NAME=VALUE',
+        help='bookmark filter, e.g. archive=1; may be repeated')
+    export_parser.add_argument('--restart', action='store_true',
+        help='ignore an existing checkpoint and start over')
+    export_parser.add_argument('--token-key', default=os.environ.get('READABILITY_TOKEN_KEY'))
+    export_parser.add_argument('--token-secret', default=os.environ.get('READABILITY_TOKEN_SECRET'))
+    export_parser.add_argument('--username', default=os.environ.get('READABILITY_USERNAME'))
+    export_parser.add_argument('--password', default=os.environ.get('READABILITY_PASSWORD'))
+    export_parser.add_argument('--consumer-key', help='defaults to READABILITY_CONSUMER_KEY')
+    export_parser.add_argument('--consumer-secret', help='defaults to READABILITY_CONSUMER_SECRET')
+    export_parser.add_argument('--base-url-template', default=DEFAULT_READER_URL_TEMPLATE,
+        help='Reader API url template, for testing environments')
+    export_parser.add_argument('--transport', default='requests', choices=sorted(TRANSPORTS),
+        help='transport used to send requests')
+
+    args = parser.parse_args(argv)
+    if args.command != 'export':
+        parser.print_help()
+        return 2
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    try:
+        filters = parse_filters(args.filters)
+        exporter = BookmarkExporter(reader_client(args), args.output,
+            checkpoint=args.checkpoint,
+            articles=args.articles,
+            concurrency=args.concurrency,
+            per_page=args.per_page,
+            filters=filters)
+        if args.restart and os.path.exists(exporter.checkpoint):
+            os.remove(exporter.checkpoint)
+        stats = exporter.run()
+    except (ExportError, argparse.ArgumentTypeError) as e:
+        print('readability export: {0}'.format(e), file=sys.stderr)
+        return 1
+    print('Exported {bookmarks} bookmarks in {pages} pages ({articles} articles, '
+        '{article_errors} article errors) to {output}'.format(output=args.output, **stats))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -9,19 +9,29 @@ This module provies a client for the Reader API.
 """
 
 import logging
+import os
+import threading
 
 try:
     from urllib.parse import urlencode
 except ImportError:
     from urllib import urlencode
 
-import requests
-
-from requests_oauthlib import OAuth1Session
-
-from readability.core import required_from_env
+from readability.bodies import (ACCEPT_ENCODING, DEFAULT_CHUNK_SIZE, FORM_CONTENT_TYPE,
+    document_body, document_stream, is_streamable)
+from readability.core import lazy_import, required_from_env
+from readability.histograms import LatencyHistograms
+from readability.instrumentation import (ByteCounter, RequestEvent, body_size, call_hooks,
+    route_for, timer)
+from readability.spooling import DEFAULT_SPOOL_THRESHOLD, SpoolingTransport
+from readability.transports import make_transport
 from readability.utils import filter_args_to_dict
 
+# oAuth dependencies are only imported on first use to keep
+# `import readability` cheap.
+oauth1 = lazy_import('oauthlib.oauth1')
+requests_oauthlib = lazy_import('requests_oauthlib')
+
 logger = logging.getLogger(__name__)
 DEFAULT_READER_URL_TEMPLATE = 'https://www.readability.com/api/rest/v1/{}'
 DEFAULT_PARSER_URL_TEMPLATE = 'https://www.readability.com/api/content/v1/{}'
@@ -36,6 +46,7 @@ ACCEPTED_BOOKMARK_FILTERS = [
     'only_deleted',
     'opened_since',
     'opened_until',
+    'order',
     'page',
     'per_page',
     'tags',
@@ -45,12 +56,215 @@ ACCEPTED_BOOKMARK_FILTERS = [
 
 
 
-class ReaderClient(object):
+class BaseClient(object):
+    """
+    Request plumbing shared by `ReaderClient` and `ParserClient`.
+
+    Subclasses implement `_send`, which puts the finishing touches on a
+    request (e.g. signing it) and hands it to the transport.
+
+    Clients are pickled by configuration, e.g. to be handed to the workers
+    of a `ProcessPoolExecutor`: credentials, url template, transport
+    settings and hooks are kept, while connections and latency histograms
+    are set up afresh in the process the client is unpickled in. A client
+    inherited by a forked process opens connections of its own too.
+    """
+    #: Name of the client in `RequestEvent`s.
+    client_name = None
+
+    def _configure(self, xargs):
+        """
+        Set up the transport and hooks from constructor keyword arguments.
+        """
+        self._reset()
+        self.transport = make_transport(xargs.get('transport'))
+        if xargs.get('spool_threshold') is not None or xargs.get('memory_budget') is not None:
+            self.transport = SpoolingTransport(self.transport,
+                threshold=xargs.get('spool_threshold') or DEFAULT_SPOOL_THRESHOLD,
+                budget=xargs.get('memory_budget'))
+        self.hooks = list(xargs.get('hooks') or [])
+        self.scheduler = xargs.get('scheduler')
+        self.priority = xargs.get('priority')
+        if self.scheduler is not None and self.priority is not None:
+            self.scheduler._check(self.priority)
+        self.hedging = xargs.get('hedging')
+        #: Per method, route and status `LatencyHistograms` of every request
+        #: made, or None when disabled with `latency_histograms=False`.
+        self.latency = None
+        if xargs.get('latency_histograms', True):
+            self.latency = LatencyHistograms()
+
+    def _reset(self):
+        """
+        Set up the state tied to the current process.
+        """
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def _check_process(self):
+        """
+        `_reset` the client if it is used in a process other than the one it
+        was set up in, i.e. after a fork.
+        """
+        if self._pid != os.getpid():
+            self._reset()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        for name in ('_pid', '_lock', '_local'):
+            del state[name]
+        state['latency'] = self.latency is not None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.latency = LatencyHistograms() if state['latency'] else None
+        self._reset()
+
+    def add_hook(self, hook):
+        """
+        Register a hook called with a `RequestEvent` around every request.
+
+        :param hook: see `readability.instrumentation`.
+        """
+        # The list is replaced rather than changed in place, so requests in
+        # flight in other threads keep iterating over a consistent list.
+        self._check_process()
+        with self._lock:
+            self.hooks = self.hooks + [hook]
+
+    def remove_hook(self, hook):
+        self._check_process()
+        with self._lock:
+            hooks = list(self.hooks)
+            hooks.remove(hook)
+            self.hooks = hooks
+
+    def warmup(self, connections=4, fetch=False):
+        """
+        Open pooled connections to the API host ahead of the first requests,
+        all at once, so that those requests don't pay for DNS, TCP and TLS
+        setup one after the other. Returns the number of connections opened.
+
+        :param connections: number of connections to have open, at most the
+            size of the transport's pool. Connections already open count.
+        :param fetch: also request a cheap resource, checking the
+            credentials and warming up the server side. Raises
+            `requests.HTTPError` if it fails.
+        """
+        opened = self.transport.warmup(self.base_url_template.format(''), connections)
+        logger.debug('Opened %d connections to %s', opened, self.base_url_template.format(''))
+        if fetch:
+            self._warmup_request().raise_for_status()
+        return opened
+
+    def _warmup_request(self):
+        raise NotImplementedError
+
+    def _endpoint(self, url):
+        """
+        The resource `url` was generated for, without its query string.
+        """
+        prefix = self.base_url_template.format('')
+        if url.startswith(prefix):
+            url = url[len(prefix):]
+        return url.split('?', 1)[0]
+
+    def _send(self, method, url, data=None, headers=None):
+        raise NotImplementedError
+
+    def _request(self, method, url, data=None, headers=None):
+        """
+        Send a request, recording its latency and emitting a `RequestEvent`
+        to the client's hooks.
+
+        With a scheduler, the request first waits for a slot; the time it
+        waited is not part of its latency.
+        """
+        scheduler = self.scheduler
+        if scheduler is None:
+            return self._instrumented_request(method, url, data=data, headers=headers)
+        with scheduler.slot(self.priority):
+            return self._instrumented_request(method, url, data=data, headers=headers)
+
+    def _read(self, send, url, method='GET'):
+        """
+        Make an idempotent request with `send(url)`, hedged when the client
+        has a hedging policy.
+
+        :param method: HTTP method `send` uses, picking the latency
+            histogram hedges are timed from.
+        """
+        hedging = self.hedging
+        if hedging is None:
+            return send(url)
+        histogram = None
+        if self.latency is not None:
+            histogram = self.latency.histogram(self.client_name, method,
+                route_for(self._endpoint(url)), 200)
+        scheduler = self.scheduler
+        if scheduler is None:
+            return hedging.call(lambda: send(url), histogram)
+        # Attempts are sent from other threads: carry the priority
+        # of the calling thread over.
+        priority = scheduler.current_priority(self.priority)
+
+        def prioritized():
+            with scheduler.priority(priority):
+                return send(url)
+        return hedging.call(prioritized, histogram)
+
+    def _instrumented_request(self, method, url, data=None, headers=None):
+        # Always ask for compressed responses, whichever transport is used.
+        headers = dict(headers or {})
+        headers.setdefault('Accept-Encoding', ACCEPT_ENCODING)
+        hooks = self.hooks
+        latency = self.latency
+        if not hooks and latency is None:
+            return self._send(method, url, data=data, headers=headers)
+
+        event = RequestEvent(self.client_name, method, self._endpoint(url))
+        event.bytes_sent = body_size(data)
+        counter = None
+        if event.bytes_sent is None:
+            # Streamed body, counted as the transport consumes it.
+            data = counter = ByteCounter(data)
+        call_hooks(hooks, event, before=True)
+        start = timer()
+        try:
+            response = self._send(method, url, data=data, headers=headers)
+        except Exception as e:
+            event.error = e
+            event.total_time = timer() - start
+            if counter is not None:
+                event.bytes_sent = counter.count
+            self._finish_event(event)
+            raise
+        event.finish(response, timer() - start)
+        if counter is not None:
+            event.bytes_sent = counter.count
+        self._finish_event(event)
+        return response
+
+    def _finish_event(self, event):
+        if self.latency is not None:
+            self.latency(event)
+        call_hooks(self.hooks, event)
+
+
+class ReaderClient(BaseClient):
     """
     Client for interacting with the Readability Reader API.
 
     Docs can be found at `http://www.readability.com/developers/api/reader`.
+
+    A client can be shared by many threads. Requests are built and signed
+    without shared state, and the default transport gives every thread its
+    own session over one bounded connection pool.
     """
+    client_name = 'reader'
+
     def __init__(self, token_key, token_secret,
         base_url_template=DEFAULT_READER_URL_TEMPLATE, **xargs):
         """
@@ -64,22 +278,85 @@ class ReaderClient(object):
             which requests will be sent. This shouldn't need to be passed as the
             main purpose for it is testing environments that the user probably
             doesn't have access to (staging, local dev, etc).
+        :param transport (optional): `readability.transports` transport, or
+            the name of one, used to send requests. Defaults to a
+            `RequestsTransport`.
+        :param hooks (optional): list of hooks called around every request,
+            see `readability.instrumentation`.
+        :param latency_histograms (optional): record per method, route and
+            status latency histograms in `latency`. Defaults to True.
+        :param spool_threshold (optional): response bodies larger than this
+            many bytes are spooled to a temporary file and returned as a
+            `readability.spooling.SpooledResponse`.
+        :param memory_budget (optional): `readability.spooling.MemoryBudget`,
+            or a number of bytes, capping the memory held by response bodies
+            being read; bodies that do not fit are spooled too.
+        :param scheduler (optional): `readability.scheduling.RequestScheduler`
+            limiting the requests in flight, shared with other clients.
+        :param priority (optional): priority class of the client's requests
+            in the scheduler, e.g. `readability.scheduling.BULK`.
+        :param hedging (optional): `readability.hedging.HedgingPolicy` for
+            slow reads of articles, bookmarks and their status.
 
         """
         consumer_key = xargs.get('consumer_key') or required_from_env('READABILITY_CONSUMER_KEY')
         consumer_secret = xargs.get('consumer_secret') or required_from_env('READABILITY_CONSUMER_SECRET')
 
         self.base_url_template = base_url_template
-        self.oauth_session = OAuth1Session(consumer_key, consumer_secret, token_key, token_secret)
+        self.consumer_key = consumer_key
+        self.consumer_secret = consumer_secret
+        self.token_key = token_key
+        self.token_secret = token_secret
+        self._configure(xargs)
 
-    def get(self, url):
+    def _reset(self):
+        super(ReaderClient, self)._reset()
+        # Requests are signed here rather than by the transport so that
+        # signing cost is part of the client no matter how requests are sent.
+        self.oauth_client = oauth1.Client(self.consumer_key,
+            client_secret=self.consumer_secret,
+            resource_owner_key=self.token_key,
+            resource_owner_secret=self.token_secret)
+
+    def __getstate__(self):
+        state = super(ReaderClient, self).__getstate__()
+        del state['oauth_client']
+        return state
+
+    @property
+    def oauth_session(self):
+        """
+        A `requests_oauthlib.OAuth1Session` for the client's credentials,
+        one per thread.
+
+        The client itself no longer sends requests through it; it is kept for
+        code that used it directly.
+        """
+        self._check_process()
+        session = getattr(self._local, 'oauth_session', None)
+        if session is None:
+            session = self._local.oauth_session = requests_oauthlib.OAuth1Session(
+                self.consumer_key, self.consumer_secret,
+                self.token_key, self.token_secret)
+        return session
+
+    def _send(self, method, url, data=None, headers=None):
+        """
+        Sign a request and send it through the transport.
+        """
+        uri, headers, body = self.oauth_client.sign(url,
+            http_method=method, body=data, headers=headers)
+        return self.transport.request(method, uri, data=body, headers=headers)
+
+    def get(self, url, headers=None):
         """
         Make a HTTP GET request to the Reader API.
 
         :param url: url to which to make a GET request.
+        :param headers (optional): extra request headers.
         """
         logger.debug('Making GET request to %s', url)
-        return self.oauth_session.get(url)
+        return self._request('GET', url, headers=headers)
 
     def post(self, url, post_params=None):
         """
@@ -90,7 +367,8 @@ class ReaderClient(object):
         """
         params = urlencode(post_params)
         logger.debug('Making POST request to %s with body %s', url, params)
-        return self.oauth_session.post(url, data=params)
+        return self._request('POST', url, data=params,
+            headers={'Content-Type': FORM_CONTENT_TYPE})
 
     def delete(self, url):
         """
@@ -99,7 +377,7 @@ class ReaderClient(object):
         :param url: The url to which to send a DELETE request.
         """
         logger.debug('Making DELETE request to %s', url)
-        return self.oauth_session.delete(url)
+        return self._request('DELETE', url)
 
     def _generate_url(self, resource, query_params=None):
         """
@@ -123,12 +401,15 @@ class ReaderClient(object):
         :param article_id: ID of the article to retrieve.
         """
         url = self._generate_url('articles/{0}'.format(article_id))
-        return self.get(url)
+        return self._read(self.get, url)
 
-    def get_bookmarks(self, **filters):
+    def get_bookmarks(self, headers=None, **filters):
         """
         Get Bookmarks for the current user.
 
+        :param headers (optional): extra request headers, e.g. an
+            `If-None-Match` header to only get changed results.
+
         Filters:
 
         :param archive: Filter Bookmarks returned by archived status.
@@ -146,10 +427,13 @@ class ReaderClient(object):
         :param per_page: How many results to return per page. Default is 20, max is 50.
         :param only_deleted: Return only bookmarks that this user has deleted.
         :param tags: Comma separated string of tags to filter bookmarks.
+        :param order: Order of the results, one of `date_added` and
+            `date_updated`, with a `-` prefix for descending order. Default is
+            `-date_added`.
         """
         filter_dict = filter_args_to_dict(filters, ACCEPTED_BOOKMARK_FILTERS)
         url = self._generate_url('bookmarks', query_params=filter_dict)
-        return self.get(url)
+        return self.get(url, headers=headers)
 
     def get_bookmark(self, bookmark_id):
         """
@@ -160,7 +444,7 @@ class ReaderClient(object):
         :param bookmark_id: ID of the bookmark to retrieve.
         """
         url = self._generate_url('bookmarks/{0}'.format(bookmark_id))
-        return self.get(url)
+        return self._read(self.get, url)
 
     def add_bookmark(self, url, favorite=False, archive=False, allow_duplicates=True):
         """
@@ -181,6 +465,31 @@ class ReaderClient(object):
         }
         return self.post(rdb_url, params)
 
+    def add_bookmarks(self, urls, seen=None, **kwargs):
+        """
+        Bookmark several urls, skipping those already in `seen` without
+        making any request.
+
+        Returns a list of `(url, response)` tuples, where `response` is None
+        for the skipped urls. Urls bookmarked successfully, or rejected as
+        duplicates, are added to `seen`.
+
+        :param urls: urls of the articles to bookmark.
+        :param seen (optional): a `readability.urls.SeenIndex`, or any set
+            like object with `add` and `in` support.
+        :param kwargs: passed to `add_bookmark`.
+        """
+        results = []
+        for url in urls:
+            if seen is not None and url in seen:
+                results.append((url, None))
+                continue
+            response = self.add_bookmark(url, **kwargs)
+            if seen is not None and response.status_code in (200, 201, 202, 409):
+                seen.add(url)
+            results.append((url, response))
+        return results
+
     def update_bookmark(self, bookmark_id, favorite=None, archive=None, read_percent=None):
         """
         Updates given bookmark. The requested bookmark must belong to the
@@ -306,13 +615,22 @@ class ReaderClient(object):
         url = self._generate_url('users/_current')
         return self.get(url)
 
+    def _warmup_request(self):
+        return self.get_user()
+
 
-class ParserClient(object):
+class ParserClient(BaseClient):
     """
     Client for interacting with the Readability Parser API.
 
     Docs can be found at `http://www.readability.com/developers/api/parser`.
+
+    A client can be shared by many threads. Requests are built and signed
+    without shared state, and the default transport gives every thread its
+    own session over one bounded connection pool.
     """
+    client_name = 'parser'
+
     def __init__(self, base_url_template=DEFAULT_PARSER_URL_TEMPLATE, **xargs):
         """
         Initialize client.
@@ -322,12 +640,38 @@ class ParserClient(object):
             which requests will be sent. This shouldn't need to be passed as the
             main purpose for it is testing environments that the user probably
             doesn't have access to (staging, local dev, etc).
+        :param transport (optional): `readability.transports` transport, or
+            the name of one, used to send requests. Defaults to a
+            `RequestsTransport`.
+        :param hooks (optional): list of hooks called around every request,
+            see `readability.instrumentation`.
+        :param latency_histograms (optional): record per method, route and
+            status latency histograms in `latency`. Defaults to True.
+        :param spool_threshold (optional): response bodies larger than this
+            many bytes are spooled to a temporary file and returned as a
+            `readability.spooling.SpooledResponse`.
+        :param memory_budget (optional): `readability.spooling.MemoryBudget`,
+            or a number of bytes, capping the memory held by response bodies
+            being read; bodies that do not fit are spooled too.
+        :param scheduler (optional): `readability.scheduling.RequestScheduler`
+            limiting the requests in flight, shared with other clients.
+        :param priority (optional): priority class of the client's requests
+            in the scheduler, e.g. `readability.scheduling.BULK`.
+        :param hedging (optional): `readability.hedging.HedgingPolicy` for
+            slow reads of articles, bookmarks and their status.
         """
         logger.debug('Initializing ParserClient with base url template %s',
             base_url_template)
 
         self.token = xargs.get('token', None) or required_from_env('READABILITY_PARSER_TOKEN')
         self.base_url_template = base_url_template
+        self._configure(xargs)
+
+    def _send(self, method, url, data=None, headers=None):
+        """
+        Send a request through the transport.
+        """
+        return self.transport.request(method, url, data=data, headers=headers)
 
     def get(self, url):
         """
@@ -336,7 +680,7 @@ class ParserClient(object):
         :param url: url to which to make the request
         """
         logger.debug('Making GET request to %s', url)
-        return requests.get(url)
+        return self._request('GET', url)
 
     def head(self, url):
         """
@@ -345,7 +689,7 @@ class ParserClient(object):
         :param url: url to which to make the request
         """
         logger.debug('Making HEAD request to %s', url)
-        return requests.head(url)
+        return self._request('HEAD', url)
 
     def post(self, url, post_params=None):
         """
@@ -354,10 +698,12 @@ class ParserClient(object):
         :param url: url to which to make the request
         :param post_params: POST data to send along. Expected to be a dict.
         """
+        post_params = dict(post_params or {})
         post_params['token'] = self.token
         params = urlencode(post_params)
-        logger.debug('Making POST request to %s with body %s', url, params)
-        return requests.post(url, data=params)
+        logger.debug('Making POST request to %s with a body of %d bytes', url, len(params))
+        return self._request('POST', url, data=params,
+            headers={'Content-Type': FORM_CONTENT_TYPE})
 
     def _generate_url(self, resource, query_params=None):
         """
@@ -379,6 +725,9 @@ class ParserClient(object):
         url = self._generate_url('')
         return self.get(url)
 
+    def _warmup_request(self):
+        return self.get_root()
+
     def get_article(self, url=None, article_id=None, max_pages=25):
         """
         Send a GET request to the `parser` endpoint of the parser API to get
@@ -402,25 +751,71 @@ class ParserClient(object):
             query_params['article_id'] = article_id
         query_params['max_pages'] = max_pages
         url = self._generate_url('parser', query_params=query_params)
-        return self.get(url)
+        return self._read(self.get, url)
 
-    def post_article_content(self, content, url, max_pages=25):
+    def post_article_content(self, content, url, max_pages=25,
+        body_format='form', compression=None, chunk_size=DEFAULT_CHUNK_SIZE):
         """
         POST content to be parsed to the Parser API.
 
         Note: Even when POSTing content, a url must still be provided.
 
-        :param content: the content to be parsed
+        :param content: the content to be parsed. Either the document itself,
+            as text or bytes, or a path object, file-like object or buffer
+            (e.g. an `mmap.mmap`) it is streamed from in chunks, see
+            `readability.bodies.is_streamable`.
         :param url: the url that represents the content
         :param max_pages (optional): the maximum number of pages to parse
             and combine. Default is 25.
+        :param body_format (optional): how the content is sent, see
+            `readability.bodies`. `'form'` (the default) percent-encodes it
+            into a form body, `'raw'` sends it as the `text/html` body and
+            `'multipart'` as a file part, neither of which inflate it.
+        :param compression (optional): `'gzip'` or `'deflate'` to compress
+            the request body. The server has to support the chosen
+            `body_format` and `compression`.
+        :param chunk_size (optional): size of the chunks streamed content
+            is read and sent in.
+        """
+        fields = {'max_pages': max_pages, 'token': self.token}
+        if is_streamable(content):
+            body, headers, query_params = document_stream(content, fields,
+                body_format=body_format, compression=compression, chunk_size=chunk_size)
+            url = self._post_article_url(url, query_params)
+            logger.debug('Making POST request to %s with a streamed %s body', url, body_format)
+            return self._request('POST', url, data=body, headers=headers)
+
+        if body_format == 'form' and compression is None:
+            params = {
+                'doc': content,
+                'max_pages': max_pages
+            }
+            url = self._generate_url('parser', {"url": url})
+            return self.post(url, post_params=params)
+
+        body, headers, query_params = document_body(content, fields,
+            body_format=body_format, compression=compression)
+        url = self._post_article_url(url, query_params)
+        logger.debug('Making POST request to %s with a %s body of %d bytes',
+            url, body_format, len(body))
+        return self._request('POST', url, data=body, headers=headers)
+
+    def post_article_file(self, path, url, **kwargs):
+        """
+        POST the document stored at `path` to be parsed, streaming it from
+        disk. Takes the same keyword arguments as `post_article_content`.
+
+        :param path: path of the document.
+        :param url: the url that represents the content
         """
-        params = {
-            'doc': content,
-            'max_pages': max_pages
-        }
-        url = self._generate_url('parser', {"url": url})
-        return self.post(url, post_params=params)
+        with open(path, 'rb') as document_file:
+            return self.post_article_content(document_file, url, **kwargs)
+
+    def _post_article_url(self, url, query_params):
+        query_params = dict(query_params, url=url)
+        # `_generate_url` adds the token to the query string itself.
+        query_params.pop('token', None)
+        return self._generate_url('parser', query_params)
 
     def get_article_status(self, url=None, article_id=None):
         """
@@ -443,7 +838,7 @@ class ParserClient(object):
         if article_id is not None:
             query_params['article_id'] = article_id
         url = self._generate_url('parser', query_params=query_params)
-        return self.head(url)
+        return self._read(self.head, url, 'HEAD')
 
     def get_confidence(self, url=None, article_id=None):
         """
@@ -461,4 +856,4 @@ class ParserClient(object):
         if article_id is not None:
             query_params['article_id'] = article_id
         url = self._generate_url('confidence', query_params=query_params)
-        return self.get(url)
+        return self._read(self.get, url)
@@ -0,0 +1,238 @@
+# -*- coding: utf-8 -*-
+
+"""
+readability.coalescing
+~~~~~~~~~~~~~~~~~~~~~~
+
+This module provides a writer that coalesces bookmark updates.
+
+Reading apps report progress on every scroll, but only the latest read
+progress of a bookmark matters. `CoalescingWriter` keeps the latest
+`read_percent`, `favorite` and `archive` of every bookmark and sends one
+merged `ReaderClient.update_bookmark` per bookmark per interval, from a
+background thread:
+
+    with CoalescingWriter(client, interval=5) as writer:
+        for percent in scroll_positions:
+            writer.set_read_percent_of_bookmark(bookmark_id, percent)
+
+Pending updates are written when the interval expires, on `flush`, on
+`close` and, for writers never closed, when the interpreter exits.
+
+"""
+
+import atexit
+import logging
+import threading
+import time
+import weakref
+
+from collections import Counter
+
+logger = logging.getLogger(__name__)
+
+
+class CoalescingWriter(object):
+    """
+    Coalesces the bookmark updates of a `ReaderClient` and writes them on an
+    interval.
+
+    :param client: `ReaderClient` used for the writes.
+    :param interval: seconds an update waits for later updates to the same
+        bookmark before it is written.
+    :param max_pending (optional): number of bookmarks with pending updates
+        that triggers a write before the interval expires.
+    :param max_attempts: attempts at writing an update before it is dropped,
+        for errors that may be transient: exceptions raised by the client
+        and 429 or 5xx responses. Other errors drop the update at once.
+    :param on_error (optional): called with the bookmark id, the update and
+        the response or exception of a dropped update.
+    """
+    #: Seconds before retrying failed writes on `close`, doubled after every
+    #: attempt up to `interval`.
+    CLOSE_BACKOFF = 0.1
+
+    def __init__(self, client, interval=5.0, max_pending=None, max_attempts=3, on_error=None):
+        self.client = client
+        self.interval = interval
+        self.max_pending = max_pending
+        self.max_attempts = max_attempts
+        self.on_error = on_error
+        #: Counter of `'updates'` received, `'writes'` sent, `'coalesced'`
+        #: updates that did not need a write of their own, `'retries'` and
+        #: `'dropped'` updates.
+        self.stats = Counter()
+        self.condition = threading.Condition()
+        # Serializes writes, so that an update is never overtaken by an
+        # older one for the same bookmark.
+        self.write_lock = threading.Lock()
+        self.updates = {}
+        self.attempts = {}
+        self.writing = 0
+        self.due = None
+        self.thread = None
+        self.closed = False
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def start(self):
+        """
+        Start the background thread. Called on the first update.
+        """
+        with self.condition:
+            if self.closed:
+                raise RuntimeError('CoalescingWriter is closed.')
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, name='CoalescingWriter')
+                self.thread.daemon = True
+                self.thread.start()
+                atexit.register(_close_at_exit, weakref.ref(self))
+        return self
+
+    def update_bookmark(self, bookmark_id, favorite=None, archive=None, read_percent=None):
+        """
+        Queue an update of a bookmark, replacing the values queued for the
+        same fields. Arguments are those of `ReaderClient.update_bookmark`.
+        """
+        update = {}
+        if favorite is not None:
+            update['favorite'] = bool(favorite)
+        if archive is not None:
+            update['archive'] = bool(archive)
+        if read_percent is not None:
+            update['read_percent'] = float(read_percent)
+        if not update:
+            return
+        self.start()
+        with self.condition:
+            if self.closed:
+                raise RuntimeError('CoalescingWriter is closed.')
+            self.stats['updates'] += 1
+            if bookmark_id in self.updates:
+                self.stats['coalesced'] += 1
+                self.updates[bookmark_id].update(update)
+            else:
+                self.updates[bookmark_id] = update
+            if self.due is None:
+                self.due = time.time() + self.interval
+                self.condition.notify()
+            if self.max_pending is not None and len(self.updates) >= self.max_pending:
+                self.due = time.time()
+                self.condition.notify()
+
+    def favorite_bookmark(self, bookmark_id):
+        self.update_bookmark(bookmark_id, favorite=True)
+
+    def archive_bookmark(self, bookmark_id):
+        self.update_bookmark(bookmark_id, archive=True)
+
+    def set_read_percent_of_bookmark(self, bookmark_id, read_percent):
+        self.update_bookmark(bookmark_id, read_percent=read_percent)
+
+    def pending(self):
+        """
+        Number of bookmarks with updates not written yet, including those
+        being written.
+        """
+        with self.condition:
+            return len(self.updates) + self.writing
+
+    def flush(self):
+        """
+        Write all pending updates now. Returns the number of updates that
+        could not be written and are pending again.
+        """
+        with self.write_lock:
+            with self.condition:
+                updates, self.updates = self.updates, {}
+                self.writing = len(updates)
+                self.due = None
+            for bookmark_id, update in updates.items():
+                self._write(bookmark_id, update)
+                with self.condition:
+                    self.writing -= 1
+            with self.condition:
+                if self.updates and self.due is None:
+                    self.due = time.time() + self.interval
+                    self.condition.notify()
+                return len(self.updates)
+
+    def close(self, flush=True):
+        """
+        Stop the background thread, after writing the pending updates
+        unless `flush` is false. Updates that still fail are dropped.
+        """
+        with self.condition:
+            if self.closed:
+                return
+            self.closed = True
+            self.condition.notify_all()
+        if self.thread is not None:
+            self.thread.join()
+        if flush:
+            # Failed writes are retried at most `max_attempts` times, backing
+            # off up to the interval between attempts.
+            delay = min(self.CLOSE_BACKOFF, self.interval)
+            while self.flush():
+                time.sleep(delay)
+                delay = min(delay * 2, self.interval)
+        with self.condition:
+            if self.updates:
+                logger.warning('Dropping pending updates of %d bookmarks', len(self.updates))
+                self.stats['dropped'] += len(self.updates)
+                self.updates = {}
+
+    def _run(self):
+        while True:
+            with self.condition:
+                while not self.closed:
+                    now = time.time()
+                    if self.due is not None and self.due <= now:
+                        break
+                    self.condition.wait(None if self.due is None else self.due - now)
+                if self.closed:
+                    return
+            self.flush()
+
+    def _write(self, bookmark_id, update):
+        try:
+            response = self.client.update_bookmark(bookmark_id, **update)
+        except Exception as e:
+            self._failed(bookmark_id, update, e, retry=True)
+            return
+        self.stats['writes'] += 1
+        if response.status_code == 429 or response.status_code >= 500:
+            self._failed(bookmark_id, update, response, retry=True)
+        elif response.status_code >= 400:
+            self._failed(bookmark_id, update, response, retry=False)
+        else:
+            self.attempts.pop(bookmark_id, None)
+
+    def _failed(self, bookmark_id, update, error, retry):
+        attempts = self.attempts.pop(bookmark_id, 0) + 1
+        if retry and attempts < self.max_attempts:
+            self.stats['retries'] += 1
+            with self.condition:
+                # Values queued since the failed write are newer.
+                update = dict(update, **self.updates.get(bookmark_id, {}))
+                self.updates[bookmark_id] = update
+            self.attempts[bookmark_id] = attempts
+            return
+        logger.warning('Dropping update %r of bookmark %s: %r', update, bookmark_id, error)
+        self.stats['dropped'] += 1
+        if self.on_error is not None:
+            try:
+                self.on_error(bookmark_id, update, error)
+            except Exception:
+                # Don't let the callback stop the background thread.
+                logger.exception('on_error failed for bookmark %s', bookmark_id)
+
+
+def _close_at_exit(ref):
+    writer = ref()
+    if writer is not None:
+        writer.close()
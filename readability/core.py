@@ -1,3 +1,4 @@
+import importlib
 import os
 
 
@@ -13,3 +14,45 @@ def required_from_env(key):
         raise ValueError(
             "Required argument '{}' not supplied and not found in environment variables".format(key))
     return val
+
+
+class LazyModule(object):
+    """
+    Stand-in for a module that is only imported on first attribute access.
+
+    `import readability` should stay cheap, so heavy dependencies like
+    `requests` or `dateutil` are bound to a `LazyModule` at module level and
+    only really imported when something on them is used.
+
+    """
+    def __init__(self, name):
+        self.__dict__['_lazy_name'] = name
+        self.__dict__['_lazy_module'] = None
+
+    def _load(self):
+        module = self.__dict__['_lazy_module']
+        if module is None:
+            module = importlib.import_module(self.__dict__['_lazy_name'])
+            self.__dict__['_lazy_module'] = module
+        return module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __setattr__(self, attr, value):
+        setattr(self._load(), attr, value)
+
+    def __delattr__(self, attr):
+        delattr(self._load(), attr)
+
+    def __repr__(self):
+        return '<lazy module {0!r}>'.format(self.__dict__['_lazy_name'])
+
+
+def lazy_import(name):
+    """
+    Return a `LazyModule` for `name` that imports it on first use.
+
+    :param name: dotted name of the module, e.g. `'dateutil.parser'`.
+    """
+    return LazyModule(name)
@@ -0,0 +1,226 @@
+# -*- coding: utf-8 -*-
+
+"""
+readability.hedging
+~~~~~~~~~~~~~~~~~~~
+
+This module cuts the latency tail of idempotent reads by hedging them.
+
+A client given a `HedgingPolicy` sends `get_article`, `get_bookmark`,
+`get_confidence` and `get_article_status` requests from a thread of their
+own. When a request has not been answered after the latency percentile
+observed for its route, say the p95, a second identical request is sent
+from a small thread pool and the first response to come back is returned:
+
+    client = ParserClient(token='...', hedging=HedgingPolicy(percentile=0.95))
+
+The threshold comes from the client's latency histograms, so hedging only
+starts once a route has been seen `min_samples` times, unless a fixed
+`delay` is given. Hedges are paid for from a budget that grows by `budget`
+for every read and holds at most `burst` hedges, so that at most that
+fraction of extra requests is sent even when the server slows down as a
+whole. Hedges are also skipped rather than queued while every thread of
+the pool is sending one.
+
+A request that is already on the wire cannot be taken back: the response
+that loses the race is closed as soon as it arrives, which returns its
+connection to the pool.
+
+"""
+
+import logging
+import threading
+
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+
+logger = logging.getLogger(__name__)
+
+
+def start_attempt(send):
+    """
+    Future of `send()`, called from a new thread.
+    """
+    future = Future()
+
+    def run():
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            result = send()
+        except Exception as e:
+            future.set_exception(e)
+        else:
+            future.set_result(result)
+
+    thread = threading.Thread(target=run, name='HedgedRead')
+    thread.daemon = True
+    thread.start()
+    return future
+
+
+def close_response(future):
+    """
+    Close the response of a request that lost the race.
+    """
+    if future.cancelled() or future.exception() is not None:
+        return
+    close = getattr(future.result(), 'close', None)
+    if close is not None:
+        close()
+
+
+class HedgingPolicy(object):
+    """
+    When to send a second attempt of a slow read, and how many of them.
+
+    A policy can be shared by several clients, which then share its threads
+    and budget.
+
+    :param percentile: fraction of the latencies of a route a request may
+        take before it is hedged, e.g. `0.95`.
+    :param min_samples: latencies a route must have seen before its
+        percentile is trusted.
+    :param delay (optional): seconds before hedging requests to routes
+        without enough samples. They are not hedged by default.
+    :param min_delay: shortest delay before hedging.
+    :param max_delay (optional): longest delay before hedging.
+    :param budget: hedges earned by every read, i.e. the fraction of extra
+        requests hedging may add.
+    :param burst: most hedges that can be saved up from the budget.
+    :param max_workers: threads sending hedges, i.e. most hedges in flight
+        at once.
+    """
+    def __init__(self, percentile=0.95, min_samples=20, delay=None, min_delay=0.005,
+        max_delay=None, budget=0.05, burst=10, max_workers=8):
+        if not 0 < percentile < 1:
+            raise ValueError('percentile must be between 0 and 1.')
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.delay = delay
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.budget = budget
+        self.burst = burst
+        self.max_workers = max_workers
+        self._reset()
+
+    def _reset(self):
+        #: Counter of `'reads'`, `'hedges'` sent, hedges `'won'` and hedges
+        #: `'denied'` by the budget or because `max_workers` were in flight.
+        self.stats = Counter()
+        self.tokens = float(self.burst)
+        self.in_flight = 0
+        self.lock = threading.Lock()
+        self._executor = None
+
+    def __getstate__(self):
+        # Threads and the budget belong to the process the policy is used
+        # in, other processes start afresh.
+        state = self.__dict__.copy()
+        for name in ('stats', 'tokens', 'in_flight', 'lock', '_executor'):
+            del state[name]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._reset()
+
+    @property
+    def executor(self):
+        with self.lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers)
+            return self._executor
+
+    def hedge_delay(self, histogram):
+        """
+        Seconds before hedging a request to a route whose latencies are in
+        `histogram`, or None if it should not be hedged.
+
+        :param histogram (optional): `LatencyHistogram` of the route.
+        """
+        if histogram is not None and histogram.count >= self.min_samples:
+            delay = histogram.percentile(self.percentile)
+        else:
+            delay = self.delay
+        if delay is None:
+            return None
+        delay = max(delay, self.min_delay)
+        if self.max_delay is not None:
+            delay = min(delay, self.max_delay)
+        return delay
+
+    def _hedge(self, send):
+        """
+        Send a hedge from the policy's threads, if the budget allows it and
+        one of them is free. Returns its future, or None.
+        """
+        with self.lock:
+            if self.tokens < 1 or self.in_flight >= self.max_workers:
+                self.stats['denied'] += 1
+                return None
+            self.tokens -= 1
+            self.stats['hedges'] += 1
+            self.in_flight += 1
+        future = self.executor.submit(send)
+        future.add_done_callback(self._hedge_done)
+        return future
+
+    def _hedge_done(self, future):
+        with self.lock:
+            self.in_flight -= 1
+
+    def call(self, send, histogram=None):
+        """
+        Call `send`, and call it again if it takes longer than the hedge
+        delay. Returns the first response, or raises the first error if
+        both attempts failed.
+
+        :param send: callable sending the request and returning the response.
+        :param histogram (optional): `LatencyHistogram` of the route.
+        """
+        with self.lock:
+            self.stats['reads'] += 1
+            self.tokens = min(self.tokens + self.budget, self.burst)
+        delay = self.hedge_delay(histogram)
+        if delay is None:
+            return send()
+        # The first attempt doesn't wait for, or hold, one of the threads
+        # of the pool: the delay runs from when it is sent.
+        first = start_attempt(send)
+        done, _ = wait([first], timeout=delay)
+        hedge = None if done else self._hedge(send)
+        if hedge is None:
+            return first.result()
+        logger.debug('Hedging a request unanswered after %.3fs', delay)
+        attempts = [first, hedge]
+        pending = attempts
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            winners = [future for future in attempts if future in done
+                and future.exception() is None]
+            if winners:
+                winner = winners[0]
+                if winner is not first:
+                    with self.lock:
+                        self.stats['won'] += 1
+                for future in attempts:
+                    if future is not winner:
+                        future.cancel()
+                        future.add_done_callback(close_response)
+                return winner.result()
+        return first.result()
+
+    def close(self):
+        """
+        Stop the threads of the policy, once the hedges in flight are done.
+        """
+        with self.lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+    def __repr__(self):
+        return '<HedgingPolicy p{0:g}, {1:.1f} hedges available>'.format(
+            self.percentile * 100, self.tokens)
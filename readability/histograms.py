@@ -0,0 +1,308 @@
+# -*- coding: utf-8 -*-
+
+"""
+readability.histograms
+~~~~~~~~~~~~~~~~~~~~~~
+
+This module provides fixed-memory, log-bucketed latency histograms.
+
+Every histogram uses the same bucket layout, so histograms recorded in
+different threads or processes can be merged by adding their counts. Bucket
+boundaries grow geometrically, which bounds the relative error of any
+percentile to half a bucket (about 2% with the default 16 buckets per
+doubling) whatever the magnitude of the latency.
+
+"""
+
+import math
+import threading
+
+# Smallest and largest latency, in seconds, tracked with full precision.
+# Values outside the range are clamped into the first and last bucket.
+MIN_LATENCY = 1e-6
+MAX_LATENCY = 3600.0
+BUCKETS_PER_DOUBLING = 16
+
+
+class LatencyHistogram(object):
+    """
+    Log-bucketed histogram of latencies in seconds.
+
+    :param min_value: smallest latency tracked precisely.
+    :param max_value: largest latency tracked precisely.
+    :param buckets_per_doubling: number of buckets between a value and twice
+        that value.
+    """
+    def __init__(self, min_value=MIN_LATENCY, max_value=MAX_LATENCY,
+        buckets_per_doubling=BUCKETS_PER_DOUBLING):
+        self.min_value = min_value
+        self.max_value = max_value
+        self.buckets_per_doubling = buckets_per_doubling
+        self._scale = buckets_per_doubling / math.log(2)
+        self._log_min = math.log(min_value)
+        self.size = self.index(max_value) + 1
+        self.counts = [0] * self.size
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+        self.lock = threading.Lock()
+
+    @property
+    def layout(self):
+        return (self.min_value, self.max_value, self.buckets_per_doubling)
+
+    def index(self, value):
+        """
+        Bucket index of `value`.
+        """
+        if value <= self.min_value:
+            return 0
+        return int((math.log(value) - self._log_min) * self._scale) + 1
+
+    def bucket_bounds(self, index):
+        """
+        `(lower, upper)` bounds of the values counted in bucket `index`.
+        """
+        if index == 0:
+            return 0.0, self.min_value
+        lower = math.exp((index - 1) / self._scale + self._log_min)
+        upper = math.exp(index / self._scale + self._log_min)
+        return lower, upper
+
+    def record(self, value):
+        """
+        Count one latency of `value` seconds.
+        """
+        index = self.index(value)
+        if index >= self.size:
+            index = self.size - 1
+        with self.lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.total += value
+            if self.min is None or value < self.min:
+                self.min = value
+            if self.max is None or value > self.max:
+                self.max = value
+
+    def percentile(self, fraction):
+        """
+        Estimate the latency below which `fraction` of the recorded values
+        fall, e.g. `0.99` for the p99. Returns None if nothing was recorded.
+
+        :param fraction: between 0 and 1.
+        """
+        with self.lock:
+            counts = list(self.counts)
+            count, low, high = self.count, self.min, self.max
+        return self._estimate(counts, count, low, high, fraction)
+
+    def _estimate(self, counts, count, low, high, fraction):
+        if not count:
+            return None
+        rank = max(int(math.ceil(fraction * count)), 1)
+        seen = 0
+        for index, value in enumerate(counts):
+            seen += value
+            if seen >= rank:
+                lower, upper = self.bucket_bounds(index)
+                # The geometric midpoint halves the worst case relative error.
+                estimate = math.sqrt(lower * upper) if lower else upper
+                # Never report outside what was actually observed.
+                return min(max(estimate, low), high)
+        return high
+
+    def mean(self):
+        with self.lock:
+            return self.total / self.count if self.count else None
+
+    def merge(self, other):
+        """
+        Add the counts of `other`, which must use the same bucket layout.
+        """
+        if other.layout != self.layout:
+            raise ValueError('Cannot merge histograms with different bucket layouts.')
+        with other.lock:
+            counts = list(other.counts)
+            count, total, low, high = other.count, other.total, other.min, other.max
+        with self.lock:
+            for index, value in enumerate(counts):
+                if value:
+                    self.counts[index] += value
+            self._add_totals(count, total, low, high)
+        return self
+
+    def _add_totals(self, count, total, low, high):
+        self.count += count
+        self.total += total
+        if low is not None and (self.min is None or low < self.min):
+            self.min = low
+        if high is not None and (self.max is None or high > self.max):
+            self.max = high
+
+    def reset(self):
+        """
+        Clear the histogram and return a copy of what it held, so that a
+        window can be read and restarted atomically.
+        """
+        snapshot = LatencyHistogram(*self.layout)
+        with self.lock:
+            snapshot.counts, self.counts = self.counts, [0] * self.size
+            snapshot._add_totals(self.count, self.total, self.min, self.max)
+            self.count, self.total, self.min, self.max = 0, 0.0, None, None
+        return snapshot
+
+    def to_dict(self):
+        """
+        JSON serializable representation, with only non-empty buckets, that
+        can be sent to another process and merged there.
+        """
+        with self.lock:
+            return {
+                'layout': list(self.layout),
+                'buckets': dict((str(index), value)
+                    for index, value in enumerate(self.counts) if value),
+                'count': self.count,
+                'total': self.total,
+                'min': self.min,
+                'max': self.max,
+            }
+
+    @classmethod
+    def from_dict(cls, data):
+        histogram = cls(*data['layout'])
+        for index, value in data['buckets'].items():
+            histogram.counts[int(index)] = value
+        histogram._add_totals(data['count'], data['total'], data['min'], data['max'])
+        return histogram
+
+
+class LatencyHistograms(object):
+    """
+    Latency histograms keyed by client, method, route and status.
+
+    Clients record into one of these for every request; see
+    `ReaderClient.latency` and `ParserClient.latency`. Routes are endpoints
+    with their ids collapsed, e.g. `'bookmarks/{id}'`, and the HTTP method
+    keeps e.g. the `HEAD` and `GET` requests to a route apart. Requests that
+    raised are recorded with a status of `'error'`.
+    """
+    def __init__(self, min_value=MIN_LATENCY, max_value=MAX_LATENCY,
+        buckets_per_doubling=BUCKETS_PER_DOUBLING):
+        self.layout = (min_value, max_value, buckets_per_doubling)
+        self.lock = threading.Lock()
+        self.histograms = {}
+
+    def histogram(self, client, method, route, status):
+        key = (client, method, route, status)
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            with self.lock:
+                histogram = self.histograms.get(key)
+                if histogram is None:
+                    histogram = LatencyHistogram(*self.layout)
+                    self.histograms[key] = histogram
+        return histogram
+
+    def record(self, client, method, route, status, value):
+        self.histogram(client, method, route, status).record(value)
+
+    def __call__(self, event):
+        """
+        Record a finished `RequestEvent`, so that the collection can also be
+        used as a hook.
+        """
+        status = event.status if event.status is not None else 'error'
+        self.record(event.client, event.method, event.route, status, event.total_time)
+
+    def select(self, client=None, route=None, status=None, method=None):
+        """
+        Merge the histograms matching the given client, route, status and
+        method into a single histogram. Arguments left out match everything.
+        """
+        merged = LatencyHistogram(*self.layout)
+        with self.lock:
+            items = list(self.histograms.items())
+        for (h_client, h_method, h_route, h_status), histogram in items:
+            if client is not None and client != h_client:
+                continue
+            if method is not None and method != h_method:
+                continue
+            if route is not None and route != h_route:
+                continue
+            if status is not None and status != h_status:
+                continue
+            merged.merge(histogram)
+        return merged
+
+    def percentile(self, fraction, client=None, route=None, status=None, method=None):
+        """
+        Latency percentile in seconds across the matching histograms.
+
+        :param fraction: the percentile wanted, e.g. `0.99`.
+        """
+        return self.select(client, route, status, method).percentile(fraction)
+
+    def percentiles(self, fractions=(0.5, 0.9, 0.99), client=None, route=None, status=None,
+        method=None):
+        """
+        Return a dict of percentile fractions to latencies.
+        """
+        histogram = self.select(client, route, status, method)
+        return dict((fraction, histogram.percentile(fraction)) for fraction in fractions)
+
+    def keys(self):
+        with self.lock:
+            return list(self.histograms)
+
+    def reset(self):
+        """
+        Start a new window. Returns a `LatencyHistograms` holding the window
+        that just ended.
+        """
+        window = LatencyHistograms(*self.layout)
+        with self.lock:
+            keys = list(self.histograms)
+        for key in keys:
+            window.histograms[key] = self.histograms[key].reset()
+        return window
+
+    def merge(self, other):
+        """
+        Add all histograms of `other` into this collection.
+        """
+        for key in other.keys():
+            self.histogram(*key).merge(other.histograms[key])
+        return self
+
+    def to_dict(self):
+        with self.lock:
+            items = list(self.histograms.items())
+        return {
+            'layout': list(self.layout),
+            'histograms': [[list(key), histogram.to_dict()]
+                for key, histogram in sorted(items, key=lambda item: str(item[0]))],
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        histograms = cls(*data['layout'])
+        for key, histogram in data['histograms']:
+            histograms.histograms[tuple(key)] = LatencyHistogram.from_dict(histogram)
+        return histograms
+
+
+def merge_all(collections):
+    """
+    Merge several `LatencyHistograms`, e.g. one per worker process, or their
+    `to_dict()` representations.
+    """
+    merged = None
+    for collection in collections:
+        if isinstance(collection, dict):
+            collection = LatencyHistograms.from_dict(collection)
+        if merged is None:
+            merged = LatencyHistograms(*collection.layout)
+        merged.merge(collection)
+    return merged
@@ -0,0 +1,304 @@
+# -*- coding: utf-8 -*-
+
+"""
+readability.instrumentation
+~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+This module provides the per-request events emitted by the clients and
+hooks to consume them.
+
+A hook is any callable taking a `RequestEvent`. It is called once the
+request has finished. Hooks that also want to know when a request starts
+can define a `before_request(event)` method; `after_request(event)` is then
+used instead of calling the hook itself:
+
+    aggregator = MetricsAggregator()
+    client = ParserClient(token='...', hooks=[aggregator, StatsdEmitter()])
+    client.get_article(url='...')
+    aggregator.snapshot()
+
+"""
+
+import logging
+import re
+import socket
+import threading
+import time
+
+from collections import defaultdict
+
+logger = logging.getLogger(__name__)
+
+# Use the highest resolution clock available.
+timer = getattr(time, 'perf_counter', time.time)
+
+
+def route_for(endpoint):
+    """
+    Collapse the ids in an endpoint so that it can be used as a metric name.
+
+    Reader API paths alternate between collections and ids, so
+    `'bookmarks/42/tags/7'` becomes `'bookmarks/{id}/tags/{id}'`.
+
+    :param endpoint: the resource passed to `_generate_url`.
+    """
+    segments = endpoint.split('/')
+    return '/'.join(segment if index % 2 == 0 else '{id}'
+        for index, segment in enumerate(segments))
+
+
+class RequestEvent(object):
+    """
+    Everything known about a single request made by a client.
+
+    :param client: `'reader'` or `'parser'`.
+    :param method: HTTP method.
+    :param endpoint: resource the request was sent to, as passed to
+        `_generate_url`, without the query string.
+    """
+    __slots__ = ('client', 'method', 'endpoint', 'route', 'status', 'error',
+        'bytes_sent', 'bytes_received', 'connect_time', 'ttfb', 'total_time',
+        'retries', 'cache', 'started', 'response')
+
+    def __init__(self, client, method, endpoint):
+        self.client = client
+        self.method = method
+        self.endpoint = endpoint
+        self.route = route_for(endpoint)
+        #: HTTP status, or None when the request raised.
+        self.status = None
+        #: Exception raised by the transport, if any.
+        self.error = None
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        #: Seconds spent establishing a connection, when the transport
+        #: reports it.
+        self.connect_time = None
+        #: Seconds until the response headers were received.
+        self.ttfb = None
+        #: Seconds the request took in the client, signing included.
+        self.total_time = None
+        #: Number of retries the transport made.
+        self.retries = 0
+        #: `'hit'` or `'miss'` when a caching layer reports it, else None.
+        self.cache = None
+        #: Wall clock time the request started at.
+        self.started = time.time()
+        self.response = None
+
+    def finish(self, response, total_time):
+        """
+        Fill in the outcome of the request from `response`.
+        """
+        self.response = response
+        self.total_time = total_time
+        self.status = response.status_code
+        # Content-Length is what went over the wire, even when the body was
+        # compressed.
+        length = response.headers.get('Content-Length')
+        if length is not None and self.method != 'HEAD':
+            self.bytes_received = int(length)
+        elif getattr(response, 'body_size', None) is not None:
+            # Spooled to disk: don't read it back to measure it.
+            self.bytes_received = response.body_size
+        else:
+            self.bytes_received = len(response.content or b'')
+        elapsed = getattr(response, 'elapsed', None)
+        if elapsed is not None:
+            self.ttfb = elapsed.total_seconds()
+        self.connect_time = getattr(response, 'connect_time', None)
+        self.retries = response_retries(response)
+        from_cache = getattr(response, 'from_cache', None)
+        if from_cache is not None:
+            self.cache = 'hit' if from_cache else 'miss'
+
+    def as_dict(self):
+        return dict((name, getattr(self, name)) for name in self.__slots__
+            if name not in ('response', 'error'))
+
+    def __repr__(self):
+        return '<RequestEvent {0} {1} {2}>'.format(self.method, self.endpoint, self.status)
+
+
+def response_retries(response):
+    """
+    Number of retries the transport made for `response`.
+    """
+    retries = getattr(response, 'retries', None)
+    if retries is None:
+        raw_retries = getattr(getattr(response, 'raw', None), 'retries', None)
+        history = getattr(raw_retries, 'history', None)
+        retries = len(history) if history else 0
+    return retries
+
+
+def body_size(data):
+    """
+    Size in bytes of a request body, when it can be known up front.
+    """
+    if data is None:
+        return 0
+    if isinstance(data, bytes):
+        return len(data)
+    if isinstance(data, str):
+        return len(data.encode('utf-8'))
+    return None
+
+
+class ByteCounter(object):
+    """
+    Wraps a streamed request body to count the bytes actually sent.
+    """
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        self.count = 0
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        chunk = next(self.chunks)
+        self.count += len(chunk)
+        return chunk
+
+    next = __next__
+
+
+def call_hooks(hooks, event, before=False):
+    """
+    Dispatch `event` to `hooks`. A failing hook is logged and never breaks
+    the request.
+    """
+    for hook in hooks:
+        try:
+            if before:
+                before_request = getattr(hook, 'before_request', None)
+                if before_request is not None:
+                    before_request(event)
+            else:
+                after_request = getattr(hook, 'after_request', None)
+                (after_request or hook)(event)
+        except Exception:
+            logger.exception('Request hook %r failed', hook)
+
+
+class EndpointMetrics(object):
+    """
+    Running totals for one `(client, method, route, status)` combination.
+    """
+    __slots__ = ('count', 'errors', 'bytes_sent', 'bytes_received',
+        'total_time', 'max_time', 'ttfb', 'connect_time', 'retries',
+        'cache_hits', 'cache_misses')
+
+    def __init__(self):
+        for name in self.__slots__:
+            setattr(self, name, 0)
+
+    def add(self, event):
+        self.count += 1
+        if event.error is not None:
+            self.errors += 1
+        self.bytes_sent += event.bytes_sent or 0
+        self.bytes_received += event.bytes_received or 0
+        self.total_time += event.total_time or 0
+        self.max_time = max(self.max_time, event.total_time or 0)
+        self.ttfb += event.ttfb or 0
+        self.connect_time += event.connect_time or 0
+        self.retries += event.retries or 0
+        if event.cache == 'hit':
+            self.cache_hits += 1
+        elif event.cache == 'miss':
+            self.cache_misses += 1
+
+    def as_dict(self):
+        out = dict((name, getattr(self, name)) for name in self.__slots__)
+        out['mean_time'] = self.total_time / self.count if self.count else 0
+        return out
+
+
+class MetricsAggregator(object):
+    """
+    Hook that keeps in-memory totals per client, method, route and status.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.metrics = defaultdict(EndpointMetrics)
+
+    def __call__(self, event):
+        key = (event.client, event.method, event.route, event.status)
+        with self.lock:
+            self.metrics[key].add(event)
+
+    def snapshot(self):
+        """
+        Return the current totals as a dict keyed by
+        `(client, method, route, status)`.
+        """
+        with self.lock:
+            return dict((key, metrics.as_dict()) for key, metrics in self.metrics.items())
+
+    def reset(self):
+        with self.lock:
+            self.metrics.clear()
+
+
+def metric_name(*parts):
+    """
+    Join `parts` into a statsd metric name, replacing unsafe characters.
+    """
+    return '.'.join(re.sub(r'[^A-Za-z0-9_\-]+', '_', str(part)).strip('_') or 'root'
+        for part in parts)
+
+
+class StatsdEmitter(object):
+    """
+    Hook that emits statsd lines for every request.
+
+    For each request it emits a `requests` counter, `total`, `ttfb` and
+    `connect` timers in milliseconds and `bytes_sent` / `bytes_received`
+    counters, named `<prefix>.<client>.<method>.<route>.<status>.<metric>`.
+
+    :param prefix: prefix of all metric names.
+    :param host: statsd host lines are sent to over UDP.
+    :param port: statsd port.
+    :param sink (optional): callable receiving each batch of lines as a
+        single newline separated string, instead of sending them over UDP.
+    """
+    def __init__(self, prefix='readability', host='127.0.0.1', port=8125, sink=None):
+        self.prefix = prefix
+        self.address = (host, port)
+        self.sink = sink
+        self.socket = None
+
+    def lines(self, event):
+        name = metric_name(self.prefix, event.client, event.method.lower(),
+            event.route, event.status if event.status is not None else 'error')
+        lines = ['{0}.requests:1|c'.format(name)]
+        for metric, value in (('total', event.total_time),
+                ('ttfb', event.ttfb), ('connect', event.connect_time)):
+            if value is not None:
+                lines.append('{0}.{1}:{2:.3f}|ms'.format(name, metric, value * 1000))
+        for metric in ('bytes_sent', 'bytes_received', 'retries'):
+            value = getattr(event, metric)
+            if value:
+                lines.append('{0}.{1}:{2}|c'.format(name, metric, value))
+        if event.cache is not None:
+            lines.append('{0}.cache_{1}:1|c'.format(name, event.cache))
+        return lines
+
+    def __call__(self, event):
+        payload = '\n'.join(self.lines(event))
+        if self.sink is not None:
+            self.sink(payload)
+            return
+        if self.socket is None:
+            self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        try:
+            self.socket.sendto(payload.encode('utf-8'), self.address)
+        except socket.error:
+            logger.debug('Could not send metrics to statsd at %s:%s', *self.address)
+
+    def close(self):
+        if self.socket is not None:
+            self.socket.close()
+            self.socket = None
@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+
+"""
+readability.jsonlib
+~~~~~~~~~~~~~~~~~~~
+
+This module decodes the JSON of API responses with the fastest library
+installed.
+
+`loads` uses the first of `orjson`, `ujson` and `simplejson` that can be
+imported and falls back to the standard library `json`. The `json()`
+method of every response returned by the clients goes through it. A
+backend can also be picked explicitly, e.g. to compare them:
+
+    from readability import jsonlib
+    jsonlib.set_backend('json')
+
+Keyword arguments such as `object_hook` are only supported by the standard
+library, and are decoded with it whatever the backend.
+
+"""
+
+import json
+
+#: Backends tried in order of preference.
+BACKENDS = ('orjson', 'ujson', 'simplejson', 'json')
+
+_backend = None
+
+
+def import_backend(name):
+    """
+    The `loads` function of backend `name`. Raises ImportError if it is not
+    installed.
+    """
+    if name not in BACKENDS:
+        raise ValueError('Unknown JSON backend {0!r}, expected one of {1}'.format(
+            name, ', '.join(BACKENDS)))
+    if name == 'json':
+        return json.loads
+    return __import__(name).loads
+
+
+def available_backends():
+    """
+    Names of the installed backends, in order of preference.
+    """
+    names = []
+    for name in BACKENDS:
+        try:
+            import_backend(name)
+        except ImportError:
+            continue
+        names.append(name)
+    return names
+
+
+def get_backend():
+    """
+    Name and `loads` function of the backend in use, picking the preferred
+    installed one on first use.
+    """
+    global _backend
+    if _backend is None:
+        name = available_backends()[0]
+        _backend = (name, import_backend(name))
+    return _backend
+
+
+def set_backend(name=None):
+    """
+    Use backend `name`, or the preferred installed one if None.
+    """
+    global _backend
+    _backend = None if name is None else (name, import_backend(name))
+
+
+def loads(data, **kwargs):
+    """
+    Decode a JSON document given as text or UTF-8 bytes. Raises ValueError
+    on invalid JSON, whatever the backend.
+    """
+    if kwargs:
+        if isinstance(data, bytes):
+            data = data.decode('utf-8')
+        return json.loads(data, **kwargs)
+    return get_backend()[1](data)
@@ -0,0 +1,440 @@
+# -*- coding: utf-8 -*-
+
+"""
+readability.outbox
+~~~~~~~~~~~~~~~~~~
+
+This module provides a durable outbox for Reader API mutations.
+
+`Outbox` journals bookmark and tag mutations to a SQLite database and
+returns at once; a background thread replays them in order against the
+API, retrying transient failures, so that callers never wait on it:
+
+    outbox = Outbox(client, 'outbox.sqlite3')
+    outbox.add_bookmark('http://example.com/article.html')
+    outbox.update_bookmark(bookmark_id, read_percent=0.5)
+    outbox.close()
+
+Mutations made pointless by later ones are collapsed before they are sent:
+successive updates of a bookmark are merged, a deletion discards the
+pending changes to the bookmark, and deleting the url of a bookmark whose
+addition is still pending cancels both. Mutations left by a process that
+exited are replayed once the outbox is started again.
+
+"""
+
+import json
+import logging
+import sqlite3
+import threading
+import time
+
+from collections import Counter
+
+try:
+    from urllib.parse import urlparse
+except ImportError:
+    from urlparse import urlparse
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    method TEXT NOT NULL,
+    key TEXT NOT NULL,
+    args TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    not_before REAL NOT NULL DEFAULT 0,
+    created REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS outbox_key ON outbox (key, id);
+CREATE TABLE IF NOT EXISTS dead (
+    id INTEGER PRIMARY KEY,
+    method TEXT NOT NULL,
+    key TEXT NOT NULL,
+    args TEXT NOT NULL,
+    attempts INTEGER NOT NULL,
+    created REAL NOT NULL,
+    status INTEGER,
+    error TEXT
+);
+CREATE TABLE IF NOT EXISTS bookmarks (
+    url TEXT PRIMARY KEY,
+    bookmark_id INTEGER NOT NULL
+);
+"""
+
+# Outcomes of sending a mutation.
+DONE, RETRY, DEAD = 'done', 'retry', 'dead'
+
+
+class OutboxEntry(object):
+    """
+    A journaled mutation.
+    """
+    __slots__ = ('id', 'method', 'key', 'args', 'attempts', 'not_before', 'created')
+
+    def __init__(self, id, method, key, args, attempts, not_before, created):
+        self.id = id
+        self.method = method
+        self.key = key
+        self.args = args if isinstance(args, dict) else json.loads(args)
+        self.attempts = attempts
+        self.not_before = not_before
+        self.created = created
+
+    def __repr__(self):
+        return '<OutboxEntry {0} {1}({2})>'.format(self.id, self.method, self.args)
+
+
+def location_id(response):
+    """
+    Bookmark id from the `Location` header of an `add_bookmark` response.
+    """
+    location = response.headers.get('Location')
+    if not location:
+        return None
+    try:
+        return int(urlparse(location).path.rstrip('/').rsplit('/', 1)[-1])
+    except ValueError:
+        return None
+
+
+class Outbox(object):
+    """
+    Durable, ordered queue of Reader API mutations replayed in the
+    background.
+
+    The mutation methods mirror those of `ReaderClient` but return the id
+    of the journaled entry, or None when the mutation was collapsed into
+    pending ones, instead of a response.
+
+    :param client: `ReaderClient` the mutations are sent with.
+    :param path: path of the SQLite database, created if needed.
+    :param batch_size: entries read from the journal at once; the entries
+        sent are removed from it in one transaction.
+    :param max_attempts: attempts at sending an entry that fails with a
+        transient error, an exception or a 429 or 5xx response, before it
+        is moved to the dead letters. Other errors move it at once.
+    :param min_backoff: seconds before the first retry of an entry.
+    :param max_backoff: longest wait between two retries.
+    :param on_error (optional): called with the `OutboxEntry` and the
+        response or exception of entries moved to the dead letters.
+    """
+    def __init__(self, client, path, batch_size=50, max_attempts=5,
+        min_backoff=1.0, max_backoff=300.0, on_error=None):
+        self.client = client
+        self.path = path
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        self.on_error = on_error
+        #: Counter of `'journaled'`, `'collapsed'`, `'sent'`, `'retries'`
+        #: and `'dead'` entries.
+        self.stats = Counter()
+        self.condition = threading.Condition(threading.RLock())
+        # Serializes draining, so entries are sent in order.
+        self.drain_lock = threading.Lock()
+        self.inflight = frozenset()
+        self.thread = None
+        self.closed = False
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.executescript(SCHEMA)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def start(self):
+        """
+        Start the background thread, which replays journaled entries,
+        including those left by a previous process. Called on the first
+        mutation.
+        """
+        with self.condition:
+            if self.closed:
+                raise RuntimeError('Outbox is closed.')
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, name='Outbox')
+                self.thread.daemon = True
+                self.thread.start()
+        return self
+
+    def add_bookmark(self, url, favorite=False, archive=False, allow_duplicates=True):
+        args = {'url': url, 'favorite': bool(favorite), 'archive': bool(archive),
+            'allow_duplicates': bool(allow_duplicates)}
+        return self._journal('add_bookmark', 'url:' + url, args)
+
+    def update_bookmark(self, bookmark_id, favorite=None, archive=None, read_percent=None):
+        args = {'bookmark_id': bookmark_id}
+        if favorite is not None:
+            args['favorite'] = bool(favorite)
+        if archive is not None:
+            args['archive'] = bool(archive)
+        if read_percent is not None:
+            args['read_percent'] = float(read_percent)
+        return self._journal('update_bookmark', 'bookmark:{0}'.format(bookmark_id), args)
+
+    def delete_bookmark(self, bookmark_id=None, url=None):
+        """
+        Delete a bookmark by id, or by the url it was added with through
+        this outbox.
+        """
+        if (bookmark_id is None) == (url is None):
+            raise ValueError('Exactly one of bookmark_id and url is required.')
+        if url is not None:
+            return self._journal('delete_bookmark', 'url:' + url, {'url': url})
+        return self._journal('delete_bookmark', 'bookmark:{0}'.format(bookmark_id),
+            {'bookmark_id': bookmark_id})
+
+    def add_tags_to_bookmark(self, bookmark_id, tags):
+        return self._journal('add_tags_to_bookmark', 'bookmark:{0}'.format(bookmark_id),
+            {'bookmark_id': bookmark_id, 'tags': tags})
+
+    def delete_tag_from_bookmark(self, bookmark_id, tag_id):
+        return self._journal('delete_tag_from_bookmark', 'bookmark:{0}'.format(bookmark_id),
+            {'bookmark_id': bookmark_id, 'tag_id': tag_id})
+
+    def pending(self):
+        """
+        Number of entries not sent yet.
+        """
+        with self.condition:
+            return self.connection.execute('SELECT COUNT(*) FROM outbox').fetchone()[0]
+
+    def entries(self):
+        """
+        Journaled entries, in the order they will be sent.
+        """
+        with self.condition:
+            rows = self.connection.execute('SELECT id, method, key, args, attempts, '
+                'not_before, created FROM outbox ORDER BY id').fetchall()
+        return [OutboxEntry(*row) for row in rows]
+
+    def dead_letters(self):
+        """
+        Entries given up on, as `(entry, status, error)` tuples where
+        `status` is the status code of the last response, if any.
+        """
+        with self.condition:
+            rows = self.connection.execute('SELECT id, method, key, args, attempts, '
+                'created, status, error FROM dead ORDER BY id').fetchall()
+        return [(OutboxEntry(*(row[:5] + (0,) + row[5:6])), row[6], row[7]) for row in rows]
+
+    def _journal(self, method, key, args):
+        with self.condition:
+            if self.closed:
+                raise RuntimeError('Outbox is closed.')
+            with self.connection:
+                entry_id = self._collapse(method, key, args)
+                if entry_id is False:
+                    entry_id = self.connection.execute('INSERT INTO outbox '
+                        '(method, key, args, created) VALUES (?, ?, ?, ?)',
+                        (method, key, json.dumps(args), time.time())).lastrowid
+                    self.stats['journaled'] += 1
+                else:
+                    self.stats['collapsed'] += 1
+            self.condition.notify()
+        self.start()
+        return entry_id
+
+    def _collapse(self, method, key, args):
+        """
+        Fold a mutation into pending entries for the same bookmark. Returns
+        the id of the entry it was folded into, None if it cancelled pending
+        entries out, or False if it has to be journaled.
+
+        Entries being sent are left alone.
+        """
+        rows = [row for row in self.connection.execute('SELECT id, method, args FROM outbox '
+            'WHERE key = ? ORDER BY id', (key,)) if row[0] not in self.inflight]
+        last = rows[-1] if rows else None
+        if method in ('update_bookmark', 'add_tags_to_bookmark', 'add_bookmark') \
+                and last is not None and last[1] == method:
+            merged = json.loads(last[2])
+            if method == 'add_tags_to_bookmark':
+                tags = [tag.strip() for tag in merged['tags'].split(',')]
+                tags.extend(tag.strip() for tag in args['tags'].split(',')
+                    if tag.strip() not in tags)
+                merged['tags'] = ','.join(tag for tag in tags if tag)
+            else:
+                merged.update(args)
+            self.connection.execute('UPDATE outbox SET args = ? WHERE id = ?',
+                (json.dumps(merged), last[0]))
+            return last[0]
+        if method == 'delete_bookmark' and rows:
+            self.connection.executemany('DELETE FROM outbox WHERE id = ?',
+                [(row[0],) for row in rows])
+            self.stats['collapsed'] += len(rows)
+            if 'url' in args and any(row[1] == 'add_bookmark' for row in rows):
+                return None
+        return False
+
+    def drain(self):
+        """
+        Send the entries that are due now, in order, stopping at the first
+        one that has to be retried later. Returns the number of entries
+        sent or given up on.
+        """
+        processed = 0
+        with self.drain_lock:
+            while True:
+                with self.condition:
+                    entries = [OutboxEntry(*row) for row in self.connection.execute(
+                        'SELECT id, method, key, args, attempts, not_before, created '
+                        'FROM outbox ORDER BY id LIMIT ?', (self.batch_size,))]
+                    if not entries or entries[0].not_before > time.time():
+                        return processed
+                    self.inflight = frozenset(entry.id for entry in entries)
+                done, dead, retry = [], [], None
+                try:
+                    for entry in entries:
+                        if entry.not_before > time.time():
+                            retry = entry
+                            break
+                        outcome, status, error = self._send(entry)
+                        if outcome == DONE:
+                            done.append(entry)
+                        elif outcome == DEAD or entry.attempts + 1 >= self.max_attempts:
+                            dead.append((entry, status, error))
+                        else:
+                            entry.attempts += 1
+                            entry.not_before = time.time() + min(self.max_backoff,
+                                self.min_backoff * 2 ** (entry.attempts - 1))
+                            retry = entry
+                            self.stats['retries'] += 1
+                            break
+                finally:
+                    with self.condition:
+                        self._settle(done, dead, retry)
+                        self.inflight = frozenset()
+                processed += len(done) + len(dead)
+                for entry, status, error in dead:
+                    if self.on_error is not None:
+                        try:
+                            self.on_error(entry, error)
+                        except Exception:
+                            # Don't let the callback stop the outbox.
+                            logger.exception('on_error failed for %r', entry)
+                if retry is not None:
+                    return processed
+
+    def _settle(self, done, dead, retry):
+        with self.connection:
+            self.connection.executemany('DELETE FROM outbox WHERE id = ?',
+                [(entry.id,) for entry, _, _ in dead] + [(entry.id,) for entry in done])
+            self.connection.executemany('INSERT INTO dead (id, method, key, args, attempts, '
+                'created, status, error) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                [(entry.id, entry.method, entry.key, json.dumps(entry.args), entry.attempts + 1,
+                    entry.created, status, None if error is None else repr(error))
+                    for entry, status, error in dead])
+            if retry is not None:
+                self.connection.execute('UPDATE outbox SET attempts = ?, not_before = ? '
+                    'WHERE id = ?', (retry.attempts, retry.not_before, retry.id))
+        self.stats['sent'] += len(done)
+        self.stats['dead'] += len(dead)
+        for entry, status, error in dead:
+            logger.warning('Giving up on %r: %r', entry, error)
+
+    def _send(self, entry):
+        """
+        Send an entry. Returns its outcome, the status code of the response
+        and the response or exception if it failed.
+        """
+        args = dict(entry.args)
+        if entry.method == 'delete_bookmark' and 'url' in args:
+            with self.condition:
+                row = self.connection.execute('SELECT bookmark_id FROM bookmarks WHERE url = ?',
+                    (args.pop('url'),)).fetchone()
+            if row is None:
+                return DEAD, None, ValueError('No bookmark was added for {0}'.format(entry.args['url']))
+            args['bookmark_id'] = row[0]
+        try:
+            response = getattr(self.client, entry.method)(**args)
+        except Exception as e:
+            logger.info('Sending %r failed: %r', entry, e)
+            return RETRY, None, e
+        status = response.status_code
+        if entry.method == 'add_bookmark' and status in (200, 201, 202, 409):
+            bookmark_id = location_id(response)
+            if bookmark_id is None:
+                bookmark_id = self._lookup_bookmark_id(args['url'])
+            if bookmark_id is None:
+                logger.warning('No bookmark id for %s added by %r, it cannot be deleted '
+                    'by url', args['url'], entry)
+            else:
+                with self.condition:
+                    with self.connection:
+                        self.connection.execute('INSERT OR REPLACE INTO bookmarks '
+                            '(url, bookmark_id) VALUES (?, ?)', (args['url'], bookmark_id))
+            return DONE, status, None
+        if status < 400:
+            return DONE, status, None
+        if status == 404 and entry.method in ('delete_bookmark', 'delete_tag_from_bookmark'):
+            # Already gone: replaying a deletion is not an error.
+            return DONE, status, None
+        if status == 429 or status >= 500:
+            return RETRY, status, response
+        return DEAD, status, response
+
+    def _lookup_bookmark_id(self, url):
+        """
+        Id of the bookmark of `url`, looked up among the bookmarks of its
+        domain when the API did not say where it added it.
+        """
+        domain = urlparse(url).netloc
+        page = num_pages = 1
+        try:
+            while page <= num_pages:
+                response = self.client.get_bookmarks(domain=domain, order='-date_added',
+                    page=page, per_page=50)
+                response.raise_for_status()
+                data = response.json()
+                for bookmark in data.get('bookmarks') or []:
+                    if (bookmark.get('article') or {}).get('url') == url:
+                        return bookmark['id']
+                num_pages = int((data.get('meta') or {}).get('num_pages') or 1)
+                page += 1
+        except Exception as e:
+            logger.info('Looking up the bookmark of %s failed: %r', url, e)
+        return None
+
+    def _next_due(self):
+        row = self.connection.execute('SELECT not_before FROM outbox ORDER BY id LIMIT 1').fetchone()
+        return None if row is None else row[0]
+
+    def _run(self):
+        while True:
+            with self.condition:
+                while not self.closed:
+                    due = self._next_due()
+                    now = time.time()
+                    if due is not None and due <= now:
+                        break
+                    self.condition.wait(None if due is None else due - now)
+                if self.closed:
+                    return
+            self.drain()
+
+    def close(self, drain=True):
+        """
+        Stop the background thread, after sending the entries that are due
+        unless `drain` is false. Entries not sent stay journaled for the
+        next start.
+        """
+        with self.condition:
+            if self.closed:
+                return
+            self.closed = True
+            self.condition.notify_all()
+        if self.thread is not None:
+            self.thread.join()
+        if drain:
+            self.drain()
+        with self.condition:
+            self.connection.close()
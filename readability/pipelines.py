@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+
+"""
+readability.pipelines
+~~~~~~~~~~~~~~~~~~~~~
+
+This module provides bulk pipelines built on top of `ParserClient`.
+
+`ConfidenceGatedParser` only spends full parse calls on urls the Parser API
+is confident it can extract an article from. Confidence checks run
+concurrently and every url that passes the threshold is parsed as soon as
+its check returns:
+
+    pipeline = ConfidenceGatedParser(ParserClient(token='...'), threshold=0.6)
+    report = pipeline.run(urls)
+    for url, confidence, response in report.parsed:
+        ...
+    for url, confidence in report.dropped:
+        ...
+
+"""
+
+import logging
+
+from concurrent.futures import ThreadPoolExecutor, wait
+
+logger = logging.getLogger(__name__)
+
+
+class PipelineReport(object):
+    """
+    Outcome of a `ConfidenceGatedParser` run. Every list is in the order the
+    urls were given in.
+    """
+    def __init__(self, threshold):
+        self.threshold = threshold
+        #: `(url, confidence, response)` tuples of the parsed urls.
+        self.parsed = []
+        #: `(url, confidence)` tuples of the urls below the threshold.
+        self.dropped = []
+        #: `(url, error)` tuples of the urls whose confidence check or parse
+        #: failed. `error` is the exception raised or the failed response.
+        self.failed = []
+        #: Urls skipped because they had already been processed.
+        self.skipped = []
+
+    def summary(self):
+        return {
+            'threshold': self.threshold,
+            'parsed': len(self.parsed),
+            'dropped': len(self.dropped),
+            'failed': len(self.failed),
+            'skipped': len(self.skipped),
+        }
+
+    def __repr__(self):
+        return '<PipelineReport {parsed} parsed, {dropped} dropped, {failed} failed>'.format(
+            **self.summary())
+
+
+class ConfidenceGatedParser(object):
+    """
+    Parse only the urls the Parser API is confident about.
+
+    :param client: `ParserClient` used for the requests.
+    :param threshold: minimum confidence, between 0 and 1, for a url to be
+        parsed.
+    :param max_workers: number of requests in flight at once, confidence
+        checks and parses combined.
+    :param max_pages: passed to `ParserClient.get_article`.
+    :param seen (optional): a `readability.urls.SeenIndex`, or any set like
+        object, of urls already processed. They are skipped without any
+        request, and the urls parsed or dropped are added to it.
+    """
+    def __init__(self, client, threshold=0.5, max_workers=8, max_pages=25, seen=None):
+        self.client = client
+        self.threshold = threshold
+        self.max_workers = max_workers
+        self.max_pages = max_pages
+        self.seen = seen
+
+    def confidence(self, url):
+        """
+        Confidence of the Parser API in `url`. Raises `ValueError` when the
+        check did not return a confidence.
+        """
+        response = self.client.get_confidence(url=url)
+        if response.status_code != 200:
+            raise ValueError('Confidence check answered {0}'.format(response.status_code))
+        confidence = response.json().get('confidence')
+        if confidence is None:
+            raise ValueError('Confidence check returned no confidence')
+        return confidence
+
+    def run(self, urls):
+        """
+        Check the confidence of `urls` and parse those at or above the
+        threshold. Returns a `PipelineReport`.
+        """
+        report = PipelineReport(self.threshold)
+        seen = self.seen
+        if seen is not None:
+            pending = []
+            for url in urls:
+                (report.skipped if url in seen else pending).append(url)
+            urls = pending
+        urls = list(urls)
+        outcomes = [None] * len(urls)
+        parses = []
+
+        def parse(index, confidence):
+            try:
+                response = self.client.get_article(url=urls[index], max_pages=self.max_pages)
+            except Exception as e:
+                outcomes[index] = ('failed', e)
+                return
+            if response.status_code != 200:
+                outcomes[index] = ('failed', response)
+            else:
+                outcomes[index] = ('parsed', confidence, response)
+
+        def check(index):
+            try:
+                confidence = self.confidence(urls[index])
+            except Exception as e:
+                outcomes[index] = ('failed', e)
+                return
+            if confidence < self.threshold:
+                outcomes[index] = ('dropped', confidence)
+            else:
+                # Parse straight away rather than after every check is done.
+                parses.append(executor.submit(parse, index, confidence))
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            wait([executor.submit(check, index) for index in range(len(urls))])
+            wait(parses)
+
+        for url, outcome in zip(urls, outcomes):
+            kind = outcome[0]
+            if seen is not None and kind != 'failed':
+                seen.add(url)
+            if kind == 'parsed':
+                report.parsed.append((url, outcome[1], outcome[2]))
+            elif kind == 'dropped':
+                report.dropped.append((url, outcome[1]))
+            else:
+                report.failed.append((url, outcome[1]))
+        logger.debug('Confidence gated parse of %d urls: %r', len(urls), report)
+        return report
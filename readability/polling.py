@@ -0,0 +1,386 @@
+# -*- coding: utf-8 -*-
+
+"""
+readability.polling
+~~~~~~~~~~~~~~~~~~~
+
+This module provides a scheduler that waits for Parser API articles to be
+ready and then fetches them.
+
+The Parser API reports whether an article has been retrieved in the
+`X-Article-Status` header of a cheap HEAD request. `ArticlePoller` checks
+the status of many articles in concurrent batches, backs off articles that
+are not ready yet and only fetches the full article once it is:
+
+    with ArticlePoller(ParserClient(token='...')) as poller:
+        futures = poller.submit_many(urls=urls)
+        for future in futures:
+            article = future.result().json()
+
+Intervals adapt to the observed processing time: an article that is not
+ready is not checked again before articles typically become ready, so
+that few checks are wasted on articles that cannot be ready yet.
+
+"""
+
+import heapq
+import itertools
+import logging
+import random
+import threading
+import time
+
+from collections import Counter
+from concurrent.futures import Future, ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+#: Statuses of articles that can be fetched.
+READY_STATUSES = ('FETCHED', 'PROVIDED_BY_USER', 'VALIDATED')
+#: Statuses of articles that will never be ready.
+FAILED_STATUSES = ('INVALID',)
+
+
+class PollError(Exception):
+    """
+    An article could not be fetched.
+
+    :param message: description of the failure.
+    :param url: url of the article, if it was submitted by url.
+    :param article_id: id of the article, if it was submitted by id.
+    :param response (optional): the last response received for it.
+    """
+    def __init__(self, message, url=None, article_id=None, response=None):
+        super(PollError, self).__init__(message)
+        self.url = url
+        self.article_id = article_id
+        self.response = response
+
+
+class ArticleInvalid(PollError):
+    """
+    The Parser API reported the article as invalid.
+    """
+
+
+class PollTimeout(PollError):
+    """
+    The article was still not ready when its timeout expired.
+    """
+
+
+class PendingArticle(object):
+    """
+    Polling state of a single submitted article.
+    """
+    __slots__ = ('url', 'article_id', 'future', 'callback', 'submitted',
+        'checks', 'errors', 'interval', 'deadline', 'response')
+
+    def __init__(self, url, article_id, callback, submitted, deadline):
+        self.url = url
+        self.article_id = article_id
+        self.future = Future()
+        self.callback = callback
+        self.submitted = submitted
+        self.checks = 0
+        self.errors = 0
+        self.interval = None
+        self.deadline = deadline
+        self.response = None
+
+    def __repr__(self):
+        return '<PendingArticle {0}>'.format(self.url or self.article_id)
+
+
+class ArticlePoller(object):
+    """
+    Polls the status of Parser API articles and fetches them once ready.
+
+    :param client: `ParserClient` used for the requests.
+    :param max_workers: number of requests in flight at once.
+    :param batch_size: maximum number of status checks started per
+        scheduling round.
+    :param initial_delay: seconds between submitting an article and its
+        first status check.
+    :param min_interval: shortest interval, in seconds, between two checks of
+        the same article.
+    :param max_interval: longest interval between two checks.
+    :param backoff: factor the interval grows by after each check of an
+        article that is not ready.
+    :param jitter: intervals are randomly scaled by up to this fraction, so
+        that articles submitted together spread out.
+    :param timeout (optional): seconds after which an article that is still
+        not ready fails with `PollTimeout`.
+    :param max_errors: consecutive failed status checks after which an
+        article fails with the error.
+    :param max_pages: passed to `ParserClient.get_article`.
+    :param seed (optional): seed of the jitter.
+    """
+    def __init__(self, client, max_workers=8, batch_size=50, initial_delay=0.0,
+        min_interval=0.5, max_interval=60.0, backoff=2.0, jitter=0.1, timeout=None,
+        max_errors=3, max_pages=25, seed=None):
+        self.client = client
+        self.max_workers = max_workers
+        self.batch_size = batch_size
+        self.initial_delay = initial_delay
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.jitter = jitter
+        self.timeout = timeout
+        self.max_errors = max_errors
+        self.max_pages = max_pages
+        self.random = random.Random(seed)
+        #: Counter of `'checks'`, `'not_ready'`, `'ready'`, `'fetched'`,
+        #: `'errors'` and `'failed'`.
+        self.stats = Counter()
+        self.stats_lock = threading.Lock()
+        #: Moving average of the seconds articles took to become ready, or
+        #: None until one did.
+        self.ready_estimate = None
+        self.condition = threading.Condition()
+        self.queue = []
+        self.sequence = itertools.count()
+        self.active = 0
+        self.executor = None
+        self.thread = None
+        self.closed = False
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def start(self):
+        """
+        Start the scheduling thread. Called on first submission.
+        """
+        with self.condition:
+            if self.closed:
+                raise RuntimeError('ArticlePoller is closed.')
+            if self.thread is None:
+                self.executor = ThreadPoolExecutor(max_workers=self.max_workers)
+                self.thread = threading.Thread(target=self._run, name='ArticlePoller')
+                self.thread.daemon = True
+                self.thread.start()
+        return self
+
+    def close(self, wait=True):
+        """
+        Stop polling. Articles still pending are cancelled.
+
+        :param wait: wait for requests in flight to finish.
+        """
+        with self.condition:
+            self.closed = True
+            pending = [item for _, _, item in self.queue]
+            self.queue = []
+            self.condition.notify_all()
+        for item in pending:
+            self._abandon(item)
+        if self.thread is not None:
+            self.thread.join()
+        if self.executor is not None:
+            self.executor.shutdown(wait=wait)
+
+    def submit(self, url=None, article_id=None, callback=None, timeout=None):
+        """
+        Poll an article until it is ready, then fetch it.
+
+        Returns a `concurrent.futures.Future` resolving to the response of
+        `ParserClient.get_article`, or failing with a `PollError`.
+
+        :param url (optional): url of the article.
+        :param article_id (optional): id of the article.
+        :param callback (optional): called with the future once it is done.
+        :param timeout (optional): overrides the poller's `timeout`.
+        """
+        if url is None and article_id is None:
+            raise ValueError('Either url or article_id is required.')
+        now = time.time()
+        timeout = self.timeout if timeout is None else timeout
+        item = PendingArticle(url, article_id, callback, now,
+            now + timeout if timeout is not None else None)
+        if callback is not None:
+            item.future.add_done_callback(callback)
+        self.start()
+        self._schedule(item, now + self.initial_delay)
+        return item.future
+
+    def submit_many(self, urls=(), article_ids=(), callback=None):
+        """
+        Submit several articles at once. Returns their futures, urls first.
+        """
+        futures = [self.submit(url=url, callback=callback) for url in urls]
+        futures.extend(self.submit(article_id=article_id, callback=callback)
+            for article_id in article_ids)
+        return futures
+
+    def pending(self):
+        """
+        Number of articles not done yet.
+        """
+        with self.condition:
+            return len(self.queue) + self.active
+
+    def _schedule(self, item, due):
+        with self.condition:
+            if self.closed:
+                self._abandon(item)
+                return
+            heapq.heappush(self.queue, (due, next(self.sequence), item))
+            self.condition.notify()
+
+    def _run(self):
+        while True:
+            with self.condition:
+                batch = self._next_batch()
+                if batch is None:
+                    return
+                self.active += len(batch)
+            for item in batch:
+                self.executor.submit(self._check, item)
+
+    def _next_batch(self):
+        """
+        Wait for articles to be due and pop up to `batch_size` of them.
+        Returns None once closed. Called with the condition held.
+        """
+        while True:
+            if self.closed:
+                return None
+            now = time.time()
+            # Don't start checks while the workers are busy: they would
+            # only wait in the executor and go stale.
+            room = min(self.batch_size, self.max_workers * 2 - self.active)
+            if self.queue and self.queue[0][0] <= now and room > 0:
+                batch = []
+                while self.queue and self.queue[0][0] <= now and len(batch) < room:
+                    batch.append(heapq.heappop(self.queue)[2])
+                return batch
+            wait = None
+            if self.queue and room > 0:
+                wait = self.queue[0][0] - now
+            self.condition.wait(wait)
+
+    def _abandon(self, item):
+        # Futures are running from their first check on and can no longer
+        # be cancelled.
+        if not item.future.cancel() and not item.future.done():
+            item.future.set_exception(PollError('ArticlePoller closed before the article was ready',
+                item.url, item.article_id, item.response))
+
+    def _done(self):
+        with self.condition:
+            self.active -= 1
+            self.condition.notify()
+
+    def _check(self, item):
+        try:
+            if item.checks or item.future.set_running_or_notify_cancel():
+                self._poll(item)
+        except Exception as e:
+            logger.exception('Polling %r failed', item)
+            if not item.future.done():
+                item.future.set_exception(e)
+        finally:
+            self._done()
+
+    def _poll(self, item):
+        self._count('checks')
+        item.checks += 1
+        try:
+            response = self.client.get_article_status(url=item.url, article_id=item.article_id)
+        except Exception as e:
+            self._error(item, e)
+            return
+        item.response = response
+        if response.status_code == 404:
+            self._fail(item, PollError('Article not found', item.url, item.article_id, response))
+            return
+        if response.status_code != 200:
+            self._error(item, PollError('Status check answered {0}'.format(
+                response.status_code), item.url, item.article_id, response))
+            return
+        item.errors = 0
+        status = response.headers.get('X-Article-Status')
+        if status in FAILED_STATUSES:
+            self._fail(item, ArticleInvalid('Article is {0}'.format(status),
+                item.url, item.article_id, response))
+        elif status in READY_STATUSES:
+            self._count('ready')
+            self._observe_ready(time.time() - item.submitted)
+            self._fetch(item)
+        else:
+            self._count('not_ready')
+            self._retry(item)
+
+    def _fetch(self, item):
+        article_id = item.article_id
+        if article_id is None:
+            article_id = item.response.headers.get('X-Article-Id')
+        url = item.url if article_id is None else None
+        try:
+            response = self.client.get_article(url=url, article_id=article_id,
+                max_pages=self.max_pages)
+        except Exception as e:
+            self._error(item, e)
+            return
+        if response.status_code != 200:
+            self._error(item, PollError('Fetch answered {0}'.format(response.status_code),
+                item.url, item.article_id, response))
+            return
+        self._count('fetched')
+        item.future.set_result(response)
+
+    def _count(self, name):
+        # Workers update the stats concurrently.
+        with self.stats_lock:
+            self.stats[name] += 1
+
+    def _observe_ready(self, age):
+        with self.condition:
+            if self.ready_estimate is None:
+                self.ready_estimate = age
+            else:
+                self.ready_estimate += 0.2 * (age - self.ready_estimate)
+
+    def next_interval(self, item, now):
+        """
+        Seconds until the next check of `item`, which was not ready.
+        """
+        if item.interval is None:
+            interval = self.min_interval
+        else:
+            interval = item.interval * self.backoff
+        estimate = self.ready_estimate
+        if estimate is not None:
+            # Don't check again before articles usually become ready.
+            interval = max(interval, estimate - (now - item.submitted))
+        item.interval = min(max(interval, self.min_interval), self.max_interval)
+        return item.interval * self.random.uniform(1 - self.jitter, 1 + self.jitter)
+
+    def _retry(self, item):
+        now = time.time()
+        due = now + self.next_interval(item, now)
+        if item.deadline is not None and due > item.deadline:
+            if now >= item.deadline:
+                self._fail(item, PollTimeout('Article not ready after {0} checks'.format(
+                    item.checks), item.url, item.article_id, item.response))
+                return
+            # One last check right at the deadline.
+            due = item.deadline
+        self._schedule(item, due)
+
+    def _error(self, item, error):
+        self._count('errors')
+        item.errors += 1
+        if item.errors >= self.max_errors:
+            self._fail(item, error)
+        else:
+            self._retry(item)
+
+    def _fail(self, item, error):
+        self._count('failed')
+        item.future.set_exception(error)
@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+
+"""
+readability.scheduling
+~~~~~~~~~~~~~~~~~~~~~~
+
+This module provides a scheduler sharing one concurrency limit between
+requests of different priorities.
+
+A `RequestScheduler` caps the number of requests in flight across every
+client it is given to. Once the limit is reached, requests queue up per
+priority class and free slots are handed out by weighted fair queuing:
+each class gets a share of the capacity in proportion to its weight, so
+interactive requests overtake bulk ones without starving them.
+
+    scheduler = RequestScheduler(max_in_flight=8)
+    sync_client = ReaderClient(key, secret, scheduler=scheduler, priority=BULK)
+    client = ReaderClient(key, secret, scheduler=scheduler)
+
+    with scheduler.priority(INTERACTIVE):
+        client.get_article(article_id)
+
+The priority of a request is the one set with `RequestScheduler.priority`
+in the calling thread, or else the `priority` of the client, or else the
+scheduler's `default_priority`.
+
+"""
+
+import heapq
+import itertools
+import threading
+
+from collections import Counter
+from contextlib import contextmanager
+
+from readability.histograms import LatencyHistogram
+from readability.instrumentation import timer
+
+#: Priority classes.
+INTERACTIVE, NORMAL, BULK = 'interactive', 'normal', 'bulk'
+
+#: Share of the capacity of each priority class when all of them wait.
+DEFAULT_WEIGHTS = {INTERACTIVE: 16, NORMAL: 4, BULK: 1}
+
+
+class RequestScheduler(object):
+    """
+    Limit on the requests in flight, handing free slots out by priority.
+
+    :param max_in_flight: number of requests in flight at once.
+    :param weights (optional): dict of priority class to weight, added to
+        or overriding `DEFAULT_WEIGHTS`.
+    :param default_priority: class of requests with no priority set.
+    """
+    def __init__(self, max_in_flight=8, weights=None, default_priority=NORMAL):
+        if max_in_flight < 1:
+            raise ValueError('max_in_flight must be at least 1.')
+        self.max_in_flight = max_in_flight
+        self.weights = dict(DEFAULT_WEIGHTS, **(weights or {}))
+        self.default_priority = self._check(default_priority)
+        self.in_flight = 0
+        #: Counter of requests sent, per priority class.
+        self.stats = Counter()
+        #: `LatencyHistogram` of the time requests queued, per priority
+        #: class.
+        self.waits = dict((name, LatencyHistogram()) for name in self.weights)
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        # Waiting requests, ordered by virtual finish time: a request of a
+        # class finishes 1 / weight after the later of the current virtual
+        # time and the finish of the previous request of the class.
+        self.queue = []
+        self.virtual_time = 0.0
+        self.finish_times = {}
+        self.sequence = itertools.count()
+
+    def __getstate__(self):
+        # Like `MemoryBudget`, a scheduler only limits the process it is
+        # used in.
+        return {'max_in_flight': self.max_in_flight, 'weights': self.weights,
+            'default_priority': self.default_priority}
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+    def _check(self, priority):
+        if priority not in self.weights:
+            raise ValueError('Unknown priority {0!r}, expected one of {1}'.format(
+                priority, ', '.join(sorted(self.weights))))
+        return priority
+
+    @contextmanager
+    def priority(self, priority):
+        """
+        Send the requests made by the calling thread within the block with
+        `priority`, whatever the priority of their client.
+        """
+        self._check(priority)
+        previous = getattr(self.local, 'priority', None)
+        self.local.priority = priority
+        try:
+            yield
+        finally:
+            self.local.priority = previous
+
+    def current_priority(self, default=None):
+        """
+        Priority of a request made now by the calling thread, from a client
+        whose priority is `default`.
+        """
+        return getattr(self.local, 'priority', None) or default or self.default_priority
+
+    def acquire(self, priority=None):
+        """
+        Wait for a slot, for a request of class `priority`. Every call must
+        be followed by a `release`.
+        """
+        priority = self._check(self.current_priority(priority))
+        with self.lock:
+            self.stats[priority] += 1
+            if self.in_flight < self.max_in_flight and not self.queue:
+                self.in_flight += 1
+                self.waits[priority].record(0.0)
+                return
+            finish = max(self.virtual_time, self.finish_times.get(priority, 0.0)) \
+                + 1.0 / self.weights[priority]
+            self.finish_times[priority] = finish
+            waiter = threading.Event()
+            heapq.heappush(self.queue, (finish, next(self.sequence), waiter))
+        start = timer()
+        waiter.wait()
+        self.waits[priority].record(timer() - start)
+
+    def release(self):
+        """
+        Free the slot of a finished request, handing it to the next request
+        waiting if any.
+        """
+        with self.lock:
+            if not self.queue:
+                self.in_flight -= 1
+                return
+            finish, _, waiter = heapq.heappop(self.queue)
+            self.virtual_time = finish
+        # The slot goes straight to the waiter, `in_flight` is unchanged.
+        waiter.set()
+
+    @contextmanager
+    def slot(self, priority=None):
+        """
+        Hold a slot for the duration of the block.
+        """
+        self.acquire(priority)
+        try:
+            yield
+        finally:
+            self.release()
+
+    @property
+    def waiting(self):
+        """
+        Number of requests waiting for a slot.
+        """
+        return len(self.queue)
+
+    def __repr__(self):
+        return '<RequestScheduler {0}/{1} in flight, {2} waiting>'.format(
+            self.in_flight, self.max_in_flight, self.waiting)
@@ -0,0 +1,430 @@
+# -*- coding: utf-8 -*-
+
+"""
+readability.search
+~~~~~~~~~~~~~~~~~~
+
+This module provides a local full-text index over articles returned by
+`ReaderClient.get_article` and `ParserClient.get_article`.
+
+Articles are indexed on their title, excerpt and content and ranked with
+BM25, title matches weighing the most:
+
+    index = ArticleIndex('library.idx')
+    index.add(client.get_article(article_id).json())
+    index.commit()
+    for hit in index.search('mark twain river'):
+        print(hit.score, hit.title)
+
+The index is a directory of immutable segments plus a manifest. Every
+`commit` writes the articles added since the previous one as a new
+segment, so updates never rewrite what is already on disk; once there
+are more than `max_segments`, the smallest segments are merged together,
+so that large segments are rarely rewritten. Postings are stored as
+delta-encoded varints and only read, through `mmap`, for the terms of a
+query.
+
+"""
+
+import heapq
+import json
+import math
+import mmap
+import os
+import re
+import struct
+import threading
+import zlib
+
+try:
+    from html import unescape
+except ImportError:
+    from HTMLParser import HTMLParser
+    unescape = HTMLParser().unescape
+
+from readability.utils import write_json_atomic
+
+MANIFEST = 'manifest.json'
+SEGMENT_MAGIC = b'RDIDX001'
+# Magic, then the offset of the compressed metadata following the postings.
+SEGMENT_HEADER = struct.Struct('<8sQ')
+
+#: Weight of every indexed field. Weights are integers so that weighted term
+#: frequencies stay integers in the postings.
+FIELD_WEIGHTS = {'title': 3, 'excerpt': 2, 'content': 1}
+
+STOP_WORDS = frozenset('''
+a an and are as at be but by for from has have he her his i in is it its of
+on or she that the their there they this to was were which will with you
+'''.split())
+
+TAG_RE = re.compile(r'<(script|style)\b.*?</\1\s*>|<[^>]+>', re.I | re.S)
+WORD_RE = re.compile(r'\w+', re.U)
+
+
+def tokenize(text):
+    """
+    Split text, which may hold HTML, into lowercase terms without stop
+    words.
+    """
+    if not text:
+        return []
+    text = unescape(TAG_RE.sub(' ', text))
+    return [term for term in WORD_RE.findall(text.lower())
+        if term not in STOP_WORDS and (len(term) > 1 or term.isdigit())]
+
+
+def encode_varint(value, out):
+    while value > 0x7f:
+        out.append((value & 0x7f) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def decode_varints(data, offset, end):
+    """
+    Decode the varints in `data[offset:end]`.
+    """
+    values = []
+    value = shift = 0
+    for byte in bytearray(data[offset:end]):
+        value |= (byte & 0x7f) << shift
+        if byte & 0x80:
+            shift += 7
+        else:
+            values.append(value)
+            value = shift = 0
+    return values
+
+
+class SearchHit(object):
+    """
+    An article matching a query.
+    """
+    __slots__ = ('article_id', 'score', 'title', 'url')
+
+    def __init__(self, article_id, score, title, url):
+        self.article_id = article_id
+        self.score = score
+        self.title = title
+        self.url = url
+
+    def __repr__(self):
+        return '<SearchHit {0} {1:.3f}>'.format(self.article_id, self.score)
+
+
+class Segment(object):
+    """
+    An immutable segment of the index.
+
+    Documents are numbered in the order they were added. For each term the
+    postings are a run of `(document number delta, weighted term frequency)`
+    varint pairs.
+    """
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as segment_file:
+            self.data = mmap.mmap(segment_file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, meta_offset = SEGMENT_HEADER.unpack(self.data[:SEGMENT_HEADER.size])
+        if magic != SEGMENT_MAGIC:
+            raise ValueError('{0} is not an index segment'.format(path))
+        meta = json.loads(zlib.decompress(self.data[meta_offset:]).decode('utf-8'))
+        #: `[article_id, length, title, url]` lists, by document number.
+        self.docs = meta['docs']
+        #: Terms to `[offset, end, document frequency]`.
+        self.terms = meta['terms']
+
+    @classmethod
+    def write(cls, path, docs, postings):
+        """
+        Write a segment holding `docs`, a list of `[article_id, length,
+        title, url]`, and `postings`, a dict of terms to lists of
+        `(document number, weighted frequency)` in document order.
+        """
+        blob = bytearray()
+        terms = {}
+        for term in sorted(postings):
+            start = SEGMENT_HEADER.size + len(blob)
+            previous = 0
+            for docnum, frequency in postings[term]:
+                encode_varint(docnum - previous, blob)
+                encode_varint(frequency, blob)
+                previous = docnum
+            terms[term] = [start, SEGMENT_HEADER.size + len(blob), len(postings[term])]
+        meta = zlib.compress(json.dumps({'docs': docs, 'terms': terms},
+            separators=(',', ':')).encode('utf-8'))
+        temporary = path + '.tmp'
+        with open(temporary, 'wb') as segment_file:
+            segment_file.write(SEGMENT_HEADER.pack(SEGMENT_MAGIC, SEGMENT_HEADER.size + len(blob)))
+            segment_file.write(bytes(blob))
+            segment_file.write(meta)
+            segment_file.flush()
+            os.fsync(segment_file.fileno())
+        os.rename(temporary, path)
+        return cls(path)
+
+    def postings(self, term):
+        """
+        `(document number, weighted frequency)` pairs of `term`.
+        """
+        entry = self.terms.get(term)
+        if entry is None:
+            return []
+        values = decode_varints(self.data, entry[0], entry[1])
+        pairs = []
+        docnum = 0
+        for index in range(0, len(values), 2):
+            docnum += values[index]
+            pairs.append((docnum, values[index + 1]))
+        return pairs
+
+    def close(self):
+        self.data.close()
+
+
+class ArticleIndex(object):
+    """
+    Incrementally updatable full-text index of articles, ranked with BM25.
+
+    :param path: directory of the index, created if needed.
+    :param field_weights: dict of article fields to integer weights.
+        Defaults to `FIELD_WEIGHTS`.
+    :param max_segments: segments kept before the smallest of them are
+        merged, leaving `max_segments // 2 + 1`.
+    :param k1: BM25 term frequency saturation.
+    :param b: BM25 length normalization.
+    """
+    def __init__(self, path, field_weights=None, max_segments=8, k1=1.2, b=0.75):
+        self.path = path
+        self.field_weights = field_weights or FIELD_WEIGHTS
+        self.max_segments = max_segments
+        self.k1 = k1
+        self.b = b
+        self.lock = threading.RLock()
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        manifest = os.path.join(path, MANIFEST)
+        state = {'segments': [], 'next_segment': 1, 'deleted': {}}
+        if os.path.exists(manifest):
+            with open(manifest) as manifest_file:
+                state = json.load(manifest_file)
+        self.next_segment = state['next_segment']
+        self.segments = [Segment(os.path.join(path, name)) for name in state['segments']]
+        self.by_name = dict((os.path.basename(segment.path), segment)
+            for segment in self.segments)
+        #: Deleted document numbers, by segment file name.
+        self.deleted = dict((name, set(docnums)) for name, docnums in state['deleted'].items())
+        # Where the live version of each article is.
+        self.locations = {}
+        # Sum of the lengths of live articles, for the BM25 average length.
+        self.total_length = 0
+        for segment in self.segments:
+            name = os.path.basename(segment.path)
+            deleted = self.deleted.get(name, ())
+            for docnum, doc in enumerate(segment.docs):
+                if docnum not in deleted:
+                    self.locations[doc[0]] = (name, docnum)
+                    self.total_length += doc[1]
+        self.pending = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        with self.lock:
+            pending = sum(1 for article_id in self.pending if article_id not in self.locations)
+            return len(self.locations) + pending
+
+    def __contains__(self, article_id):
+        with self.lock:
+            return article_id in self.pending or article_id in self.locations
+
+    def add(self, article):
+        """
+        Add or replace an article. It is searchable once committed.
+
+        :param article: article dict, as returned by `get_article(...).json()`,
+            or the response itself.
+        """
+        if hasattr(article, 'json'):
+            article = article.json()
+        article_id = article.get('id') or article.get('url')
+        if not article_id:
+            raise ValueError('Articles need an id or a url to be indexed.')
+        with self.lock:
+            self.pending[article_id] = article
+
+    def add_many(self, articles):
+        for article in articles:
+            self.add(article)
+        self.commit()
+
+    def remove(self, article_id):
+        with self.lock:
+            self.pending.pop(article_id, None)
+            self._delete(article_id)
+
+    def _delete(self, article_id):
+        location = self.locations.pop(article_id, None)
+        if location is not None:
+            name, docnum = location
+            self.deleted.setdefault(name, set()).add(docnum)
+            self.total_length -= self.by_name[name].docs[docnum][1]
+
+    def analyze(self, article):
+        """
+        Weighted term frequencies and weighted length of `article`.
+        """
+        frequencies = {}
+        length = 0
+        for field, weight in self.field_weights.items():
+            terms = tokenize(article.get(field))
+            length += weight * len(terms)
+            for term in terms:
+                frequencies[term] = frequencies.get(term, 0) + weight
+        return frequencies, length
+
+    def commit(self):
+        """
+        Write the articles added since the last commit as a new segment.
+        """
+        with self.lock:
+            if self.pending:
+                docs = []
+                postings = {}
+                for article_id, article in self.pending.items():
+                    self._delete(article_id)
+                    frequencies, length = self.analyze(article)
+                    docnum = len(docs)
+                    docs.append([article_id, length, article.get('title'), article.get('url')])
+                    for term, frequency in frequencies.items():
+                        postings.setdefault(term, []).append((docnum, frequency))
+                self._add_segment(docs, postings)
+                self.pending = {}
+            if len(self.segments) > self.max_segments:
+                by_size = sorted(self.segments, key=self._live_count)
+                self.merge(by_size[:len(self.segments) - self.max_segments // 2])
+            else:
+                self._save_manifest()
+
+    def _live_count(self, segment):
+        return len(segment.docs) - len(self.deleted.get(os.path.basename(segment.path), ()))
+
+    def _add_segment(self, docs, postings):
+        name = 'segment-{0:06d}.idx'.format(self.next_segment)
+        self.next_segment += 1
+        segment = Segment.write(os.path.join(self.path, name), docs, postings)
+        self.segments.append(segment)
+        self.by_name[name] = segment
+        for docnum, doc in enumerate(docs):
+            self.locations[doc[0]] = (name, docnum)
+            self.total_length += doc[1]
+        return segment
+
+    def merge(self, segments=None):
+        """
+        Merge segments into one, dropping deleted articles.
+
+        :param segments (optional): segments to merge, all of them by
+            default.
+        """
+        with self.lock:
+            old = list(self.segments if segments is None else segments)
+            docs = []
+            postings = {}
+            renumbered = {}
+            for segment in old:
+                name = os.path.basename(segment.path)
+                deleted = self.deleted.pop(name, ())
+                for docnum, doc in enumerate(segment.docs):
+                    if docnum not in deleted:
+                        renumbered[(name, docnum)] = len(docs)
+                        docs.append(doc)
+                        # Added back with the merged segment.
+                        del self.locations[doc[0]]
+                        self.total_length -= doc[1]
+                for term in segment.terms:
+                    for docnum, frequency in segment.postings(term):
+                        new_docnum = renumbered.get((name, docnum))
+                        if new_docnum is not None:
+                            postings.setdefault(term, []).append((new_docnum, frequency))
+                self.segments.remove(segment)
+                del self.by_name[name]
+            if docs:
+                self._add_segment(docs, postings)
+            self._save_manifest()
+            for segment in old:
+                segment.close()
+                os.remove(segment.path)
+
+    def _save_manifest(self):
+        write_json_atomic(os.path.join(self.path, MANIFEST), {
+            'segments': [os.path.basename(segment.path) for segment in self.segments],
+            'next_segment': self.next_segment,
+            'deleted': dict((name, sorted(docnums)) for name, docnums in self.deleted.items()),
+        })
+
+    def search(self, query, limit=10, require_all=False):
+        """
+        Rank the indexed articles against `query`. Uncommitted articles are
+        committed first.
+
+        Returns up to `limit` `SearchHit`s, best first.
+
+        :param query: free text query.
+        :param limit: maximum number of hits.
+        :param require_all: only return articles containing every term.
+        """
+        terms = sorted(set(tokenize(query)))
+        with self.lock:
+            if self.pending:
+                self.commit()
+            # Merges close segments, so the whole query runs under the lock.
+            return self._search(terms, limit, require_all)
+
+    def _search(self, terms, limit, require_all):
+        segments = self.segments
+        deleted = self.deleted
+        count = len(self.locations)
+        if not terms or not count:
+            return []
+        average_length = float(self.total_length) / count or 1.0
+
+        # Postings of deleted articles are skipped before computing document
+        # frequencies, so that scores don't depend on when segments merge.
+        postings = dict((term, []) for term in terms)
+        for segment in segments:
+            name = os.path.basename(segment.path)
+            skip = deleted.get(name, ())
+            for term in terms:
+                postings[term].extend((segment, name, docnum, frequency)
+                    for docnum, frequency in segment.postings(term) if docnum not in skip)
+        scores = {}
+        matches = {}
+        for term, matching in postings.items():
+            df = len(matching)
+            idf = math.log(1 + (count - df + 0.5) / (df + 0.5))
+            for segment, name, docnum, frequency in matching:
+                length = segment.docs[docnum][1]
+                norm = self.k1 * (1 - self.b + self.b * length / average_length)
+                key = (name, docnum)
+                scores[key] = scores.get(key, 0.0) + idf * frequency * (self.k1 + 1) / (frequency + norm)
+                matches[key] = matches.get(key, 0) + 1
+        if require_all:
+            scores = dict((key, score) for key, score in scores.items()
+                if matches[key] == len(terms))
+        hits = []
+        for (name, docnum), score in heapq.nlargest(limit, scores.items(), key=lambda item: item[1]):
+            article_id, _, title, url = self.by_name[name].docs[docnum]
+            hits.append(SearchHit(article_id, score, title, url))
+        return hits
+
+    def close(self):
+        with self.lock:
+            self.commit()
+            for segment in self.segments:
+                segment.close()
+            self.segments = []
@@ -0,0 +1,278 @@
+# -*- coding: utf-8 -*-
+
+"""
+readability.spooling
+~~~~~~~~~~~~~~~~~~~~
+
+This module keeps large response bodies out of memory.
+
+`SpoolingTransport` wraps another transport and reads response bodies in
+chunks. Bodies up to a threshold are returned in memory as usual; larger
+ones are spooled to a temporary file and returned as a `SpooledResponse`,
+whose body is read as a file or mapped with `mmap`. A `MemoryBudget`, which
+can be shared by several clients, caps the bytes held in memory by all the
+bodies being read and returned; a body that does not fit in what is left of
+it is spooled to disk too, whatever its size. The body of a response kept
+in memory counts against the budget until the response is closed or
+garbage collected.
+
+Clients set it up from their `spool_threshold` and `memory_budget`
+arguments:
+
+    budget = MemoryBudget(64 * 1024 * 1024)
+    client = ParserClient(token='...', spool_threshold=1024 * 1024, memory_budget=budget)
+    response = client.get_article(url=url)
+    if isinstance(response, SpooledResponse):
+        with response:
+            document = response.mmap()
+
+"""
+
+import logging
+import mmap
+import tempfile
+import threading
+
+from datetime import timedelta
+
+from readability.transports import (DEFAULT_READ_SIZE, BaseTransport, Headers,
+    TransportResponse, make_transport)
+
+logger = logging.getLogger(__name__)
+
+#: Bodies larger than this are spooled to disk by default.
+DEFAULT_SPOOL_THRESHOLD = 1024 * 1024
+
+
+class MemoryBudget(object):
+    """
+    Number of bytes that response bodies may hold in memory, while they are
+    read and until the responses holding them are closed, shared by every
+    transport using it.
+
+    :param limit: bytes available.
+    """
+    def __init__(self, limit):
+        self.limit = limit
+        self.in_use = 0
+        #: Highest `in_use` reached.
+        self.peak = 0
+        self.lock = threading.Lock()
+
+    def try_acquire(self, size):
+        """
+        Reserve `size` bytes if they are available. Returns whether they
+        were.
+        """
+        with self.lock:
+            if self.in_use + size > self.limit:
+                return False
+            self.in_use += size
+            self.peak = max(self.peak, self.in_use)
+            return True
+
+    def __getstate__(self):
+        # A budget only caps the memory of the process it is used in: other
+        # processes get a budget of their own, with the same limit.
+        return {'limit': self.limit}
+
+    def __setstate__(self, state):
+        self.__init__(state['limit'])
+
+    def release(self, size):
+        with self.lock:
+            self.in_use -= size
+
+    @property
+    def available(self):
+        return self.limit - self.in_use
+
+    def __repr__(self):
+        return '<MemoryBudget {0}/{1} bytes>'.format(self.in_use, self.limit)
+
+
+class Reservation(object):
+    """
+    Bytes of a `MemoryBudget` held until `release` is called, or until the
+    reservation is garbage collected.
+    """
+    def __init__(self, budget, size):
+        self.budget = budget
+        self.size = size
+
+    def release(self):
+        budget, self.budget = self.budget, None
+        if budget is not None:
+            budget.release(self.size)
+
+    __del__ = release
+
+
+class BufferedResponse(TransportResponse):
+    """
+    Response whose body is held in memory, counted against a `MemoryBudget`
+    until it is closed or garbage collected.
+    """
+    def __init__(self, status_code, reservation, **kwargs):
+        super(BufferedResponse, self).__init__(status_code, **kwargs)
+        self.reservation = reservation
+
+    def close(self):
+        self.reservation.release()
+
+
+class SpooledResponse(TransportResponse):
+    """
+    Response whose body was spooled to a temporary file.
+
+    `body` is the file, positioned at the start, and `mmap()` maps it.
+    `content`, `text` and `json()` still work but read the whole body into
+    memory. Closing the response deletes the file.
+    """
+    def __init__(self, status_code, headers=None, body=None, body_size=0, url=None,
+        reason=None, elapsed=None):
+        self.status_code = status_code
+        self.headers = Headers(headers or {})
+        self.url = url
+        self.reason = reason
+        self.elapsed = elapsed if elapsed is not None else timedelta(0)
+        self.encoding = 'utf-8'
+        self.connect_time = None
+        self.body = body
+        #: Size of the decoded body.
+        self.body_size = body_size
+        self._maps = []
+
+    @property
+    def content(self):
+        self.body.seek(0)
+        try:
+            return self.body.read()
+        finally:
+            self.body.seek(0)
+
+    def mmap(self):
+        """
+        Read only memory map of the body.
+        """
+        mapped = mmap.mmap(self.body.fileno(), 0, access=mmap.ACCESS_READ)
+        self._maps.append(mapped)
+        return mapped
+
+    def iter_content(self, chunk_size=DEFAULT_READ_SIZE):
+        self.body.seek(0)
+        while True:
+            chunk = self.body.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+
+    def close(self):
+        for mapped in self._maps:
+            try:
+                mapped.close()
+            except BufferError:
+                # Still exported, e.g. through a memoryview; the map is
+                # released with it.
+                pass
+        self._maps = []
+        self.body.close()
+
+    def __repr__(self):
+        return '<SpooledResponse [{0}] {1} bytes>'.format(self.status_code, self.body_size)
+
+
+class SpoolingTransport(BaseTransport):
+    """
+    Transport reading response bodies in chunks and spooling the large
+    ones to disk.
+
+    :param transport (optional): transport, or name of one, the requests
+        are sent with. Defaults to a `RequestsTransport`.
+    :param threshold: bodies larger than this many bytes are spooled.
+    :param budget (optional): `MemoryBudget`, or a number of bytes, capping
+        the memory held by bodies read through this transport, and
+        any other sharing the budget.
+    :param directory (optional): directory of the temporary files.
+    :param chunk_size: size of the chunks bodies are read in.
+    """
+    def __init__(self, transport=None, threshold=DEFAULT_SPOOL_THRESHOLD, budget=None,
+        directory=None, chunk_size=DEFAULT_READ_SIZE):
+        self.transport = make_transport(transport)
+        self.threshold = threshold
+        if isinstance(budget, int):
+            budget = MemoryBudget(budget)
+        self.budget = budget
+        self.directory = directory
+        self.chunk_size = chunk_size
+
+    def request(self, method, url, data=None, headers=None):
+        stream = self.transport.stream(method, url, data=data, headers=headers,
+            chunk_size=self.chunk_size)
+        budget = self.budget
+        chunks, held, spool, size = [], 0, None, 0
+        reservation = content = None
+        try:
+            for chunk in stream:
+                size += len(chunk)
+                if spool is None:
+                    if size <= self.threshold and (budget is None
+                            or budget.try_acquire(len(chunk))):
+                        chunks.append(chunk)
+                        held += len(chunk) if budget is not None else 0
+                        continue
+                    spool = self._spool(chunks)
+                    chunks = []
+                    if held:
+                        budget.release(held)
+                        held = 0
+                spool.write(chunk)
+            if spool is None and budget is not None and not budget.try_acquire(size):
+                # Joining the chunks briefly holds the body twice, and
+                # there is no room for that.
+                spool = self._spool(chunks)
+            if spool is None:
+                content = b''.join(chunks)
+                if budget is not None:
+                    # The chunks are freed, the joined body is kept.
+                    reservation = Reservation(budget, size)
+            chunks = None
+        except Exception:
+            if spool is not None:
+                spool.close()
+            raise
+        finally:
+            if held:
+                budget.release(held)
+            stream.close()
+        kwargs = {'headers': stream.headers.items(), 'url': stream.url,
+            'reason': stream.reason, 'elapsed': stream.elapsed}
+        if reservation is not None:
+            response = BufferedResponse(stream.status_code, reservation, content=content, **kwargs)
+        elif spool is None:
+            response = TransportResponse(stream.status_code, content=content, **kwargs)
+        else:
+            spool.flush()
+            spool.seek(0)
+            logger.debug('Spooled a %d bytes response body from %s', size, url)
+            response = SpooledResponse(stream.status_code, body=spool, body_size=size, **kwargs)
+        response.connect_time = stream.connect_time
+        return response
+
+    def _spool(self, chunks):
+        """
+        A temporary file holding `chunks`.
+        """
+        spool = tempfile.TemporaryFile(dir=self.directory)
+        spool.writelines(chunks)
+        return spool
+
+    def stream(self, method, url, data=None, headers=None, chunk_size=DEFAULT_READ_SIZE):
+        return self.transport.stream(method, url, data=data, headers=headers,
+            chunk_size=chunk_size)
+
+    def warmup(self, url, connections):
+        return self.transport.warmup(url, connections)
+
+    def close(self):
+        self.transport.close()
@@ -0,0 +1,973 @@
+# -*- coding: utf-8 -*-
+
+"""
+readability.testing
+~~~~~~~~~~~~~~~~~~~
+
+This module provides an in-process stand-in for the Readability Reader and
+Parser APIs so that the clients can be exercised, and benchmarked, without
+network access.
+
+The server is started on a free local port and exposes the url templates
+that should be passed to the clients as `base_url_template`:
+
+    with FakeReadabilityServer(bookmark_count=200) as server:
+        token = xauth(base_url_template=server.reader_url_template,
+            consumer_key=server.consumer_key,
+            consumer_secret=server.consumer_secret,
+            username='user', password='password')
+        client = ReaderClient(token[0], token[1],
+            base_url_template=server.reader_url_template,
+            consumer_key=server.consumer_key,
+            consumer_secret=server.consumer_secret)
+
+oAuth signatures are not verified; the Reader endpoints only check that the
+request carries an `OAuth` Authorization header for a known consumer key and
+token.
+
+"""
+
+import hashlib
+import json
+import logging
+import random
+import re
+import threading
+import time
+import zlib
+
+from collections import Counter
+from datetime import datetime, timedelta
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+try:
+    from socketserver import ThreadingMixIn
+except ImportError:
+    from SocketServer import ThreadingMixIn
+try:
+    from urllib.parse import parse_qsl, urlsplit
+except ImportError:
+    from urlparse import parse_qsl, urlsplit
+
+
+logger = logging.getLogger(__name__)
+
+READER_PREFIX = '/api/rest/v1/'
+PARSER_PREFIX = '/api/content/v1/'
+DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+DEFAULT_USERS = {'user': 'password'}
+
+# Bookmark filters whose values are dates, mapped to the bookmark field they
+# are compared against.
+DATE_FILTERS = {
+    'added': 'date_added',
+    'archived': 'date_archived',
+    'favorited': 'date_favorited',
+    'opened': 'date_opened',
+    'updated': 'date_updated',
+}
+
+WORDS = (
+    'the of and to in is was for on that with as by at from his her an '
+    'which were are this be had not but have it river steamboat pilot '
+    'mississippi author novel humor adventure town boy raft island journey '
+    'letter lecture essay printer newspaper west mining silver fortune '
+    'travel europe holy land satire innocents abroad publishing company '
+    'family daughter wife house hartford connecticut elmira new york'
+).split()
+
+
+def format_date(value):
+    """
+    Format a datetime the way the Readability API does.
+    """
+    if value is None:
+        return None
+    return value.strftime(DATE_FORMAT)
+
+
+def parse_date(value):
+    """
+    Parse a date filter value as sent by the clients (ISO 8601).
+    """
+    value = value.replace('T', ' ')
+    value = re.split(r'[+Z]', value)[0]
+    for fmt in ('%Y-%m-%d %H:%M:%S.%f', DATE_FORMAT, '%Y-%m-%d'):
+        try:
+            return datetime.strptime(value, fmt)
+        except ValueError:
+            continue
+    raise ValueError('Unparseable date {0!r}'.format(value))
+
+
+def stable_seed(*parts):
+    """
+    Seed derived from `parts` that is stable across processes.
+    """
+    digest = hashlib.md5('|'.join(str(p) for p in parts).encode('utf-8'))
+    return int(digest.hexdigest()[:12], 16)
+
+
+class FakeResponse(object):
+    """
+    Status, headers and body produced by `FakeReadabilityApp`.
+    """
+    def __init__(self, status, body=b'', headers=None):
+        self.status = status
+        self.headers = headers or {}
+        if not isinstance(body, bytes):
+            if not isinstance(body, str):
+                body = json.dumps(body)
+                self.headers.setdefault('Content-Type', 'application/json')
+            body = body.encode('utf-8')
+        self.body = body
+
+
+class FakeDataset(object):
+    """
+    Articles, bookmarks, tags and users served by the fake API.
+
+    :param users: dict mapping usernames to passwords.
+    :param bookmark_count: number of bookmarks each user starts with.
+    :param article_size: approximate size in bytes of generated article
+        content.
+    :param seed: seed used to generate the data.
+    """
+    def __init__(self, users=None, bookmark_count=0, article_size=4096, seed=0):
+        self.lock = threading.RLock()
+        self.seed = seed
+        self.article_size = article_size
+        self.users = {}
+        self.articles = {}
+        self.articles_by_url = {}
+        self.bookmarks = {}
+        self.tags = {}
+        self.next_bookmark_id = 1
+        self.next_tag_id = 1
+        self.epoch = datetime(2013, 1, 1)
+        rand = random.Random(seed)
+        # Article content is stitched together from a pool of paragraphs,
+        # which keeps generating large datasets fast.
+        self.paragraphs = ['<p>{0}.</p>'.format(
+            ' '.join(rand.choice(WORDS) for _ in range(60)).capitalize())
+            for _ in range(64)]
+        for index, (username, password) in enumerate(sorted((users or DEFAULT_USERS).items())):
+            self.add_user(index + 1, username, password)
+        for user in self.users.values():
+            rand = random.Random(stable_seed(seed, user['username']))
+            for index in range(bookmark_count):
+                url = 'http://example{0}.com/{1}/article-{2}.html'.format(
+                    rand.randint(0, 9), user['username'], index)
+                added = self.epoch + timedelta(minutes=index)
+                self.add_bookmark(user, url,
+                    favorite=rand.random() < 0.2,
+                    archive=rand.random() < 0.3,
+                    now=added)
+
+    def add_user(self, user_id, username, password):
+        token = hashlib.sha1('{0}:{1}'.format(self.seed, username).encode('utf-8')).hexdigest()
+        self.users[token[:16]] = {
+            'id': user_id,
+            'username': username,
+            'password': password,
+            'token_key': token[:16],
+            'token_secret': token[16:32],
+            'first_name': username.title(),
+            'last_name': 'Tester',
+            'date_joined': format_date(self.epoch),
+            'email_into_address': '{0}@inbox.readability.com'.format(username),
+            'has_active_subscription': False,
+            'reading_limit': 0,
+            'kindle_email_address': None,
+            'tags': [],
+            'avatar_url': None,
+        }
+
+    def user_for_token(self, token_key):
+        return self.users.get(token_key)
+
+    def user_for_credentials(self, username, password):
+        for user in self.users.values():
+            if user['username'] == username and user['password'] == password:
+                return user
+        return None
+
+    def article_for_url(self, url, max_pages=25, content=None):
+        """
+        Return the article for `url`, generating it on first request.
+        """
+        with self.lock:
+            article = self.articles_by_url.get(url)
+            if article is None or content is not None:
+                article = self.make_article(url, max_pages, content)
+                self.articles[article['id']] = article
+                self.articles_by_url[url] = article
+            return article
+
+    def make_article(self, url, max_pages=25, content=None):
+        rand = random.Random(stable_seed(self.seed, url))
+        article_id = ''.join(rand.choice('abcdefghijklmnopqrstuvwxyz0123456789') for _ in range(8))
+        title = ' '.join(rand.choice(WORDS) for _ in range(6)).capitalize()
+        if content is None:
+            paragraphs = []
+            size = 0
+            while size < self.article_size:
+                paragraph = rand.choice(self.paragraphs)
+                paragraphs.append(paragraph)
+                size += len(paragraph)
+            content = '<div>{0}</div>'.format(''.join(paragraphs))
+        else:
+            match = re.search(r'<title[^>]*>(.*?)</title>', content, re.I | re.S)
+            if match:
+                title = match.group(1).strip()
+        text = re.sub(r'<[^>]+>', ' ', content)
+        words = text.split()
+        domain = urlsplit(url).netloc
+        return {
+            'id': article_id,
+            'url': url,
+            'domain': domain,
+            'title': title,
+            'author': 'Mark Twain',
+            'content': content,
+            'excerpt': ' '.join(words[:40]),
+            'word_count': len(words),
+            'direction': 'ltr',
+            'processed': True,
+            'short_url': 'http://rdd.me/{0}'.format(article_id),
+            'date_published': format_date(self.epoch - timedelta(days=rand.randint(0, 3000))),
+            'lead_image_url': None,
+            'next_page_id': None,
+            'next_page_href': None,
+            'total_pages': 1,
+            'rendered_pages': 1,
+            'dek': None,
+        }
+
+    def add_bookmark(self, user, url, favorite=False, archive=False, now=None):
+        with self.lock:
+            now = now or datetime.utcnow().replace(microsecond=0)
+            article = self.article_for_url(url)
+            bookmark = {
+                'id': self.next_bookmark_id,
+                'user_id': user['id'],
+                'read_percent': '0.00',
+                'date_added': format_date(now),
+                'date_updated': format_date(now),
+                'date_opened': None,
+                'date_archived': format_date(now) if archive else None,
+                'date_favorited': format_date(now) if favorite else None,
+                'favorite': bool(favorite),
+                'archive': bool(archive),
+                'article_href': '{0}articles/{1}'.format(READER_PREFIX, article['id']),
+                'article': self.article_summary(article),
+                'tags': [],
+                'deleted': False,
+            }
+            self.next_bookmark_id += 1
+            self.bookmarks[bookmark['id']] = bookmark
+            return bookmark
+
+    def article_summary(self, article):
+        fields = ('id', 'domain', 'title', 'url', 'excerpt', 'word_count',
+            'processed', 'author', 'date_published', 'lead_image_url', 'dek')
+        return dict((field, article[field]) for field in fields)
+
+    def user_bookmarks(self, user, deleted=False):
+        return [bm for bm in self.bookmarks.values()
+            if bm['user_id'] == user['id'] and bm['deleted'] == deleted]
+
+    def user_bookmark(self, user, bookmark_id):
+        try:
+            bookmark = self.bookmarks.get(int(bookmark_id))
+        except ValueError:
+            return None
+        if bookmark is None or bookmark['user_id'] != user['id'] or bookmark['deleted']:
+            return None
+        return bookmark
+
+    def tag_for_text(self, user, text):
+        with self.lock:
+            for tag in self.tags.values():
+                if tag['user_id'] == user['id'] and tag['text'] == text:
+                    return tag
+            tag = {'id': self.next_tag_id, 'user_id': user['id'], 'text': text}
+            self.next_tag_id += 1
+            self.tags[tag['id']] = tag
+            return tag
+
+    def tag_json(self, tag):
+        bookmark_ids = [bm['id'] for bm in self.bookmarks.values()
+            if not bm['deleted'] and tag['id'] in [t['id'] for t in bm['tags']]]
+        return {
+            'id': tag['id'],
+            'text': tag['text'],
+            'applied_count': len(bookmark_ids),
+            'bookmark_ids': bookmark_ids,
+        }
+
+    def user_tags(self, user):
+        tags = [self.tag_json(tag) for tag in self.tags.values() if tag['user_id'] == user['id']]
+        return [tag for tag in tags if tag['applied_count']]
+
+
+def bookmark_json(bookmark):
+    """
+    Public representation of a stored bookmark.
+    """
+    out = dict(bookmark)
+    out.pop('deleted')
+    out['tags'] = [dict(tag) for tag in bookmark['tags']]
+    return out
+
+
+class FakeReadabilityApp(object):
+    """
+    Request routing and behaviour of the fake API, independent of HTTP.
+
+    :param dataset: `FakeDataset` to serve.
+    :param consumer_key: Reader API consumer key that is accepted.
+    :param consumer_secret: Reader API consumer secret.
+    :param parser_token: Parser API token that is accepted.
+    :param latency: seconds to sleep before answering. Either a number, a
+        `(low, high)` tuple for uniformly distributed latencies, or a
+        callable returning the number of seconds.
+    :param error_rate: fraction of requests, between 0 and 1, that are
+        answered with `error_status` instead of being served.
+    :param error_status: status code used for injected errors.
+    :param seed: seed for latency and error injection.
+    :param processing_time: seconds a Parser API article stays
+        `UNRETRIEVED` after it is first requested, before it is `FETCHED`.
+        Either a number, or a `(low, high)` tuple for times drawn uniformly
+        per article.
+    """
+    def __init__(self, dataset, consumer_key='consumer_key',
+        consumer_secret='consumer_secret', parser_token='parser_token',
+        latency=0, error_rate=0.0, error_status=500, seed=0, processing_time=0):
+        self.dataset = dataset
+        self.consumer_key = consumer_key
+        self.consumer_secret = consumer_secret
+        self.parser_token = parser_token
+        self.latency = latency
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.random = random.Random(seed)
+        self.random_lock = threading.Lock()
+        self.processing_time = processing_time
+        # Time each Parser API article was first requested at.
+        self.first_requested = {}
+        self.stats = Counter()
+        self.stats_lock = threading.Lock()
+        #: Bytes that went over the wire, keyed by `'received'` and `'sent'`.
+        self.traffic = Counter()
+        self.routes = [
+            ('POST', READER_PREFIX + 'oauth/access_token/$', self.access_token, False),
+            ('GET', READER_PREFIX + 'articles/(?P<article_id>[^/]+)$', self.reader_article, True),
+            ('GET', READER_PREFIX + 'bookmarks$', self.list_bookmarks, True),
+            ('POST', READER_PREFIX + 'bookmarks$', self.create_bookmark, True),
+            ('GET', READER_PREFIX + r'bookmarks/(?P<bookmark_id>\d+)$', self.get_bookmark, True),
+            ('POST', READER_PREFIX + r'bookmarks/(?P<bookmark_id>\d+)$', self.update_bookmark, True),
+            ('DELETE', READER_PREFIX + r'bookmarks/(?P<bookmark_id>\d+)$', self.delete_bookmark, True),
+            ('GET', READER_PREFIX + r'bookmarks/(?P<bookmark_id>\d+)/tags$', self.bookmark_tags, True),
+            ('POST', READER_PREFIX + r'bookmarks/(?P<bookmark_id>\d+)/tags$', self.add_bookmark_tags, True),
+            ('DELETE', READER_PREFIX + r'bookmarks/(?P<bookmark_id>\d+)/tags/(?P<tag_id>\d+)$', self.delete_bookmark_tag, True),
+            ('GET', READER_PREFIX + 'tags$', self.list_tags, True),
+            ('GET', READER_PREFIX + r'tags/(?P<tag_id>\d+)$', self.get_tag, True),
+            ('GET', READER_PREFIX + 'users/_current$', self.current_user, True),
+            ('GET', PARSER_PREFIX + '$', self.parser_root, False),
+            ('GET', PARSER_PREFIX + 'parser$', self.parse, False),
+            ('HEAD', PARSER_PREFIX + 'parser$', self.parse, False),
+            ('POST', PARSER_PREFIX + 'parser$', self.parse_content, False),
+            ('GET', PARSER_PREFIX + 'confidence$', self.confidence, False),
+        ]
+        self.routes = [(method, re.compile(pattern), handler, reader_auth)
+            for method, pattern, handler, reader_auth in self.routes]
+
+    def handle(self, method, path, headers, body=b''):
+        """
+        Serve a single request and return a `FakeResponse`.
+
+        :param method: HTTP method.
+        :param path: request path including the query string.
+        :param headers: dict of request headers.
+        :param body: raw request body.
+        """
+        parts = urlsplit(path)
+        query = dict(parse_qsl(parts.query, keep_blank_values=True))
+        self.sleep()
+        with self.stats_lock:
+            self.stats[(method, parts.path)] += 1
+        if self.inject_error():
+            return FakeResponse(self.error_status, {'error': 'Injected error'})
+
+        path_matched = False
+        for route_method, pattern, handler, reader_auth in self.routes:
+            match = pattern.match(parts.path)
+            if match is None:
+                continue
+            path_matched = True
+            if route_method != method:
+                continue
+            request = {
+                'method': method,
+                'query': query,
+                'headers': dict((k.lower(), v) for k, v in headers.items()),
+                'body': body,
+                'args': match.groupdict(),
+            }
+            if parts.path.startswith(PARSER_PREFIX):
+                if query.get('token') != self.parser_token:
+                    return FakeResponse(401, {'error': 'Invalid token'})
+            if reader_auth:
+                request['user'] = self.authenticate(request['headers'])
+                if request['user'] is None:
+                    return FakeResponse(401, {'error': 'Not authorized'})
+            with self.dataset.lock:
+                response = handler(request)
+            return self.conditional(request, response)
+        if path_matched:
+            return FakeResponse(405, {'error': 'Method not allowed'})
+        return FakeResponse(404, {'error': 'Not found'})
+
+    def conditional(self, request, response):
+        """
+        Tag successful GET responses with an `ETag`, and answer 304 Not
+        Modified when it matches the request's `If-None-Match`.
+        """
+        if request['method'] != 'GET' or response.status != 200:
+            return response
+        etag = '"{0}"'.format(hashlib.md5(response.body).hexdigest())
+        response.headers['ETag'] = etag
+        if etag in request['headers'].get('if-none-match', ''):
+            return FakeResponse(304, b'', {'ETag': etag})
+        return response
+
+    def sleep(self):
+        latency = self.latency
+        if callable(latency):
+            latency = latency()
+        elif isinstance(latency, (tuple, list)):
+            with self.random_lock:
+                latency = self.random.uniform(*latency)
+        if latency:
+            time.sleep(latency)
+
+    def inject_error(self):
+        if not self.error_rate:
+            return False
+        with self.random_lock:
+            return self.random.random() < self.error_rate
+
+    def authenticate(self, headers):
+        header = headers.get('authorization', '')
+        if not header.startswith('OAuth'):
+            return None
+        params = dict(re.findall(r'(\w+)="([^"]*)"', header))
+        if params.get('oauth_consumer_key') != self.consumer_key:
+            return None
+        return self.dataset.user_for_token(params.get('oauth_token'))
+
+    def form(self, request):
+        body = request['body']
+        if isinstance(body, bytes):
+            body = body.decode('utf-8')
+        return dict(parse_qsl(body, keep_blank_values=True))
+
+    # Reader API
+
+    def access_token(self, request):
+        form = self.form(request)
+        if form.get('oauth_consumer_key') != self.consumer_key or form.get('x_auth_mode') != 'client_auth':
+            return FakeResponse(401, 'Invalid consumer.')
+        user = self.dataset.user_for_credentials(
+            form.get('x_auth_username'), form.get('x_auth_password'))
+        if user is None:
+            return FakeResponse(401, 'Invalid credentials.')
+        body = 'oauth_token={0}&oauth_token_secret={1}&oauth_callback_confirmed=true'.format(
+            user['token_key'], user['token_secret'])
+        return FakeResponse(200, body, {'Content-Type': 'application/x-www-form-urlencoded'})
+
+    def reader_article(self, request):
+        article = self.dataset.articles.get(request['args']['article_id'])
+        if article is None:
+            return FakeResponse(404, {'error_message': 'Not found'})
+        return FakeResponse(200, article)
+
+    def filter_bookmarks(self, request):
+        query = request['query']
+        bookmarks = self.dataset.user_bookmarks(
+            request['user'], deleted=query.get('only_deleted') == '1')
+        for flag in ('archive', 'favorite'):
+            if flag in query:
+                wanted = query[flag] == '1'
+                bookmarks = [bm for bm in bookmarks if bm[flag] == wanted]
+        if query.get('domain'):
+            bookmarks = [bm for bm in bookmarks if bm['article']['domain'] == query['domain']]
+        if query.get('tags'):
+            wanted = set(tag.strip() for tag in query['tags'].split(',') if tag.strip())
+            bookmarks = [bm for bm in bookmarks
+                if wanted.issubset(set(tag['text'] for tag in bm['tags']))]
+        for prefix, field in DATE_FILTERS.items():
+            since = query.get(prefix + '_since')
+            until = query.get(prefix + '_until')
+            if since:
+                since = parse_date(since)
+                bookmarks = [bm for bm in bookmarks
+                    if bm[field] and parse_date(bm[field]) >= since]
+            if until:
+                until = parse_date(until)
+                bookmarks = [bm for bm in bookmarks
+                    if bm[field] and parse_date(bm[field]) <= until]
+        order = query.get('order', '-date_added')
+        reverse = order.startswith('-')
+        key = order.lstrip('-')
+        if key not in ('date_added', 'date_updated'):
+            key = 'date_added'
+        bookmarks.sort(key=lambda bm: (bm[key] or '', bm['id']), reverse=reverse)
+        return bookmarks
+
+    def list_bookmarks(self, request):
+        query = request['query']
+        bookmarks = self.filter_bookmarks(request)
+        try:
+            page = max(int(query.get('page', 1)), 1)
+            per_page = min(max(int(query.get('per_page', 20)), 1), 50)
+        except ValueError:
+            return FakeResponse(400, {'error': 'Invalid paging'})
+        total = len(bookmarks)
+        num_pages = max((total + per_page - 1) // per_page, 1)
+        window = bookmarks[(page - 1) * per_page:page * per_page]
+        return FakeResponse(200, {
+            'meta': {
+                'num_pages': num_pages,
+                'page': page,
+                'item_count_total': total,
+                'item_count': len(window),
+            },
+            'conditions': dict(query),
+            'bookmarks': [bookmark_json(bm) for bm in window],
+        })
+
+    def create_bookmark(self, request):
+        form = self.form(request)
+        url = form.get('url')
+        if not url:
+            return FakeResponse(400, {'error': 'Missing url'})
+        user = request['user']
+        if form.get('allow_duplicates', '1') == '0':
+            for bookmark in self.dataset.user_bookmarks(user):
+                if bookmark['article']['url'] == url:
+                    return FakeResponse(409, {'error': 'Duplicate'},
+                        {'Location': '{0}bookmarks/{1}'.format(READER_PREFIX, bookmark['id'])})
+        bookmark = self.dataset.add_bookmark(user, url,
+            favorite=form.get('favorite') == '1',
+            archive=form.get('archive') == '1')
+        return FakeResponse(202, b'', {
+            'Location': '{0}bookmarks/{1}'.format(READER_PREFIX, bookmark['id']),
+            'X-Article-Location': bookmark['article_href'],
+        })
+
+    def get_bookmark(self, request):
+        bookmark = self.dataset.user_bookmark(request['user'], request['args']['bookmark_id'])
+        if bookmark is None:
+            return FakeResponse(404, {'error_message': 'Not found'})
+        return FakeResponse(200, bookmark_json(bookmark))
+
+    def update_bookmark(self, request):
+        bookmark = self.dataset.user_bookmark(request['user'], request['args']['bookmark_id'])
+        if bookmark is None:
+            return FakeResponse(404, {'error_message': 'Not found'})
+        form = self.form(request)
+        now = format_date(datetime.utcnow())
+        for flag, date_field in (('favorite', 'date_favorited'), ('archive', 'date_archived')):
+            if flag in form:
+                value = form[flag] == '1'
+                if value != bookmark[flag]:
+                    bookmark[date_field] = now if value else None
+                bookmark[flag] = value
+        if 'read_percent' in form:
+            try:
+                bookmark['read_percent'] = '{0:.2f}'.format(float(form['read_percent']))
+            except ValueError:
+                return FakeResponse(400, {'error': 'Invalid read_percent'})
+            bookmark['date_opened'] = bookmark['date_opened'] or now
+        bookmark['date_updated'] = now
+        return FakeResponse(200, bookmark_json(bookmark))
+
+    def delete_bookmark(self, request):
+        bookmark = self.dataset.user_bookmark(request['user'], request['args']['bookmark_id'])
+        if bookmark is None:
+            return FakeResponse(404, {'error_message': 'Not found'})
+        bookmark['deleted'] = True
+        bookmark['date_updated'] = format_date(datetime.utcnow())
+        return FakeResponse(204)
+
+    def bookmark_tags(self, request):
+        bookmark = self.dataset.user_bookmark(request['user'], request['args']['bookmark_id'])
+        if bookmark is None:
+            return FakeResponse(404, {'error_message': 'Not found'})
+        return FakeResponse(200, {'tags': [dict(tag) for tag in bookmark['tags']]})
+
+    def add_bookmark_tags(self, request):
+        bookmark = self.dataset.user_bookmark(request['user'], request['args']['bookmark_id'])
+        if bookmark is None:
+            return FakeResponse(404, {'error_message': 'Not found'})
+        texts = [text.strip() for text in self.form(request).get('tags', '').split(',')]
+        for text in texts:
+            if not text or text in [tag['text'] for tag in bookmark['tags']]:
+                continue
+            tag = self.dataset.tag_for_text(request['user'], text)
+            bookmark['tags'].append({'id': tag['id'], 'text': tag['text']})
+        bookmark['date_updated'] = format_date(datetime.utcnow())
+        return FakeResponse(202, {'tags': [dict(tag) for tag in bookmark['tags']]})
+
+    def delete_bookmark_tag(self, request):
+        bookmark = self.dataset.user_bookmark(request['user'], request['args']['bookmark_id'])
+        if bookmark is None:
+            return FakeResponse(404, {'error_message': 'Not found'})
+        tag_id = int(request['args']['tag_id'])
+        remaining = [tag for tag in bookmark['tags'] if tag['id'] != tag_id]
+        if len(remaining) == len(bookmark['tags']):
+            return FakeResponse(404, {'error_message': 'Not found'})
+        bookmark['tags'] = remaining
+        bookmark['date_updated'] = format_date(datetime.utcnow())
+        return FakeResponse(204)
+
+    def list_tags(self, request):
+        return FakeResponse(200, {'tags': self.dataset.user_tags(request['user'])})
+
+    def get_tag(self, request):
+        tag = self.dataset.tags.get(int(request['args']['tag_id']))
+        if tag is None or tag['user_id'] != request['user']['id']:
+            return FakeResponse(404, {'error_message': 'Not found'})
+        return FakeResponse(200, self.dataset.tag_json(tag))
+
+    def current_user(self, request):
+        user = request['user']
+        fields = ('username', 'first_name', 'last_name', 'date_joined',
+            'email_into_address', 'has_active_subscription', 'reading_limit',
+            'kindle_email_address', 'tags', 'avatar_url')
+        return FakeResponse(200, dict((field, user[field]) for field in fields))
+
+    # Parser API
+
+    def parser_root(self, request):
+        return FakeResponse(200, {'resources': {
+            'parser': {'description': 'The Content Parser Resource', 'href': PARSER_PREFIX + 'parser'},
+            'confidence': {'description': 'The Content Confidence Resource', 'href': PARSER_PREFIX + 'confidence'},
+        }})
+
+    def lookup_article(self, query):
+        if query.get('url'):
+            return self.dataset.article_for_url(query['url'])
+        if query.get('article_id'):
+            return self.dataset.articles.get(query['article_id'])
+        return None
+
+    def article_status(self, article):
+        if not self.processing_time:
+            return 'FETCHED'
+        now = time.time()
+        with self.stats_lock:
+            requested = self.first_requested.setdefault(article['id'], now)
+        processing_time = self.processing_time
+        if isinstance(processing_time, tuple):
+            low, high = processing_time
+            rand = random.Random(stable_seed(self.dataset.seed, 'processing', article['id']))
+            processing_time = rand.uniform(low, high)
+        return 'FETCHED' if now - requested >= processing_time else 'UNRETRIEVED'
+
+    def article_headers(self, article):
+        return {'X-Article-Id': article['id'], 'X-Article-Status': self.article_status(article)}
+
+    def parse(self, request):
+        query = request['query']
+        if not query.get('url') and not query.get('article_id'):
+            return FakeResponse(400, {'messages': 'Either url or article_id is required.', 'error': True})
+        article = self.lookup_article(query)
+        if article is None:
+            return FakeResponse(404, {'messages': 'Not found', 'error': True})
+        return FakeResponse(200, article, self.article_headers(article))
+
+    def posted_document(self, request):
+        """
+        Extract the document from a form, raw or multipart POST body.
+        """
+        content_type = request['headers'].get('content-type', '')
+        if content_type.startswith('multipart/form-data'):
+            doc = parse_multipart(request['body'], content_type).get('doc')
+        elif content_type.startswith('text/html'):
+            doc = request['body']
+        else:
+            return self.form(request).get('doc')
+        return doc.decode('utf-8') if doc else None
+
+    def parse_content(self, request):
+        query = request['query']
+        doc = self.posted_document(request)
+        if not query.get('url') or not doc:
+            return FakeResponse(400, {'messages': 'Both url and doc are required.', 'error': True})
+        article = self.dataset.article_for_url(query['url'], content=doc)
+        return FakeResponse(200, article, self.article_headers(article))
+
+    def confidence(self, request):
+        query = request['query']
+        if not query.get('url') and not query.get('article_id'):
+            return FakeResponse(400, {'messages': 'Either url or article_id is required.', 'error': True})
+        key = query.get('url') or query.get('article_id')
+        score = random.Random(stable_seed(self.dataset.seed, 'confidence', key)).random()
+        return FakeResponse(200, {'url': query.get('url'), 'confidence': round(score, 3)})
+
+
+def parse_multipart(body, content_type):
+    """
+    Parse a `multipart/form-data` body into a dict of field names to bytes.
+    """
+    boundary = re.search(r'boundary="?([^";]+)"?', content_type).group(1)
+    fields = {}
+    for part in body.split(b'--' + boundary.encode('ascii')):
+        if part.startswith(b'\r\n'):
+            part = part[2:]
+        if part.endswith(b'\r\n'):
+            part = part[:-2]
+        if not part or part.startswith(b'--'):
+            continue
+        head, _, value = part.partition(b'\r\n\r\n')
+        name = re.search(br'name="([^"]*)"', head)
+        if name:
+            fields[name.group(1).decode('utf-8')] = value
+    return fields
+
+
+def read_chunked(rfile):
+    """
+    Read a request body sent with chunked transfer encoding.
+    """
+    chunks = []
+    while True:
+        size = int(rfile.readline().split(b';', 1)[0].strip() or b'0', 16)
+        if not size:
+            break
+        chunks.append(rfile.read(size))
+        rfile.readline()
+    # Skip the trailers, up to the empty line ending the body.
+    while rfile.readline() not in (b'\r\n', b'\n', b''):
+        pass
+    return b''.join(chunks)
+
+
+def decode_body(body, content_encoding):
+    """
+    Undo the `Content-Encoding` of a request body.
+    """
+    if content_encoding == 'gzip':
+        return zlib.decompress(body, 16 + zlib.MAX_WBITS)
+    if content_encoding == 'deflate':
+        return zlib.decompress(body)
+    return body
+
+
+def encode_body(body, accept_encoding):
+    """
+    Compress a response body if the client accepts it. Returns the body and
+    the `Content-Encoding` used, if any.
+    """
+    accepted = [coding.split(';')[0].strip() for coding in accept_encoding.split(',')]
+    if 'gzip' in accepted:
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        return compressor.compress(body) + compressor.flush(), 'gzip'
+    if 'deflate' in accepted:
+        return zlib.compress(body), 'deflate'
+    return body, None
+
+
+class FakeRequestHandler(BaseHTTPRequestHandler):
+    """
+    Adapts HTTP requests to `FakeReadabilityApp.handle`.
+    """
+    protocol_version = 'HTTP/1.1'
+    # Headers and body are written separately; without TCP_NODELAY every
+    # response larger than a segment waits on the client's delayed ACK.
+    disable_nagle_algorithm = True
+
+    # Responses smaller than this are never compressed.
+    compress_min_size = 1024
+
+    def do_request(self):
+        app = self.server.app
+        if 'chunked' in self.headers.get('Transfer-Encoding', '').lower():
+            body = read_chunked(self.rfile)
+        else:
+            length = int(self.headers.get('Content-Length') or 0)
+            body = self.rfile.read(length) if length else b''
+        received = len(body)
+        body = decode_body(body, self.headers.get('Content-Encoding'))
+        response = app.handle(self.command, self.path,
+            dict(self.headers.items()), body)
+        payload = response.body
+        if self.server.compress_responses and len(payload) >= self.compress_min_size:
+            payload, content_encoding = encode_body(payload,
+                self.headers.get('Accept-Encoding', ''))
+            if content_encoding:
+                response.headers['Content-Encoding'] = content_encoding
+        # Count the traffic before answering, so that it is up to date as
+        # soon as the client has its response.
+        with app.stats_lock:
+            app.traffic['received'] += received
+            app.traffic['sent'] += len(payload) if self.command != 'HEAD' else 0
+        self.send_response(response.status)
+        for name, value in response.headers.items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(payload)
+
+    do_GET = do_POST = do_HEAD = do_DELETE = do_request
+
+    def log_message(self, format, *args):
+        logger.debug('%s - %s', self.address_string(), format % args)
+
+
+class FakeHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+    request_queue_size = 128
+
+
+class FakeReadabilityServer(object):
+    """
+    Threaded local HTTP server implementing the Reader and Parser APIs.
+
+    :param users: dict mapping usernames to passwords. Defaults to a single
+        `user` / `password` account.
+    :param bookmark_count: number of bookmarks each user starts with.
+    :param article_size: approximate size in bytes of generated articles.
+    :param consumer_key: Reader API consumer key that is accepted.
+    :param consumer_secret: Reader API consumer secret.
+    :param parser_token: Parser API token that is accepted.
+    :param latency: per request latency; see `FakeReadabilityApp`.
+    :param error_rate: fraction of requests answered with an error.
+    :param error_status: status code used for injected errors.
+    :param seed: seed for the generated data, latencies and errors.
+    :param processing_time: time Parser API articles take to be ready;
+        see `FakeReadabilityApp`.
+    :param compress_responses: gzip or deflate responses of 1KB and more
+        when the client sends a matching `Accept-Encoding`.
+    :param host: interface to listen on.
+    :param port: port to listen on. The default picks a free port.
+    """
+    def __init__(self, users=None, bookmark_count=0, article_size=4096,
+        consumer_key='consumer_key', consumer_secret='consumer_secret',
+        parser_token='parser_token', latency=0, error_rate=0.0,
+        error_status=500, seed=0, processing_time=0, compress_responses=True,
+        host='127.0.0.1', port=0):
+        self.dataset = FakeDataset(users=users, bookmark_count=bookmark_count,
+            article_size=article_size, seed=seed)
+        self.app = FakeReadabilityApp(self.dataset,
+            consumer_key=consumer_key,
+            consumer_secret=consumer_secret,
+            parser_token=parser_token,
+            latency=latency,
+            error_rate=error_rate,
+            error_status=error_status,
+            seed=seed,
+            processing_time=processing_time)
+        self.compress_responses = compress_responses
+        self.host = host
+        self.port = port
+        self.httpd = None
+        self.thread = None
+
+    @property
+    def consumer_key(self):
+        return self.app.consumer_key
+
+    @property
+    def consumer_secret(self):
+        return self.app.consumer_secret
+
+    @property
+    def parser_token(self):
+        return self.app.parser_token
+
+    @property
+    def stats(self):
+        """
+        Counter of requests served, keyed by `(method, path)`.
+        """
+        return self.app.stats
+
+    @property
+    def traffic(self):
+        """
+        Counter of bytes `'received'` and `'sent'` over the wire.
+        """
+        return self.app.traffic
+
+    @property
+    def url(self):
+        return 'http://{0}:{1}'.format(self.host, self.port)
+
+    @property
+    def reader_url_template(self):
+        return self.url + READER_PREFIX + '{}'
+
+    @property
+    def parser_url_template(self):
+        return self.url + PARSER_PREFIX + '{}'
+
+    def token_for(self, username):
+        """
+        Return the `(token_key, token_secret)` pair of `username`.
+        """
+        for user in self.dataset.users.values():
+            if user['username'] == username:
+                return user['token_key'], user['token_secret']
+        raise KeyError(username)
+
+    def client_kwargs(self, client='reader'):
+        """
+        Keyword arguments that point a client at this server.
+
+        :param client: `'reader'` or `'parser'`.
+        """
+        if client == 'parser':
+            return {
+                'token': self.parser_token,
+                'base_url_template': self.parser_url_template,
+            }
+        return {
+            'consumer_key': self.consumer_key,
+            'consumer_secret': self.consumer_secret,
+            'base_url_template': self.reader_url_template,
+        }
+
+    def start(self):
+        self.httpd = FakeHTTPServer((self.host, self.port), FakeRequestHandler)
+        self.httpd.app = self.app
+        self.httpd.compress_responses = self.compress_responses
+        self.port = self.httpd.server_address[1]
+        self.thread = threading.Thread(target=self.httpd.serve_forever,
+            kwargs={'poll_interval': 0.05}, name='FakeReadabilityServer')
+        self.thread.daemon = True
+        self.thread.start()
+        logger.debug('Fake Readability API listening on %s', self.url)
+        return self
+
+    def stop(self):
+        if self.httpd is not None:
+            self.httpd.shutdown()
+            self.httpd.server_close()
+            self.thread.join()
+            self.httpd = None
+            self.thread = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+import json
+import os
+import shutil
+import tempfile
+try:
+    import unittest2 as unittest
+except ImportError:
+    import unittest
+
+from readability.benchmarks import (BENCHMARKS, compare_results, main,
+    percentile, run_benchmarks)
+
+
+def fake_results(**metrics):
+    result = {'throughput': 100.0, 'p50': 0.010, 'p99': 0.050}
+    result.update(metrics)
+    return {'meta': {}, 'results': {'parser.get_article.serial': result}}
+
+
+class RunBenchmarksTestCase(unittest.TestCase):
+    """
+    Tests for running the benchmark suite.
+    """
+    def test_all_benchmarks_run(self):
+        """
+        Every registered benchmark runs against the fake server and reports
+        throughput and latency percentiles.
+        """
+        results = run_benchmarks(iterations=8, concurrency=2,
+            bookmark_count=60, micro_iterations=200)
+        self.assertEqual(list(results['results']), list(BENCHMARKS))
+        for result in results['results'].values():
+            self.assertTrue(result['operations'] > 0)
+            self.assertTrue(result['throughput'] > 0)
+            self.assertTrue(result['p50'] <= result['p99'])
+        json.dumps(results)
+
+    def test_unknown_benchmark(self):
+        with self.assertRaises(ValueError):
+            run_benchmarks(['no.such.benchmark'])
+
+    def test_percentile(self):
+        values = list(range(101))
+        self.assertEqual(percentile(values, 0.5), 50)
+        self.assertEqual(percentile(values, 0.99), 99)
+        self.assertEqual(percentile([], 0.5), None)
+
+
+class CompareResultsTestCase(unittest.TestCase):
+    """
+    Tests for comparing benchmark runs.
+    """
+    def test_no_regression(self):
+        self.assertEqual(compare_results(fake_results(), fake_results(p99=0.052)), [])
+
+    def test_latency_regression(self):
+        regressions = compare_results(fake_results(), fake_results(p99=0.1))
+        self.assertEqual([(r[0], r[1]) for r in regressions],
+            [('parser.get_article.serial', 'p99')])
+
+    def test_throughput_regression(self):
+        regressions = compare_results(fake_results(), fake_results(throughput=50.0))
+        self.assertEqual([r[1] for r in regressions], ['throughput'])
+        self.assertAlmostEqual(regressions[0][4], 0.5)
+
+    def test_compare_command(self):
+        """
+        The `compare` command exits non-zero when there are regressions.
+        """
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        baseline = os.path.join(tmpdir, 'baseline.json')
+        current = os.path.join(tmpdir, 'current.json')
+        with open(baseline, 'w') as result_file:
+            json.dump(fake_results(), result_file)
+        with open(current, 'w') as result_file:
+            json.dump(fake_results(p50=0.02), result_file)
+        self.assertEqual(main(['compare', baseline, baseline]), 0)
+        self.assertEqual(main(['compare', baseline, current]), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,204 @@
+# -*- coding: utf-8 -*-
+import random
+from datetime import datetime
+try:
+    import unittest2 as unittest
+except ImportError:
+    import unittest
+
+from readability import ReaderClient
+from readability.bitmaps import Bitmap, BookmarkIndex, SortedDates
+from readability.testing import FakeReadabilityServer
+
+
+class BitmapTestCase(unittest.TestCase):
+    """
+    Tests for `Bitmap`.
+    """
+    def test_set_operations(self):
+        """
+        Bitmaps behave like sets of integers, across chunks.
+        """
+        first = set([0, 1, 5, 65535, 65536, 10 ** 7])
+        second = set([1, 5, 70000, 10 ** 7, 2 ** 40])
+        a, b = Bitmap(first), Bitmap(second)
+        self.assertEqual(list(a & b), sorted(first & second))
+        self.assertEqual(list(a | b), sorted(first | second))
+        self.assertEqual(list(a - b), sorted(first - second))
+        self.assertEqual(len(a), len(first))
+        self.assertTrue(65536 in a)
+        self.assertFalse(2 in a)
+        a.discard(10 ** 7)
+        a.discard(3)
+        self.assertEqual(len(a.chunks), 2)
+        self.assertFalse(Bitmap())
+
+    def test_dense(self):
+        values = set(range(0, 200000, 3)) | set([65535, 65536])
+        bitmap = Bitmap(values)
+        self.assertEqual(list(bitmap), sorted(values))
+        self.assertEqual(len(bitmap), len(values))
+        bitmap |= Bitmap([1, 2 ** 20])
+        self.assertEqual(list(bitmap), sorted(values | set([1, 2 ** 20])))
+
+
+class SortedDatesTestCase(unittest.TestCase):
+    """
+    Tests for `SortedDates`.
+    """
+    def test_ranges(self):
+        """
+        Ranges read from cached blocks match the dates, as they change.
+        """
+        rng = random.Random(0)
+        dates = SortedDates()
+        dates.MIN_BLOCK = 8
+        expected = {}
+        for step in range(600):
+            docnum = rng.randrange(300)
+            if docnum in expected and step % 3 == 0:
+                dates.remove(docnum)
+                del expected[docnum]
+            elif docnum not in expected:
+                expected[docnum] = rng.randrange(100)
+                dates.add(expected[docnum], docnum)
+            since, until = sorted([rng.randrange(-5, 105), rng.randrange(-5, 105)])
+            self.assertEqual(set(dates.between(since, until)), set(docnum
+                for docnum, when in expected.items() if since <= when <= until))
+            self.assertEqual(set(dates.between(since=since)), set(docnum
+                for docnum, when in expected.items() if since <= when))
+        self.assertTrue(dates.blocks)
+
+
+class BookmarkIndexTestCase(unittest.TestCase):
+    """
+    Tests for `BookmarkIndex`.
+    """
+    def setUp(self):
+        self.index = BookmarkIndex()
+        self.index.add_many({'bookmarks': [
+            self.bookmark(1, '2015-01-10 10:00:00', favorite=True, tags=['python']),
+            self.bookmark(2, '2015-02-10 10:00:00', archive=True, tags=['python', 'async']),
+            self.bookmark(3, '2015-03-10 10:00:00', domain='other.com', tags=['async']),
+            self.bookmark(4, '2015-04-10 10:00:00', favorite=True, archive=True),
+        ]})
+
+    def bookmark(self, bookmark_id, added, favorite=False, archive=False,
+        domain='example.com', tags=()):
+        return {
+            'id': bookmark_id,
+            'date_added': added,
+            'date_updated': added,
+            'date_archived': added if archive else None,
+            'favorite': favorite,
+            'archive': archive,
+            'article': {'domain': domain},
+            'tags': [{'id': index, 'text': tag} for index, tag in enumerate(tags)],
+        }
+
+    def ids(self, **filters):
+        return sorted(bookmark['id'] for bookmark in self.index.filter(**filters))
+
+    def test_filters(self):
+        self.assertEqual(self.ids(), [1, 2, 3, 4])
+        self.assertEqual(self.ids(favorite=1), [1, 4])
+        self.assertEqual(self.ids(favorite=0), [2, 3])
+        self.assertEqual(self.ids(archive=1, favorite=1), [4])
+        self.assertEqual(self.ids(domain='other.com'), [3])
+        self.assertEqual(self.ids(tags='python'), [1, 2])
+        self.assertEqual(self.ids(tags='python,async'), [2])
+        self.assertEqual(self.ids(tags='missing'), [])
+        self.assertEqual(self.ids(added_since='2015-02-10 10:00:00'), [2, 3, 4])
+        self.assertEqual(self.ids(added_until=datetime(2015, 2, 10, 10)), [1, 2])
+        self.assertEqual(self.ids(archived_since='2015-01-01'), [2, 4])
+        self.assertEqual(self.index.count(tags='async', added_since='2015-03-01'), 1)
+        with self.assertRaises(ValueError):
+            self.index.match(colour='red')
+
+    def test_order_and_paging(self):
+        bookmarks = self.index.filter(page=1, per_page=3)
+        self.assertEqual([bookmark['id'] for bookmark in bookmarks], [4, 3, 2])
+        bookmarks = self.index.filter(order='date_added', page=2, per_page=3)
+        self.assertEqual([bookmark['id'] for bookmark in bookmarks], [4])
+
+    def test_paging(self):
+        """
+        Pages are those of the fully sorted matches, ties included.
+        """
+        rng = random.Random(0)
+        index = BookmarkIndex()
+        for bookmark_id in rng.sample(range(1000), 400):
+            day = rng.randrange(1, 20)
+            bookmark = self.bookmark(bookmark_id, '2015-01-{0:02d} 10:00:00'.format(day),
+                favorite=bookmark_id % 3 == 0, tags=['rare'] if bookmark_id % 40 == 0 else [])
+            bookmark['date_updated'] = '2015-02-01 00:00:00'
+            index.update(bookmark)
+        for filters in ({}, {'favorite': 1}, {'tags': 'rare'}, {'added_since': '2015-01-05'}):
+            for order in ('date_added', '-date_added', '-date_updated'):
+                key = order.lstrip('-')
+                everything = sorted(index.filter(**filters),
+                    key=lambda bookmark: (bookmark[key], bookmark['id']),
+                    reverse=order.startswith('-'))
+                for page in (1, 2, 7):
+                    bookmarks = index.filter(order=order, page=page, per_page=10, **filters)
+                    self.assertEqual(bookmarks, everything[(page - 1) * 10:page * 10],
+                        (filters, order, page))
+
+    def test_match_returns_copy(self):
+        """
+        Changing a match result leaves the index alone.
+        """
+        for filters in ({}, {'only_deleted': 1}, {'tags': 'python'}, {'favorite': 1}):
+            before = self.index.count(**filters)
+            self.index.match(**filters).add(99)
+            self.assertEqual(self.index.count(**filters), before)
+
+    def test_updates(self):
+        """
+        Updated and removed bookmarks leave no stale entries behind.
+        """
+        self.index.update(self.bookmark(1, '2016-01-01 00:00:00', tags=['rust']))
+        self.assertEqual(self.index.filter(per_page=1)[0]['id'], 1)
+        self.assertEqual(self.ids(favorite=1), [4])
+        self.assertEqual(self.ids(tags='python'), [2])
+        self.assertEqual(self.ids(added_since='2016-01-01'), [1])
+        self.index.remove(3)
+        self.assertEqual(self.ids(tags='async'), [2])
+        self.assertFalse('other.com' in self.index.domains)
+        self.index.update(self.bookmark(5, '2015-05-01 00:00:00'), deleted=True)
+        self.assertEqual(self.ids(), [1, 2, 4])
+        self.assertEqual(self.ids(only_deleted=1), [5])
+        self.assertEqual(len(self.index), 4)
+
+    def test_matches_server(self):
+        """
+        The index answers like the Reader API does.
+        """
+        with FakeReadabilityServer(bookmark_count=150) as server:
+            token_key, token_secret = server.token_for('user')
+            client = ReaderClient(token_key, token_secret, **server.client_kwargs('reader'))
+            listing = client.get_bookmarks(per_page=50).json()['bookmarks']
+            for bookmark in listing[:20]:
+                client.add_tags_to_bookmark(bookmark['id'], 'one,two')
+            for bookmark in listing[10:30]:
+                client.add_tags_to_bookmark(bookmark['id'], 'three')
+            index = BookmarkIndex.from_client(client)
+            self.assertEqual(len(index), 150)
+            middle = listing[len(listing) // 2]['date_added']
+            for filters in ({'favorite': 1}, {'archive': 0, 'favorite': 0},
+                    {'tags': 'one,three'}, {'tags': 'two', 'archive': 1},
+                    {'added_since': middle}, {'added_until': middle, 'favorite': 1},
+                    {'domain': listing[0]['article']['domain']}):
+                expected = []
+                page = num_pages = 1
+                while page <= num_pages:
+                    data = client.get_bookmarks(page=page, per_page=50, **filters).json()
+                    expected.extend(bookmark['id'] for bookmark in data['bookmarks'])
+                    num_pages = data['meta']['num_pages']
+                    page += 1
+                self.assertEqual([bookmark['id'] for bookmark in index.filter(**filters)],
+                    expected, filters)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,232 @@
+# -*- coding: utf-8 -*-
+import gzip
+import io
+import mmap
+import os
+import shutil
+import tempfile
+try:
+    import unittest2 as unittest
+except ImportError:
+    import unittest
+
+from readability import ParserClient
+from readability.bodies import (compress_body, document_body, document_stream,
+    is_streamable, iter_document, multipart_body)
+from readability.instrumentation import MetricsAggregator
+from readability.testing import FakeReadabilityServer, parse_multipart
+from readability.transports import HTTPXTransport, Urllib3Transport
+from readability.tests import load_test_content
+
+
+class DocumentBodyTestCase(unittest.TestCase):
+    """
+    Tests for the document body encodings.
+    """
+    def setUp(self):
+        self.document = u'<html><title>Tést</title><p>a & b = c</p></html>'
+
+    def test_form(self):
+        body, headers, query = document_body(self.document, {'max_pages': 3})
+        self.assertEqual(headers, {'Content-Type': 'application/x-www-form-urlencoded'})
+        self.assertTrue('max_pages=3' in body)
+        self.assertEqual(query, {})
+
+    def test_raw(self):
+        """
+        Raw bodies are the document itself, other fields go to the query.
+        """
+        body, headers, query = document_body(self.document, {'max_pages': 3}, 'raw')
+        self.assertEqual(body, self.document.encode('utf-8'))
+        self.assertEqual(query, {'max_pages': 3})
+
+    def test_multipart(self):
+        body, headers, query = document_body(self.document, {'max_pages': 3}, 'multipart')
+        fields = parse_multipart(body, headers['Content-Type'])
+        self.assertEqual(fields['doc'], self.document.encode('utf-8'))
+        self.assertEqual(fields['max_pages'], b'3')
+
+    def test_gzip(self):
+        body, headers, query = document_body(self.document, {}, 'raw', 'gzip')
+        self.assertEqual(headers['Content-Encoding'], 'gzip')
+        with gzip.GzipFile(fileobj=io.BytesIO(body)) as gzip_file:
+            self.assertEqual(gzip_file.read(), self.document.encode('utf-8'))
+
+    def test_unknown(self):
+        with self.assertRaises(ValueError):
+            document_body(self.document, {}, 'xml')
+        with self.assertRaises(ValueError):
+            compress_body(b'', 'brotli')
+
+    def test_multipart_boundary(self):
+        body, content_type = multipart_body({'a': 1}, {}, boundary='xyz')
+        self.assertEqual(content_type, 'multipart/form-data; boundary=xyz')
+        self.assertTrue(body.startswith(b'--xyz\r\n'))
+
+
+class DocumentStreamTestCase(unittest.TestCase):
+    """
+    Tests for streamed document bodies.
+    """
+    def setUp(self):
+        self.document = u'<html><title>Tést</title><p>a & b = c</p></html>' * 50
+        self.data = self.document.encode('utf-8')
+
+    def stream(self, *args, **kwargs):
+        kwargs.setdefault('chunk_size', 7)
+        body, headers, query = document_stream(io.BytesIO(self.data), *args, **kwargs)
+        return b''.join(body), headers, query
+
+    def test_is_streamable(self):
+        """
+        Text and bytes are documents, files and buffers are streamed.
+        """
+        self.assertFalse(is_streamable(self.document))
+        self.assertFalse(is_streamable(self.data))
+        self.assertTrue(is_streamable(io.BytesIO(self.data)))
+        self.assertTrue(is_streamable(bytearray(self.data)))
+        self.assertTrue(is_streamable(memoryview(self.data)))
+
+    def test_iter_document(self):
+        chunks = list(iter_document(bytearray(self.data), chunk_size=100))
+        self.assertEqual(b''.join(chunks), self.data)
+        self.assertTrue(all(len(chunk) <= 100 for chunk in chunks))
+        self.assertEqual(b''.join(iter_document(io.StringIO(self.document))), self.data)
+
+    def test_same_as_whole_bodies(self):
+        """
+        Streamed bodies hold the same bytes as the whole ones.
+        """
+        for body_format in ('form', 'raw'):
+            expected = document_body(self.document, {'max_pages': 3}, body_format)
+            body, headers, query = self.stream({'max_pages': 3}, body_format)
+            self.assertEqual(body, expected[0].encode('ascii') if body_format == 'form' else expected[0])
+            self.assertEqual(headers, expected[1])
+            self.assertEqual(query, expected[2])
+        body, headers, query = self.stream({'max_pages': 3}, 'multipart', boundary='xyz')
+        self.assertEqual(body, multipart_body({'max_pages': 3},
+            {'doc': ('doc.html', self.data, 'text/html; charset=utf-8')}, boundary='xyz')[0])
+
+    def test_compressed(self):
+        body, headers, query = self.stream({}, 'raw', 'gzip')
+        self.assertEqual(headers['Content-Encoding'], 'gzip')
+        with gzip.GzipFile(fileobj=io.BytesIO(body)) as gzip_file:
+            self.assertEqual(gzip_file.read(), self.data)
+
+    def test_unknown(self):
+        """
+        Bad arguments are reported before anything is read.
+        """
+        with self.assertRaises(ValueError):
+            document_stream(io.BytesIO(), {}, 'xml')
+        with self.assertRaises(ValueError):
+            document_stream(io.BytesIO(), {}, 'raw', 'brotli')
+
+
+class PostArticleContentTestCase(unittest.TestCase):
+    """
+    POST documents in every format against the fake server.
+    """
+    def setUp(self):
+        self.server = FakeReadabilityServer().start()
+        self.addCleanup(self.server.stop)
+        self.client = ParserClient(**self.server.client_kwargs('parser'))
+        self.content = load_test_content('content/test_post_content.html')
+        self.url = 'http://example.com/article.html'
+
+    def post(self, **kwargs):
+        before = self.server.traffic['received']
+        response = self.client.post_article_content(self.content, self.url, **kwargs)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['url'], self.url)
+        return self.server.traffic['received'] - before
+
+    def test_formats(self):
+        """
+        Every format reaches the server, and the alternatives to a plain
+        form body upload less.
+        """
+        form = self.post()
+        raw = self.post(body_format='raw')
+        multipart = self.post(body_format='multipart')
+        gzipped = self.post(body_format='raw', compression='gzip')
+        deflated_form = self.post(compression='deflate')
+        self.assertTrue(raw < form)
+        self.assertTrue(multipart < form)
+        self.assertTrue(gzipped < raw / 2)
+        self.assertTrue(deflated_form < form / 2)
+
+    def test_compressed_responses(self):
+        """
+        Compressed responses are negotiated and decoded on every transport.
+        """
+        client = ParserClient(transport=Urllib3Transport(),
+            **self.server.client_kwargs('parser'))
+        before = self.server.traffic['sent']
+        response = client.get_article(url=self.url)
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertTrue(self.server.traffic['sent'] - before < len(response.content))
+        self.assertTrue('content' in response.json())
+
+    def streamed_content(self, response):
+        self.assertEqual(response.status_code, 200)
+        return response.json()['content']
+
+    def test_streamed(self):
+        """
+        Documents are streamed from files, paths and memory maps in every
+        format and compression.
+        """
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'article.html')
+        with open(path, 'wb') as document_file:
+            document_file.write(self.content.encode('utf-8'))
+        for body_format in ('form', 'raw', 'multipart'):
+            for compression in (None, 'gzip'):
+                response = self.client.post_article_file(path, self.url,
+                    body_format=body_format, compression=compression, chunk_size=1024)
+                self.assertEqual(self.streamed_content(response), self.content)
+        with open(path, 'rb') as document_file:
+            document = mmap.mmap(document_file.fileno(), 0, access=mmap.ACCESS_READ)
+            self.addCleanup(document.close)
+            response = self.client.post_article_content(document, self.url)
+            self.assertEqual(self.streamed_content(response), self.content)
+        try:
+            from pathlib import Path
+        except ImportError:
+            return
+        response = self.client.post_article_content(Path(path), self.url, body_format='raw')
+        self.assertEqual(self.streamed_content(response), self.content)
+
+    def test_streamed_transports(self):
+        """
+        Every transport sends streamed bodies, and the bytes sent are
+        counted as they go.
+        """
+        transports = [Urllib3Transport()]
+        try:
+            transports.append(HTTPXTransport(http2=False))
+        except ImportError:
+            pass
+        for transport in transports:
+            aggregator = MetricsAggregator()
+            client = ParserClient(transport=transport, hooks=[aggregator],
+                **self.server.client_kwargs('parser'))
+            document = io.BytesIO(self.content.encode('utf-8'))
+            response = client.post_article_content(document, self.url, body_format='raw')
+            self.assertEqual(self.streamed_content(response), self.content)
+            metrics = aggregator.snapshot()[('parser', 'POST', 'parser', 200)]
+            self.assertEqual(metrics['bytes_sent'], len(self.content.encode('utf-8')))
+
+    def test_post_params_untouched(self):
+        """
+        `post` no longer adds the token to the caller's dict.
+        """
+        params = {'doc': self.content, 'max_pages': 1}
+        self.client.post(self.client._generate_url('parser', {'url': self.url}), params)
+        self.assertEqual(sorted(params), ['doc', 'max_pages'])
+
+
+if __name__ == '__main__':
+    unittest.main()
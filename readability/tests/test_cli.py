@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+import gzip
+import json
+import os
+import shutil
+import tempfile
+try:
+    import unittest2 as unittest
+except ImportError:
+    import unittest
+
+from readability import ReaderClient
+from readability.cli import BookmarkExporter, ExportError, main
+from readability.testing import FakeReadabilityServer, READER_PREFIX
+
+
+class BookmarkExporterTestCase(unittest.TestCase):
+    """
+    Tests for `BookmarkExporter` against the fake server.
+    """
+    def setUp(self):
+        self.server = FakeReadabilityServer(bookmark_count=120).start()
+        self.addCleanup(self.server.stop)
+        token_key, token_secret = self.server.token_for('user')
+        self.client = ReaderClient(token_key, token_secret, **self.server.client_kwargs('reader'))
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.output = os.path.join(self.directory, 'bookmarks.jsonl.gz')
+
+    def read_output(self):
+        with gzip.open(self.output, 'rb') as output:
+            return [json.loads(line.decode('utf-8')) for line in output]
+
+    def bookmark_pages_fetched(self):
+        return self.server.stats[('GET', READER_PREFIX + 'bookmarks')]
+
+    def test_export(self):
+        stats = BookmarkExporter(self.client, self.output).run()
+        self.assertEqual(stats['pages'], 3)
+        records = self.read_output()
+        self.assertEqual(len(records), 120)
+        self.assertEqual(len(set(record['id'] for record in records)), 120)
+        self.assertFalse('content' in records[0]['article'])
+
+    def test_articles(self):
+        """
+        Full articles replace the summaries.
+        """
+        stats = BookmarkExporter(self.client, self.output, articles=True,
+            per_page=20, concurrency=4).run()
+        self.assertEqual(stats['articles'], 120)
+        records = self.read_output()
+        self.assertTrue(all('content' in record['article'] for record in records))
+
+    def test_resume(self):
+        """
+        An interrupted export resumes after the last bookmark written, even
+        when bookmarks were added or deleted in between, and a complete one
+        is not redone.
+        """
+        get_bookmarks = self.client.get_bookmarks
+
+        def failing(**filters):
+            if filters['page'] == 4:
+                raise IOError('connection reset')
+            return get_bookmarks(**filters)
+
+        self.client.get_bookmarks = failing
+        with self.assertRaises(IOError):
+            BookmarkExporter(self.client, self.output, per_page=20, lookahead=1).run()
+        written = self.read_output()
+        self.assertEqual(len(written), 60)
+        with open(self.output + '.checkpoint') as checkpoint:
+            self.assertEqual(json.load(checkpoint)['last'],
+                [written[-1]['date_added'], written[-1]['id']])
+
+        # Deleting exported bookmarks would shift later ones to earlier pages.
+        self.client.get_bookmarks = get_bookmarks
+        for record in written[:10]:
+            self.client.delete_bookmark(record['id'])
+        added = self.client.add_bookmark('http://example.com/added-while-paused.html')
+        self.assertEqual(added.status_code, 202)
+        before = self.bookmark_pages_fetched()
+        stats = BookmarkExporter(self.client, self.output, per_page=20, lookahead=1).run()
+        self.assertEqual(stats['pages'], 4)
+        self.assertEqual(self.bookmark_pages_fetched() - before, 4)
+        records = self.read_output()
+        self.assertEqual(sorted(record['id'] for record in records),
+            sorted(set(record['id'] for record in records)))
+        self.assertEqual(len(records), 121)
+        self.assertEqual(records[-1]['article']['url'],
+            'http://example.com/added-while-paused.html')
+
+        self.assertEqual(BookmarkExporter(self.client, self.output, per_page=20).run()['pages'], 0)
+
+    def test_oldest_first(self):
+        BookmarkExporter(self.client, self.output).run()
+        records = self.read_output()
+        self.assertEqual(records, sorted(records,
+            key=lambda record: (record['date_added'], record['id'])))
+        with self.assertRaises(ExportError):
+            BookmarkExporter(self.client, self.output, filters={'order': '-date_added'})
+
+    def test_settings_mismatch(self):
+        BookmarkExporter(self.client, self.output, per_page=20).run()
+        with self.assertRaises(ExportError):
+            BookmarkExporter(self.client, self.output, per_page=50).run()
+
+    def test_filters(self):
+        BookmarkExporter(self.client, self.output, filters={'favorite': 1}).run()
+        records = self.read_output()
+        self.assertTrue(records)
+        self.assertTrue(all(record['favorite'] for record in records))
+
+    def test_main(self):
+        """
+        The command line logs in with a username and password.
+        """
+        status = main(['export', self.output, '--username', 'user', '--password', 'password',
+            '--consumer-key', self.server.consumer_key,
+            '--consumer-secret', self.server.consumer_secret,
+            '--base-url-template', self.server.reader_url_template,
+            '--filter', 'archive=0', '--transport', 'urllib3'])
+        self.assertEqual(status, 0)
+        self.assertTrue(all(not record['archive'] for record in self.read_output()))
+        self.assertEqual(main(['export', self.output, '--filter', 'archive']), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+import time
+try:
+    import unittest2 as unittest
+except ImportError:
+    import unittest
+
+from readability import ReaderClient
+from readability.coalescing import CoalescingWriter
+from readability.testing import FakeReadabilityServer, READER_PREFIX
+
+
+class CoalescingWriterTestCase(unittest.TestCase):
+    """
+    Tests for `CoalescingWriter` against the fake server.
+    """
+    def setUp(self):
+        self.server = FakeReadabilityServer(bookmark_count=10).start()
+        self.addCleanup(self.server.stop)
+        token_key, token_secret = self.server.token_for('user')
+        self.client = ReaderClient(token_key, token_secret, **self.server.client_kwargs('reader'))
+        self.bookmark_ids = [bookmark['id'] for bookmark in
+            self.client.get_bookmarks(per_page=10).json()['bookmarks']]
+
+    def writes(self, bookmark_id):
+        return self.server.stats[('POST', READER_PREFIX + 'bookmarks/{0}'.format(bookmark_id))]
+
+    def bookmark(self, bookmark_id):
+        return self.client.get_bookmark(bookmark_id).json()
+
+    def test_coalesce(self):
+        """
+        Updates to a bookmark are merged into a single write.
+        """
+        first, second = self.bookmark_ids[:2]
+        writer = CoalescingWriter(self.client, interval=60)
+        for step in range(1, 51):
+            writer.set_read_percent_of_bookmark(first, step / 100.0)
+        writer.favorite_bookmark(first)
+        writer.update_bookmark(second, archive=True, read_percent=0.2)
+        writer.update_bookmark(second, archive=False)
+        self.assertEqual(writer.pending(), 2)
+        self.assertEqual(self.writes(first), 0)
+        self.assertEqual(writer.flush(), 0)
+        self.assertEqual(writer.pending(), 0)
+        self.assertEqual(self.writes(first), 1)
+        self.assertEqual(self.writes(second), 1)
+        bookmark = self.bookmark(first)
+        self.assertEqual(bookmark['read_percent'], '0.50')
+        self.assertTrue(bookmark['favorite'])
+        bookmark = self.bookmark(second)
+        self.assertEqual(bookmark['read_percent'], '0.20')
+        self.assertFalse(bookmark['archive'])
+        self.assertEqual(writer.stats['updates'], 53)
+        self.assertEqual(writer.stats['writes'], 2)
+        writer.close()
+
+    def test_interval(self):
+        """
+        Pending updates are written in the background once the interval
+        expires, or sooner when too many bookmarks are pending.
+        """
+        with CoalescingWriter(self.client, interval=0.1) as writer:
+            writer.set_read_percent_of_bookmark(self.bookmark_ids[0], 0.3)
+            deadline = time.time() + 5
+            while writer.pending() and time.time() < deadline:
+                time.sleep(0.01)
+            self.assertEqual(self.writes(self.bookmark_ids[0]), 1)
+
+        with CoalescingWriter(self.client, interval=60, max_pending=3) as writer:
+            for bookmark_id in self.bookmark_ids[:3]:
+                writer.archive_bookmark(bookmark_id)
+            deadline = time.time() + 5
+            while writer.pending() and time.time() < deadline:
+                time.sleep(0.01)
+            self.assertEqual(writer.pending(), 0)
+
+    def test_close(self):
+        """
+        Closing writes what is pending, and later updates are refused.
+        """
+        writer = CoalescingWriter(self.client, interval=60)
+        writer.set_read_percent_of_bookmark(self.bookmark_ids[0], 0.75)
+        writer.close()
+        self.assertEqual(self.bookmark(self.bookmark_ids[0])['read_percent'], '0.75')
+        with self.assertRaises(RuntimeError):
+            writer.favorite_bookmark(self.bookmark_ids[0])
+
+    def test_errors(self):
+        """
+        Transient errors are retried with the newest values, others are
+        dropped.
+        """
+        errors = []
+        writer = CoalescingWriter(self.client, interval=60, max_attempts=2,
+            on_error=lambda *args: errors.append(args))
+        self.server.app.error_rate = 1.0
+        writer.set_read_percent_of_bookmark(self.bookmark_ids[0], 0.1)
+        writer.set_read_percent_of_bookmark(999999, 0.1)
+        self.assertEqual(writer.flush(), 2)
+        writer.set_read_percent_of_bookmark(self.bookmark_ids[0], 0.4)
+        self.server.app.error_rate = 0.0
+        self.assertEqual(writer.flush(), 0)
+        self.assertEqual(self.bookmark(self.bookmark_ids[0])['read_percent'], '0.40')
+        self.assertEqual(writer.stats['retries'], 2)
+        self.assertEqual(writer.stats['dropped'], 1)
+        self.assertEqual(errors[0][0], 999999)
+        self.assertEqual(errors[0][2].status_code, 404)
+        writer.close()
+
+    def test_close_retries(self):
+        """
+        Closing backs off between attempts at writing failed updates, and a
+        failing `on_error` doesn't stop it.
+        """
+        def on_error(*args):
+            raise RuntimeError('callback failed')
+
+        writer = CoalescingWriter(self.client, interval=60, max_attempts=3, on_error=on_error)
+        self.server.app.error_rate = 1.0
+        writer.set_read_percent_of_bookmark(self.bookmark_ids[0], 0.1)
+        start = time.time()
+        writer.close()
+        # Waits of 0.1s and 0.2s between the three attempts.
+        self.assertTrue(time.time() - start >= 0.3)
+        self.assertEqual(writer.stats['retries'], 2)
+        self.assertEqual(writer.stats['dropped'], 1)
+        self.assertEqual(writer.pending(), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,206 @@
+# -*- coding: utf-8 -*-
+import itertools
+import threading
+import time
+try:
+    import unittest2 as unittest
+except ImportError:
+    import unittest
+
+from readability import ParserClient, ReaderClient
+from readability.hedging import HedgingPolicy
+from readability.histograms import LatencyHistogram
+from readability.scheduling import INTERACTIVE, RequestScheduler
+from readability.testing import FakeReadabilityServer
+
+
+class FakeResponse(object):
+    def __init__(self, name):
+        self.name = name
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class Attempts(object):
+    """
+    `send` callable whose attempts take the given times, and return or
+    raise in order.
+    """
+    def __init__(self, *delays):
+        self.delays = list(delays)
+        self.responses = []
+        self.lock = threading.Lock()
+
+    def __call__(self):
+        with self.lock:
+            index = len(self.responses)
+            response = FakeResponse(index)
+            self.responses.append(response)
+        delay = self.delays[index]
+        time.sleep(abs(delay))
+        if delay < 0:
+            raise IOError('attempt {0} failed'.format(index))
+        return response
+
+
+class HedgingPolicyTestCase(unittest.TestCase):
+    def setUp(self):
+        self.policy = HedgingPolicy(delay=0.02, burst=2, budget=0)
+        self.addCleanup(self.policy.close)
+
+    def test_hedge_delay(self):
+        policy = HedgingPolicy(percentile=0.5, min_samples=10, min_delay=0.01, max_delay=1.0)
+        histogram = LatencyHistogram()
+        self.assertEqual(policy.hedge_delay(None), None)
+        for value in [0.1] * 9:
+            histogram.record(value)
+        self.assertEqual(policy.hedge_delay(histogram), None)
+        histogram.record(0.1)
+        self.assertAlmostEqual(policy.hedge_delay(histogram), 0.1, places=2)
+        for value in [5.0] * 20:
+            histogram.record(value)
+        self.assertEqual(policy.hedge_delay(histogram), 1.0)
+        policy.delay = 0.001
+        self.assertEqual(policy.hedge_delay(None), 0.01)
+
+    def test_fast(self):
+        send = Attempts(0)
+        self.assertEqual(self.policy.call(send).name, 0)
+        self.assertEqual(len(send.responses), 1)
+        self.assertEqual(self.policy.stats['hedges'], 0)
+
+    def test_hedge_wins(self):
+        """
+        The faster second attempt is returned, and the first one is closed
+        once it comes back.
+        """
+        send = Attempts(0.3, 0)
+        start = time.time()
+        self.assertEqual(self.policy.call(send).name, 1)
+        self.assertTrue(time.time() - start < 0.2)
+        self.assertEqual(dict(self.policy.stats), {'reads': 1, 'hedges': 1, 'won': 1})
+        time.sleep(0.4)
+        self.assertTrue(send.responses[0].closed)
+        self.assertFalse(send.responses[1].closed)
+
+    def test_first_wins(self):
+        send = Attempts(0.05, 0.3)
+        self.assertEqual(self.policy.call(send).name, 0)
+        self.assertEqual(self.policy.stats['won'], 0)
+        self.policy.close()
+        self.assertTrue(send.responses[1].closed)
+
+    def test_busy_pool(self):
+        """
+        Reads don't wait for the threads of the pool, and hedges are denied
+        while all of them are busy instead of queuing.
+        """
+        policy = HedgingPolicy(delay=0.05, burst=10, budget=0, max_workers=1)
+        self.addCleanup(policy.close)
+        release = threading.Event()
+        first_calls = itertools.count()
+
+        def stuck_hedge():
+            if next(first_calls) == 0:
+                time.sleep(0.1)
+                return FakeResponse(0)
+            release.wait()
+            return FakeResponse(1)
+
+        self.addCleanup(release.set)
+        self.assertEqual(policy.call(stuck_hedge).name, 0)
+        self.assertEqual(policy.in_flight, 1)
+
+        start = time.time()
+        sends = [Attempts(0.2, 0) for _ in range(4)]
+        threads = [threading.Thread(target=policy.call, args=(send,)) for send in sends]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertTrue(time.time() - start < 0.35)
+        self.assertEqual([len(send.responses) for send in sends], [1] * 4)
+        self.assertEqual((policy.stats['hedges'], policy.stats['denied']), (1, 4))
+        release.set()
+
+    def test_errors(self):
+        """
+        A failed attempt leaves the other one to answer; the first error is
+        raised when both fail.
+        """
+        self.assertEqual(self.policy.call(Attempts(-0.1, 0.2)).name, 1)
+        with self.assertRaises(IOError) as context:
+            self.policy.call(Attempts(-0.1, -0.15))
+        self.assertTrue('attempt 0' in str(context.exception))
+
+    def test_budget(self):
+        """
+        Hedges beyond the budget are not sent.
+        """
+        for _ in range(3):
+            self.policy.call(Attempts(0.05, 0))
+        self.assertEqual(self.policy.stats['hedges'], 2)
+        self.assertEqual(self.policy.stats['denied'], 1)
+
+        policy = HedgingPolicy(delay=0.01, burst=1, budget=0.25)
+        self.addCleanup(policy.close)
+        for _ in range(9):
+            policy.call(Attempts(0.02, 0))
+        # One saved up, and one earned every four reads.
+        self.assertEqual(policy.stats['hedges'], 3)
+
+
+class HedgedClientTestCase(unittest.TestCase):
+    """
+    Hedged reads against a fake server where one request in thirteen is slow.
+    """
+    SLOW = 0.5
+
+    def setUp(self):
+        self.server = FakeReadabilityServer(bookmark_count=5).start()
+        self.addCleanup(self.server.stop)
+        counter = itertools.count()
+        self.server.app.latency = lambda: self.SLOW if next(counter) % 13 == 12 else 0.002
+        self.policy = HedgingPolicy(percentile=0.9, min_samples=20, min_delay=0.05,
+            budget=0.2, burst=2)
+        self.addCleanup(self.policy.close)
+
+    def test_parser(self):
+        client = ParserClient(hedging=self.policy, **self.server.client_kwargs('parser'))
+        url = 'http://example.com/hedged.html'
+        for _ in range(20):
+            client.get_article(url=url)
+            client.get_confidence(url=url)
+            client.get_article_status(url=url)
+        self.assertEqual(self.policy.stats['hedges'], 0)
+
+        slowest = 0
+        for _ in range(40):
+            start = time.time()
+            self.assertEqual(client.get_confidence(url=url).status_code, 200)
+            self.assertEqual(client.get_article_status(url=url).status_code, 200)
+            slowest = max(slowest, time.time() - start)
+        self.assertTrue(slowest < self.SLOW / 2, slowest)
+        self.assertTrue(self.policy.stats['won'] >= 1)
+        self.assertTrue(self.policy.stats['hedges'] <= 2 + 0.2 * self.policy.stats['reads'])
+
+    def test_reader_priority(self):
+        """
+        Attempts sent from the policy's threads keep the caller's priority.
+        """
+        token_key, token_secret = self.server.token_for('user')
+        scheduler = RequestScheduler(max_in_flight=4)
+        client = ReaderClient(token_key, token_secret, hedging=self.policy, scheduler=scheduler,
+            **self.server.client_kwargs('reader'))
+        bookmark_id = client.get_bookmarks().json()['bookmarks'][0]['id']
+        with scheduler.priority(INTERACTIVE):
+            for _ in range(5):
+                self.assertEqual(client.get_bookmark(bookmark_id).status_code, 200)
+        self.assertEqual(scheduler.stats[INTERACTIVE], 5)
+        self.assertEqual(self.policy.stats['reads'], 5)
+
+
+if __name__ == '__main__':
+    unittest.main()
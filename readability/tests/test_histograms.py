@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+import json
+import random
+import threading
+try:
+    import unittest2 as unittest
+except ImportError:
+    import unittest
+
+from readability import ParserClient
+from readability.histograms import LatencyHistogram, LatencyHistograms, merge_all
+from readability.testing import FakeReadabilityServer
+
+
+class LatencyHistogramTestCase(unittest.TestCase):
+    """
+    Tests for `LatencyHistogram`.
+    """
+    def test_empty(self):
+        self.assertEqual(LatencyHistogram().percentile(0.99), None)
+
+    def test_percentile_accuracy(self):
+        """
+        Percentiles are within the relative error of one bucket.
+        """
+        rand = random.Random(0)
+        values = sorted(rand.lognormvariate(-4, 1) for _ in range(10000))
+        histogram = LatencyHistogram()
+        for value in values:
+            histogram.record(value)
+        for fraction in (0.5, 0.9, 0.99, 0.999):
+            exact = values[int(fraction * len(values)) - 1]
+            estimate = histogram.percentile(fraction)
+            self.assertTrue(abs(estimate - exact) / exact < 0.05,
+                (fraction, exact, estimate))
+        self.assertEqual(histogram.percentile(1.0), values[-1])
+
+    def test_fixed_memory(self):
+        histogram = LatencyHistogram()
+        size = len(histogram.counts)
+        for value in (0, 1e-9, 1.0, 1e6):
+            histogram.record(value)
+        self.assertEqual(len(histogram.counts), size)
+        self.assertEqual(histogram.count, 4)
+
+    def test_threads(self):
+        histogram = LatencyHistogram()
+
+        def record():
+            for _ in range(2000):
+                histogram.record(0.01)
+        threads = [threading.Thread(target=record) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(histogram.count, 16000)
+        self.assertEqual(sum(histogram.counts), 16000)
+
+    def test_merge_and_serialize(self):
+        """
+        Histograms merged after a round trip through JSON equal a histogram
+        that recorded everything.
+        """
+        one, two, everything = LatencyHistogram(), LatencyHistogram(), LatencyHistogram()
+        for index in range(1, 200):
+            (one if index % 2 else two).record(index / 1000.0)
+            everything.record(index / 1000.0)
+        merged = LatencyHistogram.from_dict(json.loads(json.dumps(one.to_dict())))
+        merged.merge(two)
+        self.assertEqual(merged.counts, everything.counts)
+        self.assertEqual(merged.percentile(0.99), everything.percentile(0.99))
+
+    def test_merge_layout_mismatch(self):
+        with self.assertRaises(ValueError):
+            LatencyHistogram().merge(LatencyHistogram(buckets_per_doubling=8))
+
+    def test_reset(self):
+        histogram = LatencyHistogram()
+        histogram.record(0.5)
+        window = histogram.reset()
+        self.assertEqual(window.count, 1)
+        self.assertEqual(histogram.count, 0)
+        self.assertEqual(histogram.percentile(0.5), None)
+
+
+class LatencyHistogramsTestCase(unittest.TestCase):
+    """
+    Tests for per method, route and status histograms.
+    """
+    def test_select(self):
+        histograms = LatencyHistograms()
+        histograms.record('reader', 'GET', 'bookmarks', 200, 0.010)
+        histograms.record('reader', 'GET', 'bookmarks', 500, 1.0)
+        histograms.record('parser', 'GET', 'parser', 200, 0.100)
+        self.assertAlmostEqual(histograms.percentile(0.99, route='bookmarks', status=200), 0.010)
+        self.assertAlmostEqual(histograms.percentile(0.99, client='reader'), 1.0, delta=0.03)
+        self.assertEqual(histograms.select().count, 3)
+
+    def test_merge_all(self):
+        first, second = LatencyHistograms(), LatencyHistograms()
+        first.record('parser', 'GET', 'parser', 200, 0.1)
+        second.record('parser', 'GET', 'parser', 200, 0.2)
+        second.record('parser', 'GET', 'confidence', 200, 0.3)
+        merged = merge_all([first.to_dict(), json.loads(json.dumps(second.to_dict()))])
+        self.assertEqual(merged.select(route='parser').count, 2)
+        self.assertEqual(len(merged.keys()), 2)
+
+    def test_client_records(self):
+        """
+        Clients record the latency of each request.
+        """
+        with FakeReadabilityServer() as server:
+            client = ParserClient(**server.client_kwargs('parser'))
+            for _ in range(3):
+                client.get_article(url='http://example.com/a.html')
+            client.get_article()
+        self.assertEqual(sorted(client.latency.keys()),
+            [('parser', 'GET', 'parser', 200), ('parser', 'GET', 'parser', 400)])
+        self.assertEqual(client.latency.select(status=200).count, 3)
+        self.assertTrue(client.latency.percentile(0.99, route='parser') > 0)
+        window = client.latency.reset()
+        self.assertEqual(window.select().count, 4)
+        self.assertEqual(client.latency.select().count, 0)
+
+    def test_client_methods(self):
+        """
+        Requests with different methods to a route are kept apart.
+        """
+        with FakeReadabilityServer() as server:
+            client = ParserClient(**server.client_kwargs('parser'))
+            client.get_article_status(url='http://example.com/a.html')
+            client.get_article(url='http://example.com/a.html')
+        self.assertEqual(sorted(client.latency.keys()),
+            [('parser', 'GET', 'parser', 200), ('parser', 'HEAD', 'parser', 200)])
+        self.assertEqual(client.latency.select(method='HEAD').count, 1)
+        self.assertEqual(client.latency.select(route='parser').count, 2)
+
+    def test_client_disabled(self):
+        client = ParserClient(token='token', latency_histograms=False)
+        self.assertEqual(client.latency, None)
+
+
+if __name__ == '__main__':
+    unittest.main()
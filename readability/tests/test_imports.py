@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+import json
+import re
+import subprocess
+import sys
+try:
+    import unittest2 as unittest
+except ImportError:
+    import unittest
+
+from readability.core import lazy_import
+
+
+# Modules that make up most of the cost of an import, and that only the
+# requests actually sent need. Checking for them rather than timing the
+# import keeps the test independent of the speed of the machine.
+HEAVY_MODULES = ['requests', 'requests_oauthlib', 'oauthlib', 'dateutil', 'urllib3', 'httpx']
+
+# Budget of a cold `import readability`: the modules it may add to
+# `sys.modules`, standard library ones included, and the seconds it may
+# take as reported by `python -X importtime`. About 40 modules and 30ms
+# today; the time budget is generous so that slow CI machines stay under
+# it, while an eager import of `requests` alone adds over a hundred modules.
+IMPORT_MODULE_BUDGET = 60
+IMPORT_TIME_BUDGET = 0.5
+
+IMPORT_SCRIPT = """
+import json, sys
+before = set(sys.modules)
+import readability
+loaded = [name for name in %r if name in sys.modules]
+print(json.dumps({'loaded': loaded, 'added': sorted(set(sys.modules) - before)}))
+""" % (HEAVY_MODULES, )
+
+
+def cold_import():
+    """
+    Import readability in a fresh interpreter and report what it loaded.
+    """
+    output = subprocess.check_output([sys.executable, '-c', IMPORT_SCRIPT])
+    return json.loads(output.decode('utf-8'))
+
+
+def import_time():
+    """
+    Seconds a cold `import readability` takes, imports included, according
+    to `python -X importtime`.
+    """
+    process = subprocess.Popen([sys.executable, '-X', 'importtime', '-c', 'import readability'],
+        stderr=subprocess.PIPE)
+    _, errors = process.communicate()
+    # import time: self [us] | cumulative | imported package
+    match = re.search(r'^import time:\s*\d+\s*\|\s*(\d+)\s*\|\s*readability$',
+        errors.decode('utf-8'), re.M)
+    return int(match.group(1)) / 1e6
+
+
+class ImportCostTestCase(unittest.TestCase):
+    """
+    Regression tests for the cost of `import readability`.
+    """
+    def test_heavy_dependencies_not_imported(self):
+        """
+        Importing the package should not pull in any HTTP, oAuth or date
+        parsing dependencies.
+        """
+        result = cold_import()
+        self.assertEqual(result['loaded'], [])
+
+    def test_module_budget(self):
+        """
+        A cold import adds at most `IMPORT_MODULE_BUDGET` modules.
+        """
+        added = cold_import()['added']
+        self.assertTrue(len(added) <= IMPORT_MODULE_BUDGET,
+            'import readability added {0} modules: {1}'.format(len(added), ', '.join(added)))
+
+    @unittest.skipUnless(sys.version_info >= (3, 7), 'needs python -X importtime')
+    def test_import_time_budget(self):
+        """
+        A cold import stays inside `IMPORT_TIME_BUDGET`. The best of a few
+        runs is used to smooth out scheduler noise.
+        """
+        best = min(import_time() for _ in range(3))
+        self.assertTrue(best < IMPORT_TIME_BUDGET,
+            'import readability took {0:.3f}s'.format(best))
+
+    def test_public_names(self):
+        """
+        The public interface is unchanged.
+        """
+        import readability
+        from readability.clients import ParserClient, ReaderClient
+        from readability.auth import xauth
+        self.assertTrue(readability.ParserClient is ParserClient)
+        self.assertTrue(readability.ReaderClient is ReaderClient)
+        self.assertTrue(readability.xauth is xauth)
+
+
+class LazyModuleTestCase(unittest.TestCase):
+    """
+    Tests for `readability.core.lazy_import`.
+    """
+    def test_import_on_first_access(self):
+        """
+        The wrapped module is imported on attribute access.
+        """
+        lazy_json = lazy_import('json')
+        self.assertEqual(lazy_json.dumps([1]), '[1]')
+        self.assertTrue(lazy_json.loads is json.loads)
+
+    def test_missing_module(self):
+        """
+        A missing module only raises once it is used.
+        """
+        lazy_missing = lazy_import('readability_module_that_does_not_exist')
+        with self.assertRaises(ImportError):
+            lazy_missing.anything
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+try:
+    import unittest2 as unittest
+except ImportError:
+    import unittest
+
+from readability import ParserClient, ReaderClient
+from readability.instrumentation import MetricsAggregator, StatsdEmitter, route_for
+from readability.testing import FakeReadabilityServer
+
+
+class RecordingHook(object):
+    """
+    Hook remembering the events it saw.
+    """
+    def __init__(self):
+        self.started = []
+        self.finished = []
+
+    def before_request(self, event):
+        self.started.append(event)
+
+    def after_request(self, event):
+        self.finished.append(event)
+
+
+class RouteForTestCase(unittest.TestCase):
+    def test_route_for(self):
+        self.assertEqual(route_for('bookmarks/42/tags/7'), 'bookmarks/{id}/tags/{id}')
+        self.assertEqual(route_for('bookmarks'), 'bookmarks')
+        self.assertEqual(route_for('parser'), 'parser')
+        self.assertEqual(route_for(''), '')
+
+
+class ClientHooksTestCase(unittest.TestCase):
+    """
+    Hooks fire around every request made by the clients.
+    """
+    def setUp(self):
+        self.server = FakeReadabilityServer(bookmark_count=3).start()
+        self.addCleanup(self.server.stop)
+        token_key, token_secret = self.server.token_for('user')
+        self.hook = RecordingHook()
+        self.reader = ReaderClient(token_key, token_secret, hooks=[self.hook],
+            **self.server.client_kwargs('reader'))
+        self.parser = ParserClient(hooks=[self.hook], **self.server.client_kwargs('parser'))
+
+    def test_parser_event(self):
+        response = self.parser.get_article(url='http://example.com/a.html')
+        self.assertEqual(len(self.hook.started), 1)
+        event = self.hook.finished[0]
+        self.assertTrue(event is self.hook.started[0])
+        self.assertEqual(event.client, 'parser')
+        self.assertEqual(event.method, 'GET')
+        self.assertEqual(event.endpoint, 'parser')
+        self.assertEqual(event.status, 200)
+        self.assertEqual(event.bytes_sent, 0)
+        # Responses are compressed, bytes received counts the wire size.
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertEqual(event.bytes_received, int(response.headers['Content-Length']))
+        self.assertTrue(event.bytes_received < len(response.content))
+        self.assertTrue(event.total_time >= event.ttfb > 0)
+        self.assertEqual(event.retries, 0)
+        self.assertEqual(event.cache, None)
+
+    def test_reader_event(self):
+        self.reader.add_tags_to_bookmark(1, 'one')
+        event = self.hook.finished[-1]
+        self.assertEqual(event.client, 'reader')
+        self.assertEqual(event.endpoint, 'bookmarks/1/tags')
+        self.assertEqual(event.route, 'bookmarks/{id}/tags')
+        self.assertEqual(event.status, 202)
+        self.assertEqual(event.bytes_sent, len('tags=one'))
+
+    def test_error_event(self):
+        """
+        Transport errors are reported to hooks and re-raised.
+        """
+        client = ParserClient(token='token', hooks=[self.hook],
+            base_url_template='http://127.0.0.1:1/{}')
+        with self.assertRaises(Exception):
+            client.get_root()
+        event = self.hook.finished[0]
+        self.assertEqual(event.status, None)
+        self.assertTrue(event.error is not None)
+
+    def test_failing_hook(self):
+        """
+        A failing hook does not break the request.
+        """
+        def broken(event):
+            raise RuntimeError('boom')
+        self.parser.add_hook(broken)
+        self.assertEqual(self.parser.get_root().status_code, 200)
+
+    def test_aggregator(self):
+        aggregator = MetricsAggregator()
+        self.reader.add_hook(aggregator)
+        self.reader.get_bookmark(1)
+        self.reader.get_bookmark(2)
+        self.reader.get_bookmark(999)
+        snapshot = aggregator.snapshot()
+        self.assertEqual(snapshot[('reader', 'GET', 'bookmarks/{id}', 200)]['count'], 2)
+        self.assertEqual(snapshot[('reader', 'GET', 'bookmarks/{id}', 404)]['count'], 1)
+        aggregator.reset()
+        self.assertEqual(aggregator.snapshot(), {})
+
+    def test_connect_time(self):
+        """
+        The first request reports the time spent connecting, later ones
+        reuse the pooled connection.
+        """
+        for transport in ('requests', 'urllib3'):
+            hook = RecordingHook()
+            parser = ParserClient(transport=transport, hooks=[hook],
+                **self.server.client_kwargs('parser'))
+            self.addCleanup(parser.transport.close)
+            parser.get_article(url='http://example.com/a.html')
+            parser.get_article_status(url='http://example.com/a.html')
+            first, second = hook.finished
+            self.assertTrue(first.connect_time > 0, transport)
+            self.assertEqual(second.connect_time, 0.0)
+
+        spooled = ParserClient(spool_threshold=16, hooks=[hook], **self.server.client_kwargs('parser'))
+        self.addCleanup(spooled.transport.close)
+        spooled.get_article(url='http://example.com/a.html')
+        self.assertTrue(hook.finished[-1].connect_time > 0)
+
+    def test_statsd_emitter(self):
+        lines = []
+        self.parser.add_hook(StatsdEmitter(prefix='rdb', sink=lines.append))
+        self.parser.get_article_status(url='http://example.com/a.html')
+        payload = lines[0].split('\n')
+        self.assertEqual(payload[0], 'rdb.parser.head.parser.200.requests:1|c')
+        self.assertTrue(any(line.startswith('rdb.parser.head.parser.200.total:')
+            and line.endswith('|ms') for line in payload))
+        self.assertTrue(any(line.startswith('rdb.parser.head.parser.200.connect:')
+            for line in payload))
+
+
+if __name__ == '__main__':
+    unittest.main()
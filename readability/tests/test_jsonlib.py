@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+import json
+import re
+from decimal import Decimal
+try:
+    import unittest2 as unittest
+except ImportError:
+    import unittest
+
+import requests
+
+from readability import ParserClient, jsonlib
+from readability.testing import FakeReadabilityServer, FakeResponse
+
+
+class JSONBackendTestCase(unittest.TestCase):
+    """
+    Tests for `readability.jsonlib`.
+    """
+    def tearDown(self):
+        jsonlib.set_backend(None)
+
+    def test_backends(self):
+        """
+        Every installed backend decodes text and bytes alike, and rejects
+        invalid JSON with a ValueError.
+        """
+        document = {u'title': u'Río', u'pages': [1, 2.5, None, True]}
+        encoded = json.dumps(document)
+        self.assertEqual(jsonlib.available_backends()[-1], 'json')
+        for backend in jsonlib.available_backends():
+            jsonlib.set_backend(backend)
+            self.assertEqual(jsonlib.get_backend()[0], backend)
+            self.assertEqual(jsonlib.loads(encoded), document)
+            self.assertEqual(jsonlib.loads(encoded.encode('utf-8')), document)
+            with self.assertRaises(ValueError):
+                jsonlib.loads(b'{"title": ')
+
+    def test_default(self):
+        jsonlib.set_backend(None)
+        self.assertEqual(jsonlib.get_backend()[0], jsonlib.available_backends()[0])
+        with self.assertRaises(ValueError):
+            jsonlib.set_backend('yaml')
+
+    def test_keyword_arguments(self):
+        """
+        Keyword arguments are decoded with the standard library.
+        """
+        self.assertEqual(jsonlib.loads(b'{"score": 0.1}', parse_float=Decimal),
+            {'score': Decimal('0.1')})
+
+    def test_responses(self):
+        """
+        Responses of every transport decode with the backend.
+        """
+        with FakeReadabilityServer() as server:
+            expected = None
+            for transport in ('requests', 'urllib3'):
+                client = ParserClient(transport=transport, **server.client_kwargs('parser'))
+                response = client.get_article(url='http://example.com/json.html')
+                article = response.json()
+                expected = expected or article
+                self.assertEqual(article, expected)
+                self.assertEqual(article, json.loads(response.content.decode('utf-8')))
+                if transport == 'requests':
+                    self.assertTrue(isinstance(response, requests.Response))
+
+    def test_invalid_responses(self):
+        """
+        Invalid JSON raises `requests.exceptions.JSONDecodeError` whatever
+        the transport and backend, like `requests.Response.json`.
+        """
+        with FakeReadabilityServer() as server:
+            server.app.routes.insert(0, ('GET', re.compile('/invalid$'),
+                lambda request: FakeResponse(200, b'{"title": ',
+                    {'Content-Type': 'application/json'}), False))
+            for backend in jsonlib.available_backends():
+                jsonlib.set_backend(backend)
+                for transport in ('requests', 'urllib3'):
+                    client = ParserClient(transport=transport, **server.client_kwargs('parser'))
+                    response = client.transport.request('GET', server.url + '/invalid')
+                    with self.assertRaises(requests.exceptions.JSONDecodeError) as context:
+                        response.json()
+                    self.assertEqual((context.exception.doc, context.exception.pos),
+                        ('{"title": ', 10), (backend, transport))
+
+
+if __name__ == '__main__':
+    unittest.main()
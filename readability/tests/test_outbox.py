@@ -0,0 +1,194 @@
+# -*- coding: utf-8 -*-
+import os
+import shutil
+import tempfile
+import time
+try:
+    import unittest2 as unittest
+except ImportError:
+    import unittest
+
+from readability import ReaderClient
+from readability.outbox import Outbox
+from readability.testing import FakeReadabilityServer, READER_PREFIX
+
+
+class OutboxTestCase(unittest.TestCase):
+    """
+    Tests for `Outbox` against the fake server.
+    """
+    def setUp(self):
+        self.server = FakeReadabilityServer(bookmark_count=5).start()
+        self.addCleanup(self.server.stop)
+        token_key, token_secret = self.server.token_for('user')
+        self.client = ReaderClient(token_key, token_secret, **self.server.client_kwargs('reader'))
+        self.bookmark_ids = [bookmark['id'] for bookmark in
+            self.client.get_bookmarks().json()['bookmarks']]
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.path = os.path.join(self.directory, 'outbox.sqlite3')
+
+    def outbox(self, **kwargs):
+        outbox = Outbox(self.client, self.path, **kwargs)
+        self.addCleanup(outbox.close, drain=False)
+        return outbox
+
+    def urls(self):
+        return set(bookmark['article']['url'] for bookmark in
+            self.client.get_bookmarks(per_page=50).json()['bookmarks'])
+
+    def test_replay_in_order(self):
+        """
+        Journaled mutations are sent in order by the background thread.
+        """
+        outbox = self.outbox()
+        bookmark_id = self.bookmark_ids[0]
+        outbox.add_bookmark('http://example.com/new.html', favorite=True)
+        outbox.add_tags_to_bookmark(bookmark_id, 'one')
+        outbox.update_bookmark(bookmark_id, archive=True)
+        outbox.update_bookmark(bookmark_id, read_percent=0.3)
+        outbox.add_tags_to_bookmark(self.bookmark_ids[1], 'two')
+        deadline = time.time() + 5
+        while outbox.pending() and time.time() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(outbox.pending(), 0)
+        self.assertTrue('http://example.com/new.html' in self.urls())
+        bookmark = self.client.get_bookmark(bookmark_id).json()
+        self.assertTrue(bookmark['archive'])
+        self.assertEqual(bookmark['read_percent'], '0.30')
+        self.assertEqual([tag['text'] for tag in bookmark['tags']], ['one'])
+        self.assertEqual(self.server.stats[('POST', READER_PREFIX + 'bookmarks/{0}'.format(bookmark_id))], 1)
+
+    def test_collapse(self):
+        """
+        Pending mutations made pointless by later ones are not sent.
+        """
+        outbox = self.outbox()
+        first, second = self.bookmark_ids[:2]
+        with outbox.drain_lock:
+            outbox.add_bookmark('http://example.com/gone.html')
+            outbox.add_tags_to_bookmark(first, 'a,b')
+            outbox.add_tags_to_bookmark(first, 'b, c')
+            outbox.update_bookmark(first, favorite=True)
+            outbox.update_bookmark(first, read_percent=0.5)
+            outbox.update_bookmark(second, archive=True)
+            outbox.delete_bookmark(second)
+            self.assertEqual(outbox.delete_bookmark(url='http://example.com/gone.html'), None)
+            entries = outbox.entries()
+            self.assertEqual([(entry.method, entry.args) for entry in entries], [
+                ('add_tags_to_bookmark', {'bookmark_id': first, 'tags': 'a,b,c'}),
+                ('update_bookmark', {'bookmark_id': first, 'favorite': True, 'read_percent': 0.5}),
+                ('delete_bookmark', {'bookmark_id': second}),
+            ])
+        outbox.close()
+        self.assertFalse('http://example.com/gone.html' in self.urls())
+        self.assertEqual(self.client.get_bookmark(second).status_code, 404)
+        tags = [tag['text'] for tag in self.client.get_bookmark(first).json()['tags']]
+        self.assertEqual(tags, ['a', 'b', 'c'])
+
+    def test_delete_added_url(self):
+        """
+        A bookmark added through the outbox can be deleted by its url.
+        """
+        outbox = self.outbox()
+        outbox.add_bookmark('http://example.com/later.html')
+        outbox.drain()
+        self.assertTrue('http://example.com/later.html' in self.urls())
+        outbox.delete_bookmark(url='http://example.com/later.html')
+        outbox.drain()
+        self.assertFalse('http://example.com/later.html' in self.urls())
+
+    def test_delete_added_url_without_location(self):
+        """
+        The id of an added bookmark is looked up when the response does not
+        say where it is.
+        """
+        add_bookmark = self.client.add_bookmark
+
+        def add_without_location(*args, **kwargs):
+            response = add_bookmark(*args, **kwargs)
+            del response.headers['Location']
+            return response
+
+        self.client.add_bookmark = add_without_location
+        outbox = self.outbox()
+        outbox.add_bookmark('http://example.com/nowhere.html')
+        outbox.drain()
+        outbox.delete_bookmark(url='http://example.com/nowhere.html')
+        outbox.drain()
+        self.assertEqual(outbox.dead_letters(), [])
+        self.assertFalse('http://example.com/nowhere.html' in self.urls())
+
+    def test_failing_callback(self):
+        """
+        An `on_error` callback raising doesn't stop the background thread.
+        """
+        def on_error(entry, error):
+            raise RuntimeError('callback failed')
+
+        outbox = self.outbox(on_error=on_error)
+        outbox.update_bookmark(999999, favorite=True)
+        outbox.update_bookmark(self.bookmark_ids[0], favorite=True)
+        deadline = time.time() + 5
+        while outbox.pending() and time.time() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(len(outbox.dead_letters()), 1)
+        outbox.update_bookmark(self.bookmark_ids[1], archive=True)
+        deadline = time.time() + 5
+        while outbox.pending() and time.time() < deadline:
+            time.sleep(0.01)
+        self.assertTrue(outbox.thread.is_alive())
+        self.assertTrue(self.client.get_bookmark(self.bookmark_ids[1]).json()['archive'])
+
+    def test_durable(self):
+        """
+        Entries survive the process, and are sent once the API is back.
+        """
+        self.server.app.error_rate = 1.0
+        outbox = self.outbox(min_backoff=0, max_attempts=100)
+        outbox.update_bookmark(self.bookmark_ids[0], favorite=True)
+        outbox.update_bookmark(999999, favorite=True)
+        outbox.close(drain=False)
+
+        self.server.app.error_rate = 0.0
+        outbox = self.outbox()
+        self.assertEqual(outbox.pending(), 2)
+        self.assertEqual(outbox.drain(), 2)
+        self.assertTrue(self.client.get_bookmark(self.bookmark_ids[0]).json()['favorite'])
+        dead = outbox.dead_letters()
+        self.assertEqual(len(dead), 1)
+        self.assertEqual(dead[0][0].args['bookmark_id'], 999999)
+        self.assertEqual(dead[0][1], 404)
+
+    def test_retries(self):
+        """
+        Transient failures are retried, blocking the entries behind them,
+        before being given up on.
+        """
+        errors = []
+        self.server.app.error_rate = 1.0
+        outbox = self.outbox(min_backoff=0, max_attempts=2,
+            on_error=lambda entry, error: errors.append(entry))
+        with outbox.drain_lock:
+            outbox.update_bookmark(self.bookmark_ids[0], favorite=True)
+            outbox.update_bookmark(self.bookmark_ids[1], favorite=True)
+            self.assertEqual(outbox.entries()[0].attempts, 0)
+        deadline = time.time() + 5
+        while outbox.pending() and time.time() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(outbox.pending(), 0)
+        self.assertEqual(outbox.stats['retries'], 2)
+        self.assertEqual([status for _, status, _ in outbox.dead_letters()], [500, 500])
+        self.assertEqual([entry.args['bookmark_id'] for entry in errors], self.bookmark_ids[:2])
+
+    def test_closed(self):
+        outbox = self.outbox()
+        outbox.close()
+        with self.assertRaises(RuntimeError):
+            outbox.delete_bookmark(self.bookmark_ids[0])
+        with self.assertRaises(ValueError):
+            Outbox(self.client, self.path).delete_bookmark()
+
+
+if __name__ == '__main__':
+    unittest.main()
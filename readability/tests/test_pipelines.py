@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+try:
+    import unittest2 as unittest
+except ImportError:
+    import unittest
+
+from readability import ParserClient
+from readability.pipelines import ConfidenceGatedParser
+from readability.testing import FakeReadabilityServer, PARSER_PREFIX
+
+
+class ConfidenceGatedParserTestCase(unittest.TestCase):
+    """
+    Tests for `ConfidenceGatedParser` against the fake server.
+    """
+    def setUp(self):
+        self.server = FakeReadabilityServer().start()
+        self.addCleanup(self.server.stop)
+        self.client = ParserClient(**self.server.client_kwargs('parser'))
+        self.urls = ['http://example.com/{0}.html'.format(index) for index in range(30)]
+
+    def parses(self):
+        return self.server.stats[('GET', PARSER_PREFIX + 'parser')]
+
+    def test_gating(self):
+        """
+        Only urls at or above the threshold are parsed, the others are
+        reported as dropped, and the input order is kept.
+        """
+        report = ConfidenceGatedParser(self.client, threshold=0.5).run(self.urls)
+        self.assertTrue(report.parsed and report.dropped)
+        self.assertEqual(report.failed, [])
+        self.assertTrue(all(confidence >= 0.5 for _, confidence, _ in report.parsed))
+        self.assertTrue(all(confidence < 0.5 for _, confidence in report.dropped))
+        self.assertEqual(len(report.parsed) + len(report.dropped), len(self.urls))
+        self.assertEqual(self.parses(), len(report.parsed))
+        for url, _, response in report.parsed:
+            self.assertEqual(response.json()['url'], url)
+        parsed_urls = [url for url, _, _ in report.parsed]
+        self.assertEqual(parsed_urls, [url for url in self.urls if url in parsed_urls])
+        self.assertEqual(self.server.stats[('GET', PARSER_PREFIX + 'confidence')], len(self.urls))
+
+    def test_thresholds(self):
+        report = ConfidenceGatedParser(self.client, threshold=0).run(self.urls)
+        self.assertEqual(len(report.parsed), len(self.urls))
+        report = ConfidenceGatedParser(self.client, threshold=1.1).run(self.urls)
+        self.assertEqual(len(report.dropped), len(self.urls))
+
+    def test_failures(self):
+        """
+        Failed confidence checks are reported, not parsed.
+        """
+        get_confidence = self.client.get_confidence
+
+        def failing(url=None, article_id=None):
+            if url == self.urls[0]:
+                raise IOError('connection reset')
+            return get_confidence(url=url, article_id=article_id)
+
+        self.client.get_confidence = failing
+        report = ConfidenceGatedParser(self.client, threshold=0).run(self.urls)
+        self.assertEqual(len(report.failed), 1)
+        self.assertEqual(report.failed[0][0], self.urls[0])
+        self.assertTrue(isinstance(report.failed[0][1], IOError))
+        self.assertEqual(report.summary()['parsed'], len(self.urls) - 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
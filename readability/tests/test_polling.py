@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+import threading
+import time
+try:
+    import unittest2 as unittest
+except ImportError:
+    import unittest
+
+from readability import ParserClient
+from readability.polling import ArticlePoller, PendingArticle, PollError, PollTimeout
+from readability.testing import FakeReadabilityServer, PARSER_PREFIX
+
+
+class ArticlePollerTestCase(unittest.TestCase):
+    """
+    Tests for `ArticlePoller` against the fake server.
+    """
+    def setUp(self):
+        self.server = FakeReadabilityServer(processing_time=0.3).start()
+        self.addCleanup(self.server.stop)
+        self.client = ParserClient(**self.server.client_kwargs('parser'))
+        self.poller = ArticlePoller(self.client, min_interval=0.05, max_interval=0.5, seed=1)
+        self.addCleanup(self.poller.close)
+        self.urls = ['http://example.com/{0}.html'.format(index) for index in range(10)]
+
+    def test_fetches_once_ready(self):
+        """
+        Articles are fetched once, after they became ready, and later
+        checks are spaced by the learnt processing time.
+        """
+        done = []
+        futures = self.poller.submit_many(urls=self.urls, callback=done.append)
+        for url, future in zip(self.urls, futures):
+            response = future.result(timeout=5)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.json()['url'], url)
+        self.assertEqual(len(done), len(self.urls))
+        self.assertEqual(self.server.stats[('GET', PARSER_PREFIX + 'parser')], len(self.urls))
+        self.assertEqual(self.poller.stats['fetched'], len(self.urls))
+        self.assertTrue(0.3 <= self.poller.ready_estimate < 1)
+        # Backing off keeps the checks to a handful per article.
+        self.assertTrue(self.poller.stats['checks'] <= 6 * len(self.urls))
+
+    def test_next_interval(self):
+        """
+        Intervals back off, are capped, and never end before articles
+        usually become ready.
+        """
+        poller = ArticlePoller(self.client, min_interval=1, max_interval=10, jitter=0)
+        item = PendingArticle('http://example.com/', None, None, 100, None)
+        self.assertEqual([poller.next_interval(item, 100) for _ in range(5)], [1, 2, 4, 8, 10])
+        poller.ready_estimate = 5
+        item = PendingArticle('http://example.com/', None, None, 100, None)
+        self.assertEqual(poller.next_interval(item, 101), 4)
+        self.assertEqual(poller.next_interval(item, 104), 8)
+
+    def test_timeout(self):
+        future = self.poller.submit(url=self.urls[0], timeout=0.1)
+        with self.assertRaises(PollTimeout):
+            future.result(timeout=5)
+
+    def test_not_found(self):
+        """
+        Unknown articles fail without being retried.
+        """
+        future = self.poller.submit(article_id='missing')
+        with self.assertRaises(PollError) as raised:
+            future.result(timeout=5)
+        self.assertEqual(raised.exception.response.status_code, 404)
+        self.assertEqual(self.poller.stats['checks'], 1)
+
+    def test_close(self):
+        """
+        Closing the poller fails the articles still pending.
+        """
+        self.poller.initial_delay = 60
+        future = self.poller.submit(url=self.urls[0])
+        self.poller.close()
+        self.assertTrue(future.done())
+        self.assertEqual(self.poller.pending(), 0)
+
+    def test_batches(self):
+        """
+        No more requests than workers are in flight at once.
+        """
+        in_flight = [0, 0]
+        lock = threading.Lock()
+        get_article_status = self.client.get_article_status
+
+        def counting(*args, **kwargs):
+            with lock:
+                in_flight[0] += 1
+                in_flight[1] = max(in_flight)
+            try:
+                time.sleep(0.01)
+                return get_article_status(*args, **kwargs)
+            finally:
+                with lock:
+                    in_flight[0] -= 1
+
+        self.client.get_article_status = counting
+        poller = ArticlePoller(self.client, max_workers=3, min_interval=0.05)
+        self.addCleanup(poller.close)
+        for future in poller.submit_many(urls=self.urls):
+            future.result(timeout=5)
+        self.assertTrue(in_flight[1] <= 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
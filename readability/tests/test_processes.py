@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+import multiprocessing
+import os
+import pickle
+try:
+    import unittest2 as unittest
+except ImportError:
+    import unittest
+
+from concurrent.futures import ProcessPoolExecutor
+
+from readability import ParserClient, ReaderClient
+from readability.spooling import MemoryBudget, SpoolingTransport
+from readability.testing import FakeReadabilityServer
+from readability.transports import RequestsTransport, Urllib3Transport
+
+
+class CountingHook(object):
+    def __init__(self):
+        self.count = 0
+
+    def after_request(self, event):
+        self.count += 1
+
+
+def bookmark_titles(client, page):
+    """
+    Work done in a pool process with a client pickled by the parent.
+    """
+    response = client.get_bookmarks(page=page, per_page=10)
+    return os.getpid(), [bookmark['article']['title'] for bookmark in response.json()['bookmarks']]
+
+
+def article_title(client, url):
+    return client.get_article(url=url).json()['title']
+
+
+def connections(client):
+    """
+    Use a client inherited from the parent, and report the connections it
+    used.
+    """
+    status = client.get_user().status_code
+    return status, id(client.transport.adapter)
+
+
+# Start methods, and `mp_context` of `ProcessPoolExecutor`, are Python 3
+# only.
+HAS_FORK = (hasattr(multiprocessing, 'get_context')
+    and 'fork' in multiprocessing.get_all_start_methods())
+
+
+class ProcessTestCase(unittest.TestCase):
+    """
+    Clients handed to, or inherited by, other processes.
+    """
+    def setUp(self):
+        self.server = FakeReadabilityServer(bookmark_count=30).start()
+        self.addCleanup(self.server.stop)
+        self.token_key, self.token_secret = self.server.token_for('user')
+        self.context = multiprocessing.get_context('fork') if HAS_FORK else None
+
+    def reader_client(self, **kwargs):
+        client = ReaderClient(self.token_key, self.token_secret,
+            **dict(self.server.client_kwargs('reader'), **kwargs))
+        self.addCleanup(client.transport.close)
+        return client
+
+    def test_pickle_by_configuration(self):
+        """
+        Connections and recorded latencies are left behind, settings are
+        kept.
+        """
+        hook = CountingHook()
+        client = self.reader_client(transport=RequestsTransport(pool_maxsize=3, pool_block=True),
+            hooks=[hook])
+        self.assertEqual(client.get_user().status_code, 200)
+
+        copy = pickle.loads(pickle.dumps(client))
+        self.addCleanup(copy.transport.close)
+        self.assertEqual(copy.token_key, client.token_key)
+        self.assertEqual(copy.base_url_template, client.base_url_template)
+        self.assertEqual((copy.transport.pool_maxsize, copy.transport.pool_block), (3, True))
+        self.assertEqual(list(copy.transport._sessions), [])
+        self.assertEqual(copy.latency.histograms, {})
+        self.assertEqual(copy.hooks[0].count, 1)
+
+        self.assertEqual(copy.get_user().status_code, 200)
+        self.assertEqual(copy.hooks[0].count, 2)
+        self.assertFalse(copy.transport.adapter is client.transport.adapter)
+
+    def test_pickle_wrapped_transports(self):
+        client = ParserClient(transport=Urllib3Transport(maxsize=2), spool_threshold=1024,
+            memory_budget=MemoryBudget(4096), latency_histograms=False,
+            **self.server.client_kwargs('parser'))
+        budget = client.transport.budget
+        self.assertTrue(budget.try_acquire(100))
+
+        copy = pickle.loads(pickle.dumps(client))
+        self.assertTrue(isinstance(copy.transport, SpoolingTransport))
+        self.assertEqual(copy.transport.transport.maxsize, 2)
+        self.assertEqual((copy.transport.budget.limit, copy.transport.budget.in_use), (4096, 0))
+        self.assertEqual(copy.latency, None)
+        self.assertEqual(copy.get_article(url='http://example.com/a.html').status_code, 200)
+
+    @unittest.skipUnless(HAS_FORK, 'needs the fork start method')
+    def test_process_pool(self):
+        client = self.reader_client()
+        expected = [bookmark['article']['title'] for bookmark in
+            client.get_bookmarks(per_page=30).json()['bookmarks']]
+        with ProcessPoolExecutor(max_workers=2, mp_context=self.context) as executor:
+            results = list(executor.map(bookmark_titles, [client] * 3, [1, 2, 3]))
+        self.assertEqual([title for _, titles in results for title in titles], expected)
+        self.assertFalse(os.getpid() in [pid for pid, _ in results])
+
+        parser = ParserClient(**self.server.client_kwargs('parser'))
+        urls = ['http://example.com/{0}.html'.format(index) for index in range(4)]
+        with ProcessPoolExecutor(max_workers=2, mp_context=self.context) as executor:
+            titles = list(executor.map(article_title, [parser] * len(urls), urls))
+        self.assertEqual(titles, [article_title(parser, url) for url in urls])
+
+    @unittest.skipUnless(HAS_FORK, 'needs the fork start method')
+    def test_fork(self):
+        """
+        A forked child drops the connections it inherited and opens its own,
+        leaving the parent's usable.
+        """
+        client = self.reader_client()
+        status, adapter = connections(client)
+        self.assertEqual(status, 200)
+
+        pool = self.context.Pool(1)
+        try:
+            child_status, _ = pool.apply(connections, (client,))
+        finally:
+            pool.close()
+            pool.join()
+        self.assertEqual(child_status, 200)
+        self.assertEqual(connections(client), (200, adapter))
+
+        # Inherited rather than pickled: run in the child itself.
+        read, write = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            try:
+                inherited = client.transport._adapter
+                status = client.get_user().status_code
+                ok = status == 200 and client.transport.adapter is not inherited
+                os.write(write, b'1' if ok else b'0')
+            finally:
+                os._exit(0)
+        os.waitpid(pid, 0)
+        self.assertEqual(os.read(read, 1), b'1')
+        os.close(read)
+        os.close(write)
+        self.assertEqual(connections(client), (200, adapter))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+import threading
+import time
+try:
+    import unittest2 as unittest
+except ImportError:
+    import unittest
+
+from readability import ReaderClient
+from readability.scheduling import BULK, INTERACTIVE, NORMAL, RequestScheduler
+from readability.testing import FakeReadabilityServer
+
+
+class RequestSchedulerTestCase(unittest.TestCase):
+    """
+    Tests for the order `RequestScheduler` hands slots out in.
+    """
+    def grants(self, scheduler, priorities):
+        """
+        Queue requests of `priorities`, in order, behind a held slot and
+        return the order they are granted slots in.
+        """
+        order = []
+        scheduler.acquire()
+        threads = []
+        for priority in priorities:
+            def request(priority=priority):
+                with scheduler.slot(priority):
+                    order.append(priority)
+            thread = threading.Thread(target=request)
+            thread.start()
+            threads.append(thread)
+            while scheduler.waiting < len(threads):
+                time.sleep(0.001)
+        scheduler.release()
+        for thread in threads:
+            thread.join()
+        self.assertEqual((scheduler.in_flight, scheduler.waiting), (0, 0))
+        return order
+
+    def test_interactive_first(self):
+        scheduler = RequestScheduler(max_in_flight=1)
+        order = self.grants(scheduler, [BULK] * 4 + [INTERACTIVE] * 2)
+        self.assertEqual(order, [INTERACTIVE] * 2 + [BULK] * 4)
+        self.assertEqual(scheduler.stats[BULK], 4)
+
+    def test_weighted_shares(self):
+        """
+        Waiting classes share slots in proportion to their weights, so that
+        the lower ones still make progress.
+        """
+        scheduler = RequestScheduler(max_in_flight=1)
+        order = self.grants(scheduler, [BULK] * 10 + [NORMAL] * 10)
+        self.assertEqual(order[:10].count(NORMAL), 8)
+        self.assertEqual(order[:5], [NORMAL, NORMAL, NORMAL, BULK, NORMAL])
+
+    def test_priority_context(self):
+        scheduler = RequestScheduler(max_in_flight=1, weights={'batch': 2})
+        self.assertEqual(scheduler.current_priority(), NORMAL)
+        self.assertEqual(scheduler.current_priority(BULK), BULK)
+        with scheduler.priority('batch'):
+            self.assertEqual(scheduler.current_priority(BULK), 'batch')
+        self.assertEqual(scheduler.current_priority(BULK), BULK)
+        self.assertRaises(ValueError, scheduler.acquire, 'urgent')
+        self.assertRaises(ValueError, RequestScheduler, max_in_flight=0)
+
+
+class ScheduledClientTestCase(unittest.TestCase):
+    """
+    Clients sharing a scheduler against a slow fake server.
+    """
+    def setUp(self):
+        self.server = FakeReadabilityServer(bookmark_count=5).start()
+        self.addCleanup(self.server.stop)
+        self.server.app.latency = 0.02
+        self.token_key, self.token_secret = self.server.token_for('user')
+        self.scheduler = RequestScheduler(max_in_flight=2)
+
+    def client(self, **kwargs):
+        client = ReaderClient(self.token_key, self.token_secret, scheduler=self.scheduler,
+            **dict(self.server.client_kwargs('reader'), **kwargs))
+        self.addCleanup(client.transport.close)
+        return client
+
+    def test_interactive_overtakes_bulk(self):
+        lock = threading.Lock()
+        concurrency = {'now': 0, 'max': 0}
+
+        class ConcurrencyHook(object):
+            def before_request(self, event):
+                with lock:
+                    concurrency['now'] += 1
+                    concurrency['max'] = max(concurrency['max'], concurrency['now'])
+
+            def after_request(self, event):
+                with lock:
+                    concurrency['now'] -= 1
+
+        bulk = self.client(priority=BULK, hooks=[ConcurrencyHook()])
+        interactive = self.client(hooks=[ConcurrencyHook()])
+        self.assertRaises(ValueError, self.client, priority='urgent')
+        bookmark_id = bulk.get_bookmarks().json()['bookmarks'][0]['id']
+
+        stop = threading.Event()
+
+        def sync():
+            while not stop.is_set():
+                bulk.get_bookmark(bookmark_id)
+
+        threads = [threading.Thread(target=sync) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        try:
+            while self.scheduler.waiting < 6:
+                time.sleep(0.001)
+            for _ in range(5):
+                with self.scheduler.priority(INTERACTIVE):
+                    self.assertEqual(interactive.get_user().status_code, 200)
+        finally:
+            stop.set()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(concurrency['max'], 2)
+        # Interactive requests wait for a request in flight to finish, not
+        # for the bulk requests queued before them.
+        waits = self.scheduler.waits
+        self.assertEqual(waits[INTERACTIVE].count, 5)
+        self.assertTrue(waits[INTERACTIVE].max < 0.1, waits[INTERACTIVE].max)
+        self.assertTrue(waits[BULK].max > waits[INTERACTIVE].max)
+        # Queueing is not part of the requests' latency.
+        user_latency = interactive.latency.histogram('reader', 'GET', 'users/{id}', 200)
+        self.assertEqual(user_latency.count, 5)
+        self.assertTrue(user_latency.max < 0.1)
+
+
+if __name__ == '__main__':
+    unittest.main()
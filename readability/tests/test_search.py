@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+import os
+import shutil
+import tempfile
+try:
+    import unittest2 as unittest
+except ImportError:
+    import unittest
+
+from readability import ParserClient
+from readability.search import ArticleIndex, decode_varints, encode_varint, tokenize
+from readability.testing import FakeReadabilityServer
+
+
+def article(article_id, title, content, excerpt=''):
+    return {'id': article_id, 'title': title, 'content': content,
+        'excerpt': excerpt, 'url': 'http://example.com/{0}'.format(article_id)}
+
+
+class TokenizeTestCase(unittest.TestCase):
+    """
+    Tests for the helpers of the index.
+    """
+    def test_tokenize(self):
+        self.assertEqual(tokenize(u'<p>The <b>Río</b> &amp; the river</p><script>var x;</script>'),
+            [u'río', u'river'])
+
+    def test_varints(self):
+        values = [0, 1, 127, 128, 300, 2 ** 40]
+        out = bytearray()
+        for value in values:
+            encode_varint(value, out)
+        self.assertEqual(decode_varints(bytes(out), 0, len(out)), values)
+
+
+class ArticleIndexTestCase(unittest.TestCase):
+    """
+    Tests for `ArticleIndex`.
+    """
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.path = os.path.join(self.directory, 'index')
+        self.index = ArticleIndex(self.path)
+        self.addCleanup(self.index.close)
+        self.index.add_many([
+            article('a', 'Life on the Mississippi', '<p>A river pilot on the Mississippi river.</p>'),
+            article('b', 'Steamboats', '<p>Steamboats went up and down the Mississippi.</p>'),
+            article('c', 'Cooking', '<p>How to bake bread.</p>', excerpt='bread and river fish'),
+        ])
+
+    def ids(self, query, **kwargs):
+        return [hit.article_id for hit in self.index.search(query, **kwargs)]
+
+    def test_ranking(self):
+        """
+        Title matches and repeated terms rank first.
+        """
+        self.assertEqual(self.ids('mississippi'), ['a', 'b'])
+        self.assertEqual(self.ids('river')[0], 'a')
+        self.assertEqual(self.ids('bread'), ['c'])
+        self.assertEqual(self.ids('nothing'), [])
+        self.assertEqual(self.ids('the'), [])
+        self.assertEqual(self.ids('river steamboats', require_all=True), [])
+        self.assertEqual(self.ids('river mississippi', require_all=True), ['a'])
+        self.assertEqual(len(self.ids('mississippi river bread', limit=2)), 2)
+
+    def test_incremental(self):
+        """
+        New, replaced and removed articles are reflected in results.
+        """
+        self.index.add(article('d', 'Huckleberry Finn', 'A raft on the Mississippi'))
+        self.assertTrue('d' in self.ids('raft'))
+        self.index.add(article('b', 'Steamboats', 'Paddle wheels.'))
+        self.assertEqual(self.ids('steamboats'), ['b'])
+        self.assertFalse('b' in self.ids('mississippi'))
+        self.index.remove('c')
+        self.assertEqual(self.ids('bread'), [])
+        self.assertEqual(len(self.index), 3)
+
+    def test_persistent(self):
+        """
+        The index is reopened from disk, and merging keeps results.
+        """
+        self.index.add(article('b', 'Steamboats', 'Paddle wheels.'))
+        self.index.close()
+        index = ArticleIndex(self.path, max_segments=1)
+        self.addCleanup(index.close)
+        self.assertEqual(len(index), 3)
+        self.assertEqual(len(index.segments), 2)
+        before = [(hit.article_id, round(hit.score, 6)) for hit in index.search('mississippi paddle')]
+        index.merge()
+        self.assertEqual(len(index.segments), 1)
+        self.assertEqual(len(os.listdir(self.path)), 2)
+        after = [(hit.article_id, round(hit.score, 6)) for hit in index.search('mississippi paddle')]
+        self.assertEqual(before, after)
+
+    def total_length(self, index):
+        return sum(index.by_name[name].docs[docnum][1]
+            for name, docnum in index.locations.values())
+
+    def test_tiered_merges(self):
+        """
+        Only the smallest segments are merged, and the total length of the
+        articles is kept up to date.
+        """
+        self.index.max_segments = 4
+        first = self.index.segments[0].path
+        for number in range(10):
+            self.index.add(article('n{0}'.format(number), 'Raft {0}'.format(number),
+                'Down the Mississippi on a raft.'))
+            if number % 3 == 0:
+                self.index.remove('n{0}'.format(number - 1))
+            self.index.commit()
+            self.assertTrue(len(self.index.segments) <= 4)
+            self.assertEqual(self.index.total_length, self.total_length(self.index))
+        self.assertTrue(first in [segment.path for segment in self.index.segments])
+        self.assertEqual(len(self.ids('raft', limit=20)), 7)
+        before = [(hit.article_id, round(hit.score, 6)) for hit in self.index.search('raft')]
+        self.index.close()
+        index = ArticleIndex(self.path)
+        self.addCleanup(index.close)
+        self.assertEqual(index.total_length, self.total_length(index))
+        index.merge()
+        self.assertEqual(index.total_length, self.total_length(index))
+        self.assertEqual([(hit.article_id, round(hit.score, 6)) for hit in index.search('raft')],
+            before)
+
+    def test_fetched_articles(self):
+        """
+        Responses from the clients can be indexed as they are.
+        """
+        with FakeReadabilityServer() as server:
+            client = ParserClient(**server.client_kwargs('parser'))
+            response = client.get_article(url='http://example.com/fetched.html')
+            self.index.add(response)
+            self.index.commit()
+            title = response.json()['title']
+        self.assertEqual(self.ids(title)[0], response.json()['id'])
+
+
+if __name__ == '__main__':
+    unittest.main()
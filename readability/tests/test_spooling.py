@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+import gc
+try:
+    import unittest2 as unittest
+except ImportError:
+    import unittest
+
+from concurrent.futures import ThreadPoolExecutor
+
+from readability import ParserClient
+from readability.spooling import MemoryBudget, SpooledResponse, SpoolingTransport
+from readability.testing import FakeReadabilityServer
+from readability.transports import (Cassette, HTTPXTransport, RecordingTransport,
+    ReplayTransport, RequestsTransport, TransportResponse, Urllib3Transport)
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+
+class MemoryBudgetTestCase(unittest.TestCase):
+    def test_acquire(self):
+        budget = MemoryBudget(100)
+        self.assertTrue(budget.try_acquire(60))
+        self.assertFalse(budget.try_acquire(50))
+        budget.release(60)
+        self.assertTrue(budget.try_acquire(100))
+        self.assertEqual(budget.available, 0)
+        self.assertEqual(budget.peak, 100)
+
+
+class SpoolingTransportTestCase(unittest.TestCase):
+    """
+    Tests for `SpoolingTransport` against the fake server.
+    """
+    def setUp(self):
+        self.server = FakeReadabilityServer(article_size=256 * 1024).start()
+        self.addCleanup(self.server.stop)
+        self.url = 'http://example.com/long.html'
+        self.expected = ParserClient(**self.server.client_kwargs('parser')).get_article(
+            url=self.url).json()
+
+    def client(self, transport=None, **kwargs):
+        return ParserClient(transport=transport, **dict(self.server.client_kwargs('parser'), **kwargs))
+
+    def exercise(self, transport):
+        client = self.client(transport, spool_threshold=64 * 1024)
+        response = client.get_article(url=self.url)
+        self.addCleanup(response.close)
+        self.assertTrue(isinstance(response, SpooledResponse))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), self.expected)
+        self.assertEqual(response.body_size, len(response.content))
+        self.assertEqual(response.mmap()[:1], b'{')
+        self.assertEqual(b''.join(response.iter_content(1000)), response.content)
+
+        small = client.get_confidence(url=self.url)
+        self.assertTrue(isinstance(small, TransportResponse))
+        self.assertFalse(isinstance(small, SpooledResponse))
+
+    def test_requests(self):
+        self.exercise(RequestsTransport())
+
+    def test_urllib3(self):
+        self.exercise(Urllib3Transport())
+
+    @unittest.skipIf(httpx is None, 'httpx is not installed')
+    def test_httpx(self):
+        self.exercise(HTTPXTransport(http2=False))
+
+    def test_wrapped_transport(self):
+        """
+        Transports that cannot stream are spooled after the fact.
+        """
+        cassette = Cassette()
+        self.client(RecordingTransport(cassette)).get_article(url=self.url)
+        transport = SpoolingTransport(ReplayTransport(cassette), threshold=1024)
+        response = self.client(transport).get_article(url=self.url)
+        self.assertTrue(isinstance(response, SpooledResponse))
+        self.assertEqual(response.json(), self.expected)
+        response.close()
+
+    def test_budget(self):
+        """
+        Bodies count against the budget until their response is closed, and
+        those that do not fit in what is left of it are spooled, whatever
+        their size.
+        """
+        budget = MemoryBudget(1024 * 1024)
+        client = self.client(spool_threshold=1024 * 1024, memory_budget=budget)
+        response = client.get_article(url=self.url)
+        self.assertFalse(isinstance(response, SpooledResponse))
+        size = len(response.content)
+        self.assertEqual(budget.in_use, size)
+        # Joining the chunks held the body twice.
+        self.assertEqual(budget.peak, 2 * size)
+        response.close()
+        self.assertEqual(budget.in_use, 0)
+
+        client.get_article(url=self.url)
+        gc.collect()
+        self.assertEqual(budget.in_use, 0)
+
+        budget.try_acquire(budget.limit - size)
+        response = client.get_article(url=self.url)
+        self.assertTrue(isinstance(response, SpooledResponse))
+        self.assertEqual(response.json(), self.expected)
+        response.close()
+        self.assertEqual(budget.in_use, budget.limit - size)
+
+    def test_budget_shared(self):
+        """
+        Concurrent requests never hold more than the budget together.
+        """
+        budget = MemoryBudget(600 * 1024)
+        client = self.client(spool_threshold=1024 * 1024, memory_budget=budget)
+
+        def fetch(index):
+            response = client.get_article(url='http://example.com/{0}.html'.format(index))
+            try:
+                return response.json()['url']
+            finally:
+                response.close()
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            urls = list(executor.map(fetch, range(16)))
+        self.assertEqual(urls, ['http://example.com/{0}.html'.format(index) for index in range(16)])
+        self.assertTrue(0 < budget.peak <= budget.limit)
+        self.assertEqual(budget.in_use, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,206 @@
+# -*- coding: utf-8 -*-
+import time
+try:
+    import unittest2 as unittest
+except ImportError:
+    import unittest
+
+from readability import xauth, ParserClient, ReaderClient
+from readability.testing import FakeReadabilityServer
+
+
+class FakeServerTestCase(unittest.TestCase):
+    """
+    Base test case running a `FakeReadabilityServer` per test.
+    """
+    server_kwargs = {}
+
+    def setUp(self):
+        self.server = FakeReadabilityServer(**self.server_kwargs).start()
+        self.addCleanup(self.server.stop)
+
+    def reader_client(self, username='user'):
+        token_key, token_secret = self.server.token_for(username)
+        return ReaderClient(token_key, token_secret,
+            **self.server.client_kwargs('reader'))
+
+    def parser_client(self):
+        return ParserClient(**self.server.client_kwargs('parser'))
+
+
+class FakeXAuthTest(FakeServerTestCase):
+    """
+    xauth against the fake `oauth/access_token/` endpoint.
+    """
+    def test_successful_auth(self):
+        """
+        Valid credentials give back the user's token pair.
+        """
+        token = xauth(base_url_template=self.server.reader_url_template,
+            consumer_key=self.server.consumer_key,
+            consumer_secret=self.server.consumer_secret,
+            username='user', password='password')
+        self.assertEqual(token, self.server.token_for('user'))
+
+    def test_bad_password(self):
+        """
+        A bad password raises a `ValueError`.
+        """
+        with self.assertRaises(ValueError):
+            xauth(base_url_template=self.server.reader_url_template,
+                consumer_key=self.server.consumer_key,
+                consumer_secret=self.server.consumer_secret,
+                username='user', password='bad password')
+
+
+class FakeReaderTest(FakeServerTestCase):
+    """
+    The Reader endpoints of the fake server.
+    """
+    server_kwargs = {'bookmark_count': 30}
+
+    def setUp(self):
+        super(FakeReaderTest, self).setUp()
+        self.client = self.reader_client()
+
+    def test_unauthorized(self):
+        """
+        Requests with an unknown token are rejected.
+        """
+        client = ReaderClient('bad key', 'bad secret',
+            **self.server.client_kwargs('reader'))
+        self.assertEqual(client.get_user().status_code, 401)
+
+    def test_get_user(self):
+        response = self.client.get_user()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['username'], 'user')
+
+    def test_bookmark_pagination(self):
+        """
+        Bookmarks are paginated with `page` and `per_page`.
+        """
+        response = self.client.get_bookmarks(per_page=20)
+        self.assertEqual(response.status_code, 200)
+        meta = response.json()['meta']
+        self.assertEqual(meta['item_count_total'], 30)
+        self.assertEqual(meta['num_pages'], 2)
+        second = self.client.get_bookmarks(per_page=20, page=2).json()
+        self.assertEqual(len(second['bookmarks']), 10)
+
+    def test_bookmark_filters(self):
+        """
+        Flag and date filters are applied.
+        """
+        all_bookmarks = self.client.get_bookmarks(per_page=50).json()['bookmarks']
+        favorites = self.client.get_bookmarks(favorite=True, per_page=50).json()['bookmarks']
+        self.assertEqual(len(favorites), len([bm for bm in all_bookmarks if bm['favorite']]))
+
+        added_since = self.client.get_bookmarks(
+            added_since='2013-01-01T00:20:00', per_page=50).json()['bookmarks']
+        self.assertEqual(len(added_since), 10)
+
+    def test_bookmark_lifecycle(self):
+        """
+        Add, update, tag and delete a bookmark.
+        """
+        response = self.client.add_bookmark('http://example.com/new.html', favorite=True)
+        self.assertEqual(response.status_code, 202)
+        bookmark_id = int(response.headers['Location'].rstrip('/').split('/')[-1])
+
+        bookmark = self.client.get_bookmark(bookmark_id).json()
+        self.assertTrue(bookmark['favorite'])
+        article = self.client.get_article(bookmark['article']['id'])
+        self.assertEqual(article.status_code, 200)
+        self.assertTrue('content' in article.json())
+
+        response = self.client.set_read_percent_of_bookmark(bookmark_id, 0.5)
+        self.assertEqual(response.json()['read_percent'], '0.50')
+
+        response = self.client.add_tags_to_bookmark(bookmark_id, 'one, two')
+        self.assertEqual(response.status_code, 202)
+        tags = self.client.get_bookmark_tags(bookmark_id).json()['tags']
+        self.assertEqual(sorted(tag['text'] for tag in tags), ['one', 'two'])
+        tag = self.client.get_tag(tags[0]['id']).json()
+        self.assertEqual(tag['applied_count'], 1)
+        self.assertEqual(len(self.client.get_tags().json()['tags']), 2)
+        for tag in tags:
+            response = self.client.delete_tag_from_bookmark(bookmark_id, tag['id'])
+            self.assertEqual(response.status_code, 204)
+
+        self.assertEqual(self.client.delete_bookmark(bookmark_id).status_code, 204)
+        self.assertEqual(self.client.get_bookmark(bookmark_id).status_code, 404)
+        deleted = self.client.get_bookmarks(only_deleted=True).json()['bookmarks']
+        self.assertEqual([bm['id'] for bm in deleted], [bookmark_id])
+
+    def test_get_article_404(self):
+        response = self.client.get_article('antidisestablishmentarianism')
+        self.assertEqual(response.status_code, 404)
+
+
+class FakeParserTest(FakeServerTestCase):
+    """
+    The Parser endpoints of the fake server.
+    """
+    def setUp(self):
+        super(FakeParserTest, self).setUp()
+        self.client = self.parser_client()
+        self.test_url = 'https://en.wikipedia.org/wiki/Mark_Twain'
+
+    def test_bad_token(self):
+        client = ParserClient(token='bad token',
+            base_url_template=self.server.parser_url_template)
+        self.assertEqual(client.get_root().status_code, 401)
+
+    def test_get_root(self):
+        response = self.client.get_root()
+        self.assertEqual(set(response.json().keys()), set(['resources']))
+
+    def test_get_article(self):
+        self.assertEqual(self.client.get_article().status_code, 400)
+        response = self.client.get_article(url=self.test_url)
+        self.assertEqual(response.status_code, 200)
+        some_expected_keys = set(['content', 'domain', 'author', 'word_count',
+            'title', 'total_pages'])
+        self.assertTrue(some_expected_keys.issubset(set(response.json().keys())))
+        self.assertEqual(response.headers['X-Article-Id'], response.json()['id'])
+
+    def test_get_article_status(self):
+        response = self.client.get_article_status(url=self.test_url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers['X-Article-Status'], 'FETCHED')
+        self.assertEqual(response.content, b'')
+
+    def test_get_confidence(self):
+        self.assertEqual(self.client.get_confidence().status_code, 400)
+        response = self.client.get_confidence(url=self.test_url)
+        self.assertEqual(set(response.json().keys()), set(['url', 'confidence']))
+        self.assertEqual(response.json(), self.client.get_confidence(url=self.test_url).json())
+
+    def test_post_article_content(self):
+        content = '<html><title>Posted</title><body><p>Some text</p></body></html>'
+        response = self.client.post_article_content(content, 'http://example.com/a.html')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['title'], 'Posted')
+
+
+class FakeServerBehaviourTest(unittest.TestCase):
+    """
+    Latency and error injection.
+    """
+    def test_latency(self):
+        with FakeReadabilityServer(latency=0.05) as server:
+            client = ParserClient(**server.client_kwargs('parser'))
+            start = time.time()
+            client.get_root()
+            self.assertTrue(time.time() - start >= 0.05)
+
+    def test_error_rate(self):
+        with FakeReadabilityServer(error_rate=1.0, error_status=503) as server:
+            client = ParserClient(**server.client_kwargs('parser'))
+            self.assertEqual(client.get_root().status_code, 503)
+            self.assertEqual(server.stats[('GET', '/api/content/v1/')], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+import gc
+import threading
+try:
+    import unittest2 as unittest
+except ImportError:
+    import unittest
+
+from concurrent.futures import ThreadPoolExecutor
+
+from readability import ParserClient, ReaderClient
+from readability.testing import FakeReadabilityServer
+from readability.transports import RequestsTransport, Urllib3Transport
+
+THREADS = 32
+REQUESTS_PER_THREAD = 20
+
+
+class SharedClientTestCase(unittest.TestCase):
+    """
+    Stress tests for clients shared by many threads.
+    """
+    def setUp(self):
+        self.server = FakeReadabilityServer(bookmark_count=50).start()
+        self.addCleanup(self.server.stop)
+        self.token_key, self.token_secret = self.server.token_for('user')
+
+    def reader_client(self, transport):
+        client = ReaderClient(self.token_key, self.token_secret, transport=transport,
+            **self.server.client_kwargs('reader'))
+        self.addCleanup(client.transport.close)
+        return client
+
+    def hammer(self, client, work):
+        """
+        Run `work(client, thread_index, request_index)` from many threads at
+        once and return the status codes of all the responses.
+        """
+        # A start gate, `threading.Barrier` is Python 3 only.
+        gate = threading.Condition()
+        ready = [0]
+
+        def worker(index):
+            with gate:
+                ready[0] += 1
+                gate.notify_all()
+                while ready[0] < THREADS:
+                    gate.wait()
+            return [work(client, index, request).status_code
+                for request in range(REQUESTS_PER_THREAD)]
+
+        with ThreadPoolExecutor(max_workers=THREADS) as executor:
+            return [status for statuses in executor.map(worker, range(THREADS))
+                for status in statuses]
+
+    def reader_work(self, bookmark_ids):
+        def work(client, index, request):
+            bookmark_id = bookmark_ids[(index + request) % len(bookmark_ids)]
+            if request % 3 == 0:
+                return client.get_bookmarks(page=request % 3 + 1, per_page=20)
+            if request % 3 == 1:
+                return client.set_read_percent_of_bookmark(bookmark_id, request / 100.0)
+            return client.get_bookmark(bookmark_id)
+        return work
+
+    def check_reader(self, transport):
+        client = self.reader_client(transport)
+        bookmark_ids = [bookmark['id'] for bookmark in
+            client.get_bookmarks(per_page=50).json()['bookmarks']]
+        statuses = self.hammer(client, self.reader_work(bookmark_ids))
+        self.assertEqual(statuses, [200] * THREADS * REQUESTS_PER_THREAD)
+        # Latency histograms saw every request exactly once.
+        recorded = sum(histogram.count for histogram in client.latency.histograms.values())
+        self.assertEqual(recorded, THREADS * REQUESTS_PER_THREAD + 1)
+        return client
+
+    def test_requests_transport(self):
+        """
+        Each thread gets its own session, all over one bounded pool.
+        """
+        transport = RequestsTransport(pool_maxsize=4, pool_block=True)
+        self.check_reader(transport)
+        self.assertTrue(len(transport._sessions) <= THREADS + 1)
+        adapters = set(id(session.get_adapter(self.server.url)) for session in transport._sessions)
+        self.assertEqual(adapters, set([id(transport.adapter)]))
+        pool = transport.adapter.poolmanager.connection_from_url(self.server.url)
+        self.assertTrue(pool.num_connections <= 4)
+
+    def test_requests_transport_threads_exit(self):
+        """
+        Sessions of threads that exited are not kept.
+        """
+        client = self.reader_client(RequestsTransport())
+        for _ in range(THREADS * 2):
+            thread = threading.Thread(target=client.get_user)
+            thread.start()
+            thread.join()
+        gc.collect()
+        self.assertTrue(len(client.transport._sessions) <= 1)
+        client.get_user()
+        self.assertEqual(len(client.transport._sessions), 1)
+
+    def test_urllib3_transport(self):
+        self.check_reader(Urllib3Transport(maxsize=4, block=True))
+
+    def test_parser_client(self):
+        client = ParserClient(**self.server.client_kwargs('parser'))
+        self.addCleanup(client.transport.close)
+        statuses = self.hammer(client, lambda client, index, request:
+            client.get_article(url='http://example.com/{0}/{1}.html'.format(index, request)))
+        self.assertEqual(statuses, [200] * THREADS * REQUESTS_PER_THREAD)
+
+    def test_hooks_changed_concurrently(self):
+        """
+        Hooks can be added and removed while other threads send requests.
+        """
+        client = self.reader_client('requests')
+        events = []
+        stop = threading.Event()
+
+        class Hook(object):
+            def after_request(self, event):
+                events.append(event)
+
+        def churn():
+            while not stop.is_set():
+                hook = Hook()
+                client.add_hook(hook)
+                client.remove_hook(hook)
+
+        churner = threading.Thread(target=churn)
+        churner.start()
+        try:
+            statuses = self.hammer(client, lambda client, index, request: client.get_user())
+        finally:
+            stop.set()
+            churner.join()
+        self.assertEqual(statuses, [200] * THREADS * REQUESTS_PER_THREAD)
+        self.assertEqual(client.hooks, [])
+
+    def test_oauth_session_per_thread(self):
+        client = self.reader_client('requests')
+        sessions = []
+        threads = [threading.Thread(target=lambda: sessions.append(client.oauth_session))
+            for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(set(id(session) for session in sessions)), 4)
+        self.assertTrue(client.oauth_session is client.oauth_session)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,277 @@
+# -*- coding: utf-8 -*-
+import gzip
+import os
+import shutil
+import tempfile
+import time
+try:
+    import unittest2 as unittest
+except ImportError:
+    import unittest
+
+import requests
+
+from readability import xauth, ParserClient, ReaderClient
+from readability.testing import PARSER_PREFIX, READER_PREFIX, FakeReadabilityServer
+from readability.transports import (Cassette, CassetteMiss, Headers,
+    HTTPXTransport, RecordingTransport, ReplayTransport, RequestsTransport,
+    Urllib3Transport, make_transport, request_key, uniform_latency, warm_pool)
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+
+class HeadersTestCase(unittest.TestCase):
+    """
+    Tests for the case-insensitive `Headers` dict.
+    """
+    def test_case_insensitive(self):
+        headers = Headers({'X-Article-Id': 'abc'})
+        self.assertEqual(headers['x-article-id'], 'abc')
+        self.assertTrue('X-ARTICLE-ID' in headers)
+        headers['x-article-id'] = 'def'
+        self.assertEqual(dict(headers), {'x-article-id': 'def'})
+
+
+class MakeTransportTestCase(unittest.TestCase):
+    def test_names(self):
+        self.assertTrue(isinstance(make_transport(None), RequestsTransport))
+        self.assertTrue(isinstance(make_transport('urllib3'), Urllib3Transport))
+        self.assertTrue(isinstance(make_transport(u'urllib3'), Urllib3Transport))
+        transport = Urllib3Transport()
+        self.assertTrue(make_transport(transport) is transport)
+        with self.assertRaises(ValueError):
+            make_transport('carrier pigeon')
+
+
+class TransportBackendsTestCase(unittest.TestCase):
+    """
+    Client methods work unchanged on every transport.
+    """
+    def setUp(self):
+        self.server = FakeReadabilityServer(bookmark_count=3).start()
+        self.addCleanup(self.server.stop)
+
+    def exercise(self, transport):
+        self.addCleanup(transport.close)
+        parser = ParserClient(transport=transport, **self.server.client_kwargs('parser'))
+        response = parser.get_article(url='http://example.com/a.html')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue('content' in response.json())
+        status = parser.get_article_status(url='http://example.com/a.html')
+        self.assertEqual(status.headers['x-article-status'], 'FETCHED')
+        self.assertEqual(status.content, b'')
+        posted = parser.post_article_content('<title>Posted</title>', 'http://example.com/p')
+        self.assertEqual(posted.json()['title'], 'Posted')
+
+        token = xauth(base_url_template=self.server.reader_url_template,
+            consumer_key=self.server.consumer_key,
+            consumer_secret=self.server.consumer_secret,
+            username='user', password='password', transport=transport)
+        reader = ReaderClient(token[0], token[1], transport=transport,
+            **self.server.client_kwargs('reader'))
+        self.assertEqual(len(reader.get_bookmarks().json()['bookmarks']), 3)
+        self.assertEqual(reader.add_bookmark('http://example.com/b.html').status_code, 202)
+        self.assertEqual(reader.update_bookmark(1, favorite=True).json()['favorite'], True)
+        self.assertEqual(reader.delete_bookmark(1).status_code, 204)
+        self.assertEqual(reader.get_bookmark(1).status_code, 404)
+
+    def test_requests(self):
+        self.exercise(RequestsTransport())
+
+    def test_urllib3(self):
+        self.exercise(Urllib3Transport())
+
+    @unittest.skipIf(httpx is None, 'httpx is not installed')
+    def test_httpx(self):
+        self.exercise(HTTPXTransport(http2=False))
+
+
+class WarmupTestCase(unittest.TestCase):
+    """
+    Tests for `warmup`, opening pooled connections ahead of time.
+    """
+    def setUp(self):
+        self.server = FakeReadabilityServer().start()
+        self.addCleanup(self.server.stop)
+
+    def open_connections(self, pool):
+        return len([conn for conn in list(pool.pool.queue)
+            if conn is not None and conn.sock is not None])
+
+    def check(self, client, pool):
+        self.assertEqual(client.warmup(connections=3), 3)
+        self.assertEqual(self.open_connections(pool), 3)
+        self.assertEqual(pool.num_connections, 3)
+        # Open connections count, and the pool size caps the rest.
+        self.assertEqual(client.warmup(connections=20), 2)
+        self.assertEqual(self.open_connections(pool), 5)
+        # The first request uses a warm connection.
+        self.assertEqual(client.get_root().status_code, 200)
+        self.assertEqual(pool.num_connections, 5)
+
+    def test_requests(self):
+        transport = RequestsTransport(pool_maxsize=5)
+        self.addCleanup(transport.close)
+        client = ParserClient(transport=transport, **self.server.client_kwargs('parser'))
+        self.check(client, transport.connection_pool(self.server.url))
+
+    def test_urllib3(self):
+        transport = Urllib3Transport(maxsize=5)
+        self.addCleanup(transport.close)
+        client = ParserClient(transport=transport, spool_threshold=1024,
+            **self.server.client_kwargs('parser'))
+        self.check(client, transport.connection_pool(self.server.url))
+
+    def test_pool_in_use(self):
+        """
+        Warming up a blocking pool whose connections are all in use returns
+        at once, even when they were taken after the pool looked idle.
+        """
+        transport = Urllib3Transport(maxsize=2, block=True)
+        self.addCleanup(transport.close)
+        pool = transport.connection_pool(self.server.url)
+        in_use = [pool._get_conn(), pool._get_conn()]
+        self.assertEqual(warm_pool(pool, 2), 0)
+        # As if requests took the connections after the queue was looked at.
+        pool.pool.qsize = lambda: 2
+        pool.pool.empty = lambda: False
+        self.assertEqual(warm_pool(pool, 2), 0)
+        for conn in in_use:
+            pool._put_conn(conn)
+
+    def test_fetch(self):
+        token_key, token_secret = self.server.token_for('user')
+        reader = ReaderClient(token_key, token_secret, **self.server.client_kwargs('reader'))
+        self.addCleanup(reader.transport.close)
+        self.assertEqual(reader.warmup(connections=2, fetch=True), 2)
+        self.assertEqual(self.server.stats[('GET', READER_PREFIX + 'users/_current')], 1)
+
+        parser = ParserClient(**self.server.client_kwargs('parser'))
+        self.addCleanup(parser.transport.close)
+        parser.warmup(fetch=True)
+        self.assertEqual(self.server.stats[('GET', PARSER_PREFIX)], 1)
+
+        stranger = ReaderClient('stranger', 'secret', **self.server.client_kwargs('reader'))
+        self.addCleanup(stranger.transport.close)
+        self.assertRaises(requests.HTTPError, stranger.warmup, fetch=True)
+
+    def test_unreachable(self):
+        url = self.server.url
+        self.server.stop()
+        client = ParserClient(token='token', base_url_template=url + '/{}')
+        self.addCleanup(client.transport.close)
+        self.assertRaises(requests.ConnectionError, client.warmup)
+        pool = client.transport.connection_pool(url)
+        self.assertEqual(self.open_connections(pool), 0)
+        self.assertEqual(pool.pool.qsize(), pool.pool.maxsize)
+
+
+class RequestKeyTestCase(unittest.TestCase):
+    """
+    Tests for matching requests in cassettes.
+    """
+    def test_credentials_ignored(self):
+        """
+        Requests differing only by credentials are equivalent.
+        """
+        self.assertEqual(
+            request_key('GET', 'http://x/parser?token=one&url=a'),
+            request_key('get', 'http://x/parser?url=a&token=two'))
+        self.assertEqual(
+            request_key('POST', 'http://x/parser', 'doc=a&token=one'),
+            request_key('POST', 'http://x/parser', 'token=two&doc=a'))
+
+    def test_body_matters(self):
+        self.assertNotEqual(
+            request_key('POST', 'http://x/bookmarks', 'url=a'),
+            request_key('POST', 'http://x/bookmarks', 'url=b'))
+
+
+class RecordReplayTestCase(unittest.TestCase):
+    """
+    Record exchanges with the fake server and replay them without it.
+    """
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        self.path = os.path.join(self.tmpdir, 'cassette.json.gz')
+        self.test_url = 'https://en.wikipedia.org/wiki/Mark_Twain'
+
+    def record(self):
+        with FakeReadabilityServer(bookmark_count=5) as server:
+            self.server_kwargs = server.client_kwargs
+            self.parser_kwargs = server.client_kwargs('parser')
+            self.reader_kwargs = server.client_kwargs('reader')
+            self.token = server.token_for('user')
+            transport = RecordingTransport(self.path)
+            parser = ParserClient(transport=transport, **self.parser_kwargs)
+            self.recorded_article = parser.get_article(url=self.test_url)
+            self.recorded_status = parser.get_article_status(url=self.test_url)
+            parser.post_article_content('<title>Posted</title>', 'http://example.com/p')
+            reader = ReaderClient(self.token[0], self.token[1],
+                transport=transport, **self.reader_kwargs)
+            self.recorded_bookmarks = reader.get_bookmarks()
+            xauth(base_url_template=server.reader_url_template,
+                consumer_key=server.consumer_key,
+                consumer_secret=server.consumer_secret,
+                username='user', password='password', transport=transport)
+            transport.close()
+
+    def test_replay(self):
+        """
+        Replayed responses match the recorded ones, headers included.
+        """
+        self.record()
+        transport = ReplayTransport(self.path)
+        parser = ParserClient(transport=transport, **self.parser_kwargs)
+        article = parser.get_article(url=self.test_url)
+        self.assertEqual(article.status_code, 200)
+        self.assertEqual(article.json(), self.recorded_article.json())
+        status = parser.get_article_status(url=self.test_url)
+        self.assertEqual(status.headers['X-Article-Status'], 'FETCHED')
+        self.assertEqual(status.headers['x-article-id'],
+            self.recorded_status.headers['X-Article-Id'])
+        posted = parser.post_article_content('<title>Posted</title>', 'http://example.com/p')
+        self.assertEqual(posted.json()['title'], 'Posted')
+
+        reader = ReaderClient(self.token[0], self.token[1],
+            transport=transport, **self.reader_kwargs)
+        self.assertEqual(reader.get_bookmarks().json(), self.recorded_bookmarks.json())
+
+    def test_replay_xauth(self):
+        self.record()
+        token = xauth(base_url_template=self.reader_kwargs['base_url_template'],
+            consumer_key='key', consumer_secret='secret',
+            username='user', password='password',
+            transport=ReplayTransport(self.path))
+        self.assertEqual(token, self.token)
+
+    def test_credentials_not_recorded(self):
+        self.record()
+        with gzip.open(self.path, 'rb') as cassette_file:
+            data = cassette_file.read().decode('utf-8')
+        self.assertFalse(self.parser_kwargs['token'] in data)
+        self.assertFalse('password' in data)
+
+    def test_miss(self):
+        self.record()
+        parser = ParserClient(transport=ReplayTransport(self.path), **self.parser_kwargs)
+        with self.assertRaises(CassetteMiss):
+            parser.get_article(url='http://example.com/never-recorded')
+
+    def test_simulated_latency(self):
+        self.record()
+        transport = ReplayTransport(Cassette.load(self.path),
+            latency=uniform_latency(0.02, 0.03, seed=1))
+        parser = ParserClient(transport=transport, **self.parser_kwargs)
+        start = time.time()
+        response = parser.get_article(url=self.test_url)
+        self.assertTrue(time.time() - start >= 0.02)
+        self.assertTrue(response.elapsed.total_seconds() >= 0.02)
+
+
+if __name__ == '__main__':
+    unittest.main()
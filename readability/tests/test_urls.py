@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+import os
+import shutil
+import tempfile
+try:
+    import unittest2 as unittest
+except ImportError:
+    import unittest
+
+from readability import ParserClient, ReaderClient
+from readability.pipelines import ConfidenceGatedParser
+from readability.testing import FakeReadabilityServer, PARSER_PREFIX, READER_PREFIX
+from readability.urls import SeenIndex, canonicalize_url
+
+
+class CanonicalizeUrlTestCase(unittest.TestCase):
+    """
+    Tests for `canonicalize_url`.
+    """
+    def test_equivalent_urls(self):
+        """
+        Urls differing only by noise map to the same canonical url.
+        """
+        canonical = 'http://example.com/a/b?x=1&y=2'
+        for url in (
+                'http://example.com/a/b?x=1&y=2',
+                'HTTP://Example.COM/a/b/?y=2&x=1',
+                'http://example.com:80/a//b?x=1&y=2#comments',
+                'http://example.com/a/b?utm_source=feed&x=1&fbclid=abc&y=2',
+                'http://example.com/%61/b?x=1&y=2',
+                ' http://example.com./a/b?x=1&y=2 '):
+            self.assertEqual(canonicalize_url(url), canonical, url)
+
+    def test_distinct_urls(self):
+        """
+        Parts that identify a different resource are kept.
+        """
+        self.assertEqual(canonicalize_url('https://example.com'), 'https://example.com/')
+        self.assertEqual(canonicalize_url('https://example.com:8443/A'), 'https://example.com:8443/A')
+        self.assertEqual(canonicalize_url('http://example.com/#!/a', keep_fragment=True),
+            'http://example.com/#!/a')
+        self.assertEqual(canonicalize_url('http://example.com/a%20b?q=a+b'),
+            'http://example.com/a%20b?q=a+b')
+        self.assertEqual(canonicalize_url('http://[::1]:8000/'), 'http://[::1]:8000/')
+        # Escaped reserved characters are not path separators or delimiters.
+        self.assertEqual(canonicalize_url('http://example.com/a%2fb%3F%7e'),
+            'http://example.com/a%2Fb%3F~')
+        self.assertNotEqual(canonicalize_url('http://example.com/a%2Fb'),
+            canonicalize_url('http://example.com/a/b'))
+        self.assertEqual(canonicalize_url('http://example.com/?ref=2&x=1'),
+            'http://example.com/?ref=2&x=1')
+
+
+class SeenIndexTestCase(unittest.TestCase):
+    """
+    Tests for `SeenIndex`.
+    """
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.path = os.path.join(self.directory, 'seen.bloom')
+
+    def test_add(self):
+        with SeenIndex(capacity=1000) as seen:
+            self.assertTrue(seen.add('http://example.com/a'))
+            self.assertFalse(seen.add('http://EXAMPLE.com/a/?utm_medium=rss'))
+            self.assertTrue('http://example.com/a#top' in seen)
+            self.assertFalse('http://example.com/b' in seen)
+            self.assertEqual(seen.update(['http://example.com/a', 'http://example.com/b']),
+                ['http://example.com/b'])
+            self.assertEqual(len(seen), 2)
+
+    def test_persistent(self):
+        """
+        The index is reopened with its contents and parameters.
+        """
+        with SeenIndex(self.path, capacity=1000, error_rate=0.01) as seen:
+            seen.update('http://example.com/{0}'.format(index) for index in range(100))
+            bits = seen.bits
+        size = os.path.getsize(self.path)
+        with SeenIndex(self.path, capacity=10 ** 9) as seen:
+            self.assertEqual(seen.bits, bits)
+            self.assertEqual(len(seen), 100)
+            self.assertTrue(all('http://example.com/{0}'.format(index) in seen
+                for index in range(100)))
+        self.assertEqual(os.path.getsize(self.path), size)
+
+    def test_false_positive_rate(self):
+        """
+        The false positive rate at capacity stays close to `error_rate`.
+        """
+        seen = SeenIndex(capacity=5000, error_rate=0.01)
+        seen.update('http://example.com/seen/{0}'.format(index) for index in range(5000))
+        false_positives = sum('http://example.com/new/{0}'.format(index) in seen
+            for index in range(5000))
+        self.assertTrue(false_positives < 5000 * 0.02, false_positives)
+        # About 1.2 bytes per url at 1%.
+        self.assertTrue(seen.bits // 8 < 5000 * 1.3)
+        seen.close()
+
+    def test_not_an_index(self):
+        with open(self.path, 'wb') as index_file:
+            index_file.write(b'not a bloom filter, just some bytes')
+        with self.assertRaises(ValueError):
+            SeenIndex(self.path)
+
+
+class SkipSeenTestCase(unittest.TestCase):
+    """
+    Bulk helpers skip seen urls without any request.
+    """
+    def setUp(self):
+        self.server = FakeReadabilityServer().start()
+        self.addCleanup(self.server.stop)
+        self.urls = ['http://example.com/{0}.html'.format(index) for index in range(10)]
+        self.seen = SeenIndex(capacity=1000)
+        self.addCleanup(self.seen.close)
+
+    def test_add_bookmarks(self):
+        token_key, token_secret = self.server.token_for('user')
+        client = ReaderClient(token_key, token_secret, **self.server.client_kwargs('reader'))
+        results = client.add_bookmarks(self.urls[:5], seen=self.seen)
+        self.assertTrue(all(response.status_code == 202 for _, response in results))
+        results = client.add_bookmarks([url + '?utm_source=x' for url in self.urls], seen=self.seen)
+        self.assertEqual([response is None for _, response in results], [True] * 5 + [False] * 5)
+        self.assertEqual(self.server.stats[('POST', READER_PREFIX + 'bookmarks')], 10)
+
+    def test_pipeline(self):
+        client = ParserClient(**self.server.client_kwargs('parser'))
+        pipeline = ConfidenceGatedParser(client, threshold=0, seen=self.seen)
+        self.assertEqual(len(pipeline.run(self.urls[:5]).parsed), 5)
+        report = pipeline.run(self.urls)
+        self.assertEqual(report.skipped, self.urls[:5])
+        self.assertEqual(len(report.parsed), 5)
+        self.assertEqual(self.server.stats[('GET', PARSER_PREFIX + 'confidence')], 10)
+
+
+if __name__ == '__main__':
+    unittest.main()
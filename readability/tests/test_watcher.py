@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+import threading
+import time
+try:
+    import unittest2 as unittest
+except ImportError:
+    import unittest
+try:
+    from queue import Queue, Empty
+except ImportError:
+    from Queue import Queue, Empty
+
+from readability import ReaderClient
+from readability.testing import FakeReadabilityServer
+from readability.watcher import BookmarkWatcher
+
+
+class BookmarkWatcherTestCase(unittest.TestCase):
+    """
+    Tests for `BookmarkWatcher` against the fake server.
+    """
+    def setUp(self):
+        self.server = FakeReadabilityServer(users={'alice': 'a', 'bob': 'b'},
+            bookmark_count=60).start()
+        self.addCleanup(self.server.stop)
+        self.clients = {}
+        for user in ('alice', 'bob'):
+            token_key, token_secret = self.server.token_for(user)
+            self.clients[user] = ReaderClient(token_key, token_secret,
+                **self.server.client_kwargs('reader'))
+
+    def kinds(self, changes):
+        return [(change.kind, change.bookmark['id']) for change in changes]
+
+    def test_check(self):
+        """
+        Changes are reported once, and polls without changes are answered
+        with 304 Not Modified.
+        """
+        client = self.clients['alice']
+        watcher = BookmarkWatcher(deletions=True)
+        self.addCleanup(watcher.close)
+        key = watcher.watch(client, poll=False)
+        self.assertEqual(watcher.check(key), [])
+        bookmark_id = client.get_bookmarks().json()['bookmarks'][-1]['id']
+
+        client.favorite_bookmark(bookmark_id)
+        self.assertEqual(self.kinds(watcher.check(key)), [('updated', bookmark_id)])
+        client.set_read_percent_of_bookmark(bookmark_id, 0.5)
+        changes = watcher.check(key)
+        self.assertEqual(self.kinds(changes), [('updated', bookmark_id)])
+        self.assertEqual(changes[0].bookmark['read_percent'], '0.50')
+        self.assertEqual(changes[0].key, client.token_key)
+
+        before = watcher.stats['not_modified']
+        self.assertEqual(watcher.check(key), [])
+        self.assertEqual(watcher.stats['not_modified'] - before, 2)
+
+        location = client.add_bookmark('http://example.com/watched.html').headers['Location']
+        added_id = int(location.rstrip('/').rsplit('/', 1)[-1])
+        self.assertEqual(self.kinds(watcher.check(key)), [('added', added_id)])
+        client.delete_bookmark(added_id)
+        self.assertEqual(self.kinds(watcher.check(key)), [('deleted', added_id)])
+
+    def test_paging(self):
+        """
+        Changes spanning several pages are all reported.
+        """
+        client = self.clients['alice']
+        watcher = BookmarkWatcher(per_page=7)
+        self.addCleanup(watcher.close)
+        key = watcher.watch(client, since='2000-01-01 00:00:00', poll=False)
+        self.assertEqual(len(watcher.check(key)), 60)
+        self.assertEqual(watcher.check(key), [])
+
+    def test_emission_order(self):
+        """
+        A poll racing one that is still emitting its changes waits for it,
+        so the changes of a watch are emitted in order.
+        """
+        client = self.clients['alice']
+        bookmark_id = client.get_bookmarks().json()['bookmarks'][0]['id']
+        emitted = []
+        racers = []
+
+        def callback(change):
+            emitted.append(change.bookmark['id'])
+            if not racers:
+                client.archive_bookmark(bookmark_id)
+                racers.append(threading.Thread(target=watcher.check, args=(key,)))
+                racers[0].start()
+                time.sleep(0.2)
+
+        watcher = BookmarkWatcher(callback=callback)
+        self.addCleanup(watcher.close)
+        key = watcher.watch(client, since='2000-01-01 00:00:00', poll=False)
+        changes = watcher.check(key)
+        racers[0].join()
+        self.assertEqual(len(changes), 60)
+        # The racing poll's change comes after all of those of the first.
+        self.assertEqual(emitted, [change.bookmark['id'] for change in changes] + [bookmark_id])
+        self.assertEqual(watcher.stats['changes'], 61)
+
+    def test_multiplex(self):
+        """
+        Many users are polled from one scheduling thread, more often while
+        they are active.
+        """
+        changes = Queue()
+        watcher = BookmarkWatcher(queue=changes, max_workers=2, min_interval=0.02,
+            max_interval=0.2, seed=0)
+        self.addCleanup(watcher.close)
+        for user, client in self.clients.items():
+            watcher.watch(client, key=user)
+        deadline = time.time() + 5
+        while watcher.stats['polls'] < 4 and time.time() < deadline:
+            time.sleep(0.01)
+
+        expected = set()
+        for user, client in self.clients.items():
+            bookmark_id = client.get_bookmarks().json()['bookmarks'][0]['id']
+            client.archive_bookmark(bookmark_id)
+            expected.add((user, bookmark_id))
+        seen = set()
+        while seen != expected:
+            try:
+                change = changes.get(timeout=5)
+            except Empty:
+                break
+            seen.add((change.key, change.bookmark['id']))
+        self.assertEqual(seen, expected)
+        self.assertTrue(watcher.watches['alice'].interval <= 0.2)
+        self.assertEqual(len([thread for thread in threading.enumerate()
+            if thread.name == 'BookmarkWatcher']), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,1059 @@
+# -*- coding: utf-8 -*-
+
+"""
+readability.transports
+~~~~~~~~~~~~~~~~~~~~~~
+
+This module provides the transports used by the clients to send HTTP
+requests. Clients build, sign and encode requests themselves and hand the
+finished request to a transport, so transports can be swapped without
+changing any client method.
+
+`RequestsTransport` is the default. `Urllib3Transport` talks to urllib3's
+connection pools directly and skips the per-request overhead of `requests`;
+`HTTPXTransport` multiplexes requests over HTTP/2 and needs the optional
+`httpx[http2]` dependency. Clients accept a transport instance or one of the
+names in `TRANSPORTS`:
+
+    client = ParserClient(token='...', transport='urllib3')
+
+For tests and benchmarks, `RecordingTransport` captures exchanges into a
+`Cassette` and `ReplayTransport` serves them back, optionally with simulated
+latency.
+
+"""
+
+import base64
+import gzip
+import hashlib
+import json
+import logging
+import math
+import os
+import random
+import threading
+import time
+import weakref
+
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from datetime import timedelta
+
+try:
+    from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+except ImportError:
+    from urllib import urlencode
+    from urlparse import parse_qsl, urlsplit, urlunsplit
+
+try:
+    string_types = basestring
+except NameError:
+    string_types = str
+
+from readability import jsonlib
+from readability.core import lazy_import
+from readability.instrumentation import timer
+
+requests = lazy_import('requests')
+urllib3 = lazy_import('urllib3')
+
+logger = logging.getLogger(__name__)
+
+# Query string and form fields that hold credentials. They are never written
+# to cassettes and are ignored when matching requests.
+SENSITIVE_PARAMS = frozenset(['token', 'x_auth_password', 'x_auth_username',
+    'oauth_consumer_key', 'oauth_nonce', 'oauth_signature', 'oauth_timestamp',
+    'oauth_token'])
+
+# Response headers that describe the original transfer rather than the
+# response itself.
+TRANSFER_HEADERS = frozenset(['connection', 'content-encoding', 'content-length',
+    'date', 'keep-alive', 'transfer-encoding'])
+
+CASSETTE_VERSION = 1
+
+# Size of the chunks streamed response bodies are read in.
+DEFAULT_READ_SIZE = 64 * 1024
+
+
+class Headers(dict):
+    """
+    Case-insensitive dict of HTTP headers.
+    """
+    def __init__(self, *args, **kwargs):
+        super(Headers, self).__init__()
+        self._names = {}
+        self.update(*args, **kwargs)
+
+    def __setitem__(self, key, value):
+        lower = key.lower()
+        if lower in self._names and self._names[lower] != key:
+            super(Headers, self).__delitem__(self._names[lower])
+        self._names[lower] = key
+        super(Headers, self).__setitem__(key, value)
+
+    def __getitem__(self, key):
+        return super(Headers, self).__getitem__(self._names[key.lower()])
+
+    def __delitem__(self, key):
+        super(Headers, self).__delitem__(self._names.pop(key.lower()))
+
+    def __contains__(self, key):
+        return key.lower() in self._names
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def update(self, *args, **kwargs):
+        for key, value in dict(*args, **kwargs).items():
+            self[key] = value
+
+    def copy(self):
+        return Headers(self)
+
+
+class TransportResponse(object):
+    """
+    Response returned by transports that do not use `requests`.
+
+    It mirrors the parts of `requests.Response` the clients and their users
+    rely on: `status_code`, `headers`, `content`, `text`, `json()`, `url`,
+    `elapsed`, `ok` and `raise_for_status()`.
+    """
+    def __init__(self, status_code, headers=None, content=b'', url=None,
+        reason=None, elapsed=None):
+        self.status_code = status_code
+        self.headers = Headers(headers or {})
+        self.content = content
+        self.url = url
+        self.reason = reason
+        self.elapsed = elapsed if elapsed is not None else timedelta(0)
+        self.encoding = 'utf-8'
+        #: Seconds spent opening connections for the request, 0 when a
+        #: pooled one was reused, or None when the transport can't tell.
+        self.connect_time = None
+
+    @property
+    def text(self):
+        return self.content.decode(self.encoding, 'replace')
+
+    @property
+    def ok(self):
+        return self.status_code < 400
+
+    def json(self, **kwargs):
+        try:
+            return jsonlib.loads(self.content, **kwargs)
+        except ValueError as e:
+            raise json_decode_error(e, self.text)
+
+    def raise_for_status(self):
+        if not self.ok:
+            raise requests.HTTPError('{0} Error for url: {1}'.format(
+                self.status_code, self.url), response=self)
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __repr__(self):
+        return '<TransportResponse [{0}]>'.format(self.status_code)
+
+
+class TransportStream(object):
+    """
+    Response whose body has not been read yet, returned by
+    `BaseTransport.stream`. Iterating over it yields the decoded body in
+    chunks; `close` releases the connection.
+    """
+    def __init__(self, status_code, headers, chunks, url=None, reason=None,
+        elapsed=None, close=None):
+        self.status_code = status_code
+        self.headers = Headers(headers or {})
+        self.chunks = chunks
+        self.url = url
+        self.reason = reason
+        self.elapsed = elapsed if elapsed is not None else timedelta(0)
+        self.connect_time = None
+        self._close = close
+
+    def __iter__(self):
+        return iter(self.chunks)
+
+    def close(self):
+        if self._close is not None:
+            self._close()
+            self._close = None
+
+    def __repr__(self):
+        return '<TransportStream [{0}]>'.format(self.status_code)
+
+
+class BaseTransport(object):
+    """
+    Interface implemented by all transports.
+
+    Transports can be pickled, and are safe to use after a fork: connections
+    are left out of their pickled state, and those inherited by a forked
+    child are dropped, without being closed so that the parent can keep
+    using them. New ones are opened on first use.
+    """
+    #: Attributes tied to the process the transport is used in, such as
+    #: connections, locks and thread locals. They are not pickled, and are
+    #: set up again by `_reset`.
+    process_attributes = ()
+
+    def _reset(self):
+        """
+        Forget the `process_attributes` of the transport, without closing
+        anything, and set them up for the current process.
+        """
+        self._pid = os.getpid()
+
+    def _check_process(self):
+        """
+        `_reset` the transport if it is used in a process other than the one
+        it was set up in, i.e. after a fork.
+        """
+        if self._pid != os.getpid():
+            logger.debug('Dropping the connections %r inherited from process %d', self, self._pid)
+            self._reset()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        for name in self.process_attributes + ('_pid',):
+            state.pop(name, None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._reset()
+
+    def request(self, method, url, data=None, headers=None):
+        """
+        Send a request and return its response.
+
+        :param method: HTTP method.
+        :param url: fully built (and for the Reader API, signed) url.
+        :param data (optional): request body.
+        :param headers (optional): dict of request headers.
+        """
+        raise NotImplementedError
+
+    def stream(self, method, url, data=None, headers=None, chunk_size=DEFAULT_READ_SIZE):
+        """
+        Send a request and return a `TransportStream` as soon as the headers
+        of the response are in, its body is read as it is iterated over.
+
+        Transports that cannot stream read the whole response first.
+        """
+        response = self.request(method, url, data=data, headers=headers)
+        stream = TransportStream(response.status_code, response.headers.items(),
+            [response.content or b''],
+            url=response.url,
+            reason=response.reason,
+            elapsed=response.elapsed)
+        stream.connect_time = getattr(response, 'connect_time', None)
+        return stream
+
+    def warmup(self, url, connections):
+        """
+        Open up to `connections` pooled connections to the host of `url`
+        ahead of the first requests to it. Returns the number of connections
+        opened.
+
+        Transports without a pool they can fill return 0.
+        """
+        return 0
+
+    def close(self):
+        """
+        Release any resources, such as pooled connections, held by the
+        transport.
+        """
+
+
+def warm_pool(pool, connections):
+    """
+    Connect up to `connections` of the connections of a urllib3 connection
+    pool at once, and put them back in the pool. Connections already open
+    count towards `connections`. Returns the number of connections opened.
+
+    Raises the first error met, e.g. a DNS, connection or certificate error.
+
+    This relies on the `_get_conn` and `_put_conn` methods and the `pool`
+    queue urllib3 pools have had since 1.x. Pools without them are left
+    cold.
+    """
+    queue = getattr(pool, 'pool', None)
+    if not (hasattr(pool, '_get_conn') and hasattr(pool, '_put_conn')
+            and hasattr(queue, 'qsize')):
+        logger.debug('Cannot warm up %r, unknown connection pool API', pool)
+        return 0
+    checked_out = []
+    try:
+        # Connections not in use, open or not. Requests in flight may take
+        # some of them before we do.
+        for _ in range(min(connections, queue.qsize())):
+            try:
+                checked_out.append(pool._get_conn(timeout=0))
+            except urllib3.exceptions.EmptyPoolError:
+                # The rest of the pool is in use by requests in flight.
+                break
+        cold = [conn for conn in checked_out if conn.sock is None]
+        errors = []
+
+        def connect(conn):
+            try:
+                conn.connect()
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=connect, args=(conn,)) for conn in cold]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        if errors:
+            raise errors[0]
+        return len(cold)
+    finally:
+        for conn in checked_out:
+            if conn.sock is None:
+                conn.close()
+                conn = None
+            pool._put_conn(conn)
+
+
+class ConnectTiming(object):
+    """
+    Seconds the calling thread spends opening connections while sending a
+    request, added up in `total`. Returned by `connect_timing`.
+    """
+    def __init__(self):
+        self.total = 0.0
+        self._started = {}
+
+    def add(self, seconds):
+        self.total += seconds
+
+    def trace(self, event_name, info):
+        """
+        `httpx` trace extension timing the TCP and TLS setup of new
+        connections.
+        """
+        if not event_name.startswith('connection.'):
+            return
+        step, _, stage = event_name.rpartition('.')
+        if stage == 'started':
+            self._started[step] = timer()
+        elif stage in ('complete', 'failed') and step in self._started:
+            self.add(timer() - self._started.pop(step))
+
+
+_connect_timings = threading.local()
+
+
+@contextmanager
+def connect_timing():
+    """
+    Time the connections opened by the calling thread within the block.
+    """
+    timing = _connect_timings.current = ConnectTiming()
+    try:
+        yield timing
+    finally:
+        _connect_timings.current = None
+
+
+_timed_pool_classes = None
+
+
+def timed_pool_classes():
+    """
+    urllib3 connection pool classes, by scheme, whose connections add the
+    time they take to connect to the `connect_timing` of the calling
+    thread. Built on first use, so that urllib3 is only imported when
+    needed.
+    """
+    global _timed_pool_classes
+    if _timed_pool_classes is None:
+        def timed(pool_class):
+            class TimedConnection(pool_class.ConnectionCls):
+                def connect(self):
+                    start = timer()
+                    try:
+                        return super(TimedConnection, self).connect()
+                    finally:
+                        timing = getattr(_connect_timings, 'current', None)
+                        if timing is not None:
+                            timing.add(timer() - start)
+
+            return type('Timed' + pool_class.__name__, (pool_class,),
+                {'ConnectionCls': TimedConnection})
+
+        _timed_pool_classes = {
+            'http': timed(urllib3.HTTPConnectionPool),
+            'https': timed(urllib3.HTTPSConnectionPool),
+        }
+    return _timed_pool_classes
+
+
+def json_decode_error(error, doc):
+    """
+    The `requests.exceptions.JSONDecodeError` a `requests.Response` would
+    raise for the invalid JSON `doc`, given the `error` a JSON backend
+    raised decoding it. `error` itself with versions of `requests` without
+    that exception.
+    """
+    error_class = getattr(requests.exceptions, 'JSONDecodeError', None)
+    if error_class is None:
+        return error
+    if not hasattr(error, 'pos'):
+        # Some backends don't tell where decoding failed, the standard
+        # library does.
+        try:
+            json.loads(doc)
+        except ValueError as e:
+            error = e
+    if not hasattr(error, 'pos'):
+        return error_class(str(error), doc, 0)
+    return error_class(error.msg, error.doc, error.pos)
+
+
+_response_class = None
+
+
+def response_class():
+    """
+    `requests.Response` subclass decoding JSON with `readability.jsonlib`.
+    Built on first use, so that `requests` is only imported when needed.
+    """
+    global _response_class
+    if _response_class is None:
+        class Response(requests.Response):
+            __doc__ = requests.Response.__doc__
+
+            def json(self, **kwargs):
+                encoding = (self.encoding or 'utf-8').lower().replace('_', '-')
+                if kwargs or encoding not in ('utf-8', 'utf8') or not self.content:
+                    return super(Response, self).json(**kwargs)
+                try:
+                    return jsonlib.loads(self.content)
+                except ValueError:
+                    # Raise what `requests` raises for invalid JSON.
+                    return super(Response, self).json()
+
+        _response_class = Response
+    return _response_class
+
+
+class RequestsTransport(BaseTransport):
+    """
+    Transport sending requests through `requests` sessions.
+
+    A `requests.Session` is not thread-safe, so each thread sends its
+    requests through a session of its own, dropped when the thread exits.
+    All of them share one `HTTPAdapter`, and so one bounded pool of
+    connections.
+
+    :param session (optional): session used by every thread instead, which
+        then must not be used by several threads at once. It is not carried
+        over to other processes, which use sessions of their own.
+    :param pool_connections: number of hosts connections are pooled for.
+    :param pool_maxsize: number of connections kept open per host.
+    :param pool_block: wait for a free connection instead of opening extra,
+        unpooled ones when all `pool_maxsize` connections are busy.
+    """
+    process_attributes = ('_session', '_adapter', '_local', '_sessions', '_lock')
+
+    def __init__(self, session=None, pool_connections=10, pool_maxsize=10, pool_block=False):
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.pool_block = pool_block
+        self._reset()
+        self._session = session
+
+    def _reset(self):
+        super(RequestsTransport, self)._reset()
+        self._session = None
+        self._adapter = None
+        self._local = threading.local()
+        # Only the thread-locals keep sessions alive.
+        self._sessions = weakref.WeakSet()
+        self._lock = threading.Lock()
+
+    @property
+    def adapter(self):
+        """
+        `requests.adapters.HTTPAdapter` shared by the sessions of all
+        threads.
+        """
+        self._check_process()
+        with self._lock:
+            if self._adapter is None:
+                self._adapter = requests.adapters.HTTPAdapter(
+                    pool_connections=self.pool_connections,
+                    pool_maxsize=self.pool_maxsize,
+                    pool_block=self.pool_block)
+                self._adapter.poolmanager.pool_classes_by_scheme = timed_pool_classes()
+            return self._adapter
+
+    @property
+    def session(self):
+        """
+        Session of the calling thread.
+        """
+        self._check_process()
+        if self._session is not None:
+            return self._session
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            adapter = self.adapter
+            session = requests.Session()
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            self._local.session = session
+            with self._lock:
+                self._sessions.add(session)
+        return session
+
+    def request(self, method, url, data=None, headers=None):
+        # Like `requests.head`, don't follow redirects for HEAD requests.
+        with connect_timing() as timing:
+            response = self.session.request(method, url, data=data, headers=headers,
+                allow_redirects=method != 'HEAD')
+        response.__class__ = response_class()
+        response.connect_time = self._connect_time(timing)
+        return response
+
+    def stream(self, method, url, data=None, headers=None, chunk_size=DEFAULT_READ_SIZE):
+        with connect_timing() as timing:
+            response = self.session.request(method, url, data=data, headers=headers,
+                allow_redirects=method != 'HEAD', stream=True)
+        stream = TransportStream(response.status_code, response.headers.items(),
+            response.iter_content(chunk_size),
+            url=response.url,
+            reason=response.reason,
+            elapsed=response.elapsed,
+            close=response.close)
+        stream.connect_time = self._connect_time(timing)
+        return stream
+
+    def _connect_time(self, timing):
+        # Only the connections of our own adapter are timed.
+        return timing.total if self._session is None else None
+
+    def connection_pool(self, url):
+        """
+        The urllib3 connection pool requests to `url` are sent through.
+        """
+        session = self.session
+        adapter = session.get_adapter(url)
+        if hasattr(adapter, 'get_connection_with_tls_context'):
+            return adapter.get_connection_with_tls_context(
+                requests.Request('GET', url).prepare(), verify=session.verify)
+        return adapter.get_connection(url)
+
+    def warmup(self, url, connections):
+        try:
+            return warm_pool(self.connection_pool(url), connections)
+        except urllib3.exceptions.HTTPError as e:
+            raise requests.ConnectionError(e)
+
+    def close(self):
+        self._check_process()
+        with self._lock:
+            sessions, self._sessions = list(self._sessions), weakref.WeakSet()
+            adapter, self._adapter = self._adapter, None
+            self._local = threading.local()
+        for session in sessions:
+            session.close()
+        if adapter is not None:
+            adapter.close()
+        if self._session is not None:
+            self._session.close()
+            self._session = None
+
+
+def encode_body(data):
+    if isinstance(data, str) and not isinstance(data, bytes):
+        return data.encode('utf-8')
+    return data
+
+
+class Urllib3Transport(BaseTransport):
+    """
+    Transport sending requests straight through a `urllib3.PoolManager`.
+
+    :param pool_manager (optional): pool manager to use. One is created on
+        first use by default, and in other processes.
+    :param maxsize: number of connections kept open per host.
+    :param block: wait for a free connection instead of opening extra,
+        unpooled ones when all `maxsize` connections are busy.
+    :param timeout (optional): timeout in seconds, or a `urllib3.Timeout`.
+    :param retries: urllib3 retry configuration. Defaults to no retries,
+        like `requests`.
+    """
+    process_attributes = ('_pool_manager', '_timed', '_lock')
+
+    def __init__(self, pool_manager=None, maxsize=10, block=False, timeout=None,
+        retries=False):
+        self.maxsize = maxsize
+        self.block = block
+        self.timeout = timeout
+        self.retries = retries
+        self._reset()
+        self._pool_manager = pool_manager
+
+    def _reset(self):
+        super(Urllib3Transport, self)._reset()
+        self._pool_manager = None
+        # Whether the connections of the pool manager are timed.
+        self._timed = False
+        self._lock = threading.Lock()
+
+    @property
+    def pool_manager(self):
+        self._check_process()
+        with self._lock:
+            if self._pool_manager is None:
+                self._pool_manager = urllib3.PoolManager(maxsize=self.maxsize, block=self.block)
+                self._pool_manager.pool_classes_by_scheme = timed_pool_classes()
+                self._timed = True
+            return self._pool_manager
+
+    def _urlopen(self, method, url, data, headers):
+        return self.pool_manager.urlopen(method, url,
+            body=encode_body(data),
+            headers=headers,
+            redirect=method != 'HEAD',
+            retries=self.retries,
+            timeout=self.timeout,
+            preload_content=False,
+            decode_content=True)
+
+    def request(self, method, url, data=None, headers=None):
+        start = time.time()
+        with connect_timing() as timing:
+            response = self._urlopen(method, url, data, headers)
+        elapsed = time.time() - start
+        try:
+            content = response.read()
+        finally:
+            response.release_conn()
+        out = TransportResponse(response.status,
+            headers=response.headers.items(),
+            content=content,
+            url=url,
+            reason=response.reason,
+            elapsed=timedelta(seconds=elapsed))
+        history = getattr(response.retries, 'history', None)
+        out.retries = len(history) if history else 0
+        out.connect_time = timing.total if self._timed else None
+        return out
+
+    def stream(self, method, url, data=None, headers=None, chunk_size=DEFAULT_READ_SIZE):
+        start = time.time()
+        with connect_timing() as timing:
+            response = self._urlopen(method, url, data, headers)
+        stream = TransportStream(response.status,
+            headers=response.headers.items(),
+            chunks=response.stream(chunk_size, decode_content=True),
+            url=url,
+            reason=response.reason,
+            elapsed=timedelta(seconds=time.time() - start),
+            close=response.release_conn)
+        stream.connect_time = timing.total if self._timed else None
+        return stream
+
+    def connection_pool(self, url):
+        """
+        The connection pool requests to `url` are sent through.
+        """
+        return self.pool_manager.connection_from_url(url)
+
+    def warmup(self, url, connections):
+        return warm_pool(self.connection_pool(url), connections)
+
+    def close(self):
+        self._check_process()
+        with self._lock:
+            pool_manager, self._pool_manager = self._pool_manager, None
+        if pool_manager is not None:
+            pool_manager.clear()
+
+
+class HTTPXTransport(BaseTransport):
+    """
+    Transport sending requests through an `httpx.Client`, multiplexing
+    concurrent requests to the same host over HTTP/2 connections.
+
+    Requires the optional `httpx[http2]` dependency.
+
+    :param client (optional): `httpx.Client` to use. One is created on first
+        use by default, and in other processes.
+    :param http2: negotiate HTTP/2 with servers that support it.
+    :param max_connections: maximum number of open connections.
+    :param timeout: timeout in seconds.
+    """
+    process_attributes = ('httpx', '_client', '_lock')
+
+    def __init__(self, client=None, http2=True, max_connections=10, timeout=None):
+        try:
+            import httpx
+        except ImportError:
+            raise ImportError('HTTPXTransport requires httpx, install it with '
+                '`pip install httpx[http2]`.')
+        self.http2 = http2
+        self.max_connections = max_connections
+        self.timeout = timeout
+        self._reset()
+        self._client = client
+
+    def _reset(self):
+        super(HTTPXTransport, self)._reset()
+        import httpx
+        self.httpx = httpx
+        self._client = None
+        self._lock = threading.Lock()
+
+    @property
+    def client(self):
+        self._check_process()
+        with self._lock:
+            if self._client is None:
+                self._client = self.httpx.Client(http2=self.http2,
+                    limits=self.httpx.Limits(max_connections=self.max_connections),
+                    timeout=self.timeout)
+            return self._client
+
+    def request(self, method, url, data=None, headers=None):
+        timing = ConnectTiming()
+        response = self.client.request(method, url,
+            content=encode_body(data),
+            headers=headers,
+            follow_redirects=method != 'HEAD',
+            extensions={'trace': timing.trace})
+        out = TransportResponse(response.status_code,
+            headers=response.headers.items(),
+            content=response.content,
+            url=url,
+            reason=response.reason_phrase,
+            elapsed=response.elapsed)
+        out.connect_time = timing.total
+        return out
+
+    def stream(self, method, url, data=None, headers=None, chunk_size=DEFAULT_READ_SIZE):
+        timing = ConnectTiming()
+        request = self.client.build_request(method, url, content=encode_body(data), headers=headers,
+            extensions={'trace': timing.trace})
+        start = time.time()
+        response = self.client.send(request, stream=True, follow_redirects=method != 'HEAD')
+        stream = TransportStream(response.status_code,
+            headers=response.headers.items(),
+            chunks=response.iter_bytes(chunk_size),
+            url=url,
+            reason=response.reason_phrase,
+            elapsed=timedelta(seconds=time.time() - start),
+            close=response.close)
+        stream.connect_time = timing.total
+        return stream
+
+    def close(self):
+        self._check_process()
+        with self._lock:
+            client, self._client = self._client, None
+        if client is not None:
+            client.close()
+
+
+#: Transports that can be selected by name.
+TRANSPORTS = {
+    'requests': RequestsTransport,
+    'urllib3': Urllib3Transport,
+    'httpx': HTTPXTransport,
+}
+
+
+def make_transport(transport=None):
+    """
+    Resolve the `transport` argument accepted by the clients and `xauth`.
+
+    :param transport (optional): a transport instance, one of the names in
+        `TRANSPORTS`, or None for the default `RequestsTransport`.
+    """
+    if transport is None:
+        return RequestsTransport()
+    if isinstance(transport, string_types):
+        try:
+            return TRANSPORTS[transport]()
+        except KeyError:
+            raise ValueError('Unknown transport {0!r}, expected one of {1}'.format(
+                transport, ', '.join(sorted(TRANSPORTS))))
+    return transport
+
+
+def scrub_params(pairs):
+    return sorted((key, value) for key, value in pairs if key not in SENSITIVE_PARAMS)
+
+
+def scrub_url(url):
+    """
+    Remove credentials from the query string of `url`.
+    """
+    parts = urlsplit(url)
+    query = urlencode(scrub_params(parse_qsl(parts.query, keep_blank_values=True)))
+    return urlunsplit((parts.scheme, parts.netloc, parts.path, query, ''))
+
+
+def body_digest(body):
+    """
+    Digest of a request body that ignores credentials in form bodies.
+    """
+    if body is None or body == b'' or body == '':
+        return None
+    if not isinstance(body, bytes):
+        body = body.encode('utf-8')
+    try:
+        text = body.decode('ascii')
+    except UnicodeDecodeError:
+        text = None
+    if text is not None and '=' in text:
+        body = urlencode(scrub_params(parse_qsl(text, keep_blank_values=True))).encode('ascii')
+    return hashlib.sha1(body).hexdigest()
+
+
+def join_body(data):
+    """
+    Read a streamed request body, given as an iterator of chunks, into
+    bytes. Other bodies are returned untouched.
+    """
+    if data is None or isinstance(data, (bytes, str)):
+        return data
+    return b''.join(data)
+
+
+def request_key(method, url, data=None):
+    """
+    Key identifying equivalent requests in a cassette.
+    """
+    return '{0} {1} {2}'.format(method.upper(), scrub_url(url), body_digest(data) or '-')
+
+
+class CassetteMiss(LookupError):
+    """
+    Raised when replaying a request that isn't in the cassette.
+    """
+
+
+class Cassette(object):
+    """
+    Recorded request/response exchanges.
+
+    Cassettes are stored as gzip compressed JSON. Bodies are stored as text
+    when they are valid UTF-8 and base64 encoded otherwise. Credentials are
+    scrubbed from urls and request bodies are only kept as digests.
+
+    :param path (optional): file the cassette is loaded from and saved to.
+    """
+    def __init__(self, path=None):
+        self.path = path
+        self.interactions = []
+        self.lock = threading.Lock()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+
+    @classmethod
+    def load(cls, path):
+        cassette = cls(path)
+        with gzip.open(path, 'rb') as cassette_file:
+            data = json.loads(cassette_file.read().decode('utf-8'))
+        if data.get('version') != CASSETTE_VERSION:
+            raise ValueError('Unsupported cassette version {0!r}'.format(data.get('version')))
+        cassette.interactions = data['interactions']
+        return cassette
+
+    def save(self, path=None):
+        path = path or self.path
+        with self.lock:
+            data = {'version': CASSETTE_VERSION, 'interactions': self.interactions}
+        payload = json.dumps(data, separators=(',', ':')).encode('utf-8')
+        with gzip.open(path, 'wb') as cassette_file:
+            cassette_file.write(payload)
+
+    def record(self, method, url, data, response, elapsed):
+        """
+        Add an exchange to the cassette.
+
+        :param method: HTTP method of the request.
+        :param url: url of the request.
+        :param data: body of the request.
+        :param response: response object with `status_code`, `headers` and
+            `content`.
+        :param elapsed: seconds the exchange took.
+        """
+        content = response.content or b''
+        try:
+            body, encoding = content.decode('utf-8'), 'utf-8'
+        except UnicodeDecodeError:
+            body, encoding = base64.b64encode(content).decode('ascii'), 'base64'
+        headers = dict((name, value) for name, value in response.headers.items()
+            if name.lower() not in TRANSFER_HEADERS)
+        interaction = {
+            'key': request_key(method, url, data),
+            'status': response.status_code,
+            'reason': getattr(response, 'reason', None),
+            'headers': headers,
+            'body': body,
+            'encoding': encoding,
+            'elapsed': round(elapsed, 6),
+        }
+        with self.lock:
+            self.interactions.append(interaction)
+
+    def __len__(self):
+        return len(self.interactions)
+
+
+def build_response(interaction, url, elapsed=None):
+    """
+    Turn a recorded interaction back into a `TransportResponse`.
+    """
+    body = interaction['body']
+    if interaction['encoding'] == 'base64':
+        content = base64.b64decode(body)
+    else:
+        content = body.encode('utf-8')
+    return TransportResponse(interaction['status'],
+        headers=interaction['headers'],
+        content=content,
+        url=url,
+        reason=interaction.get('reason'),
+        elapsed=timedelta(seconds=interaction['elapsed'] if elapsed is None else elapsed))
+
+
+class RecordingTransport(BaseTransport):
+    """
+    Transport that records every exchange into a `Cassette`.
+
+    :param cassette: `Cassette` to record into, or a path to save a new one
+        to when the transport is closed.
+    :param transport (optional): transport actually sending the requests.
+        Defaults to a `RequestsTransport`.
+    """
+    def __init__(self, cassette, transport=None):
+        if not isinstance(cassette, Cassette):
+            cassette = Cassette(cassette)
+        self.cassette = cassette
+        self.transport = transport or RequestsTransport()
+
+    def request(self, method, url, data=None, headers=None):
+        # Streamed bodies are read in full: the cassette keys on their digest.
+        data = join_body(data)
+        start = time.time()
+        response = self.transport.request(method, url, data=data, headers=headers)
+        self.cassette.record(method, url, data, response, time.time() - start)
+        return response
+
+    def warmup(self, url, connections):
+        return self.transport.warmup(url, connections)
+
+    def close(self):
+        self.transport.close()
+        if self.cassette.path:
+            self.cassette.save()
+
+
+def uniform_latency(low, high, seed=None):
+    """
+    Latency distribution for `ReplayTransport`: uniform between `low` and
+    `high` seconds.
+    """
+    rand = random.Random(seed)
+    return lambda interaction: rand.uniform(low, high)
+
+
+def lognormal_latency(median, sigma=0.5, seed=None):
+    """
+    Latency distribution for `ReplayTransport`: log-normal with the given
+    median in seconds. Gives the long tail seen on real networks.
+    """
+    rand = random.Random(seed)
+    mu = math.log(median)
+    return lambda interaction: rand.lognormvariate(mu, sigma)
+
+
+def recorded_latency(scale=1.0):
+    """
+    Latency distribution for `ReplayTransport`: the latency observed while
+    recording, multiplied by `scale`.
+    """
+    return lambda interaction: interaction['elapsed'] * scale
+
+
+class ReplayTransport(BaseTransport):
+    """
+    Transport that serves responses from a `Cassette`.
+
+    Requests are matched on method, url and body, ignoring credentials.
+    Equivalent requests are answered with the recorded responses in order;
+    once they are exhausted the last one keeps being served unless `repeat`
+    is false.
+
+    :param cassette: `Cassette` or path to a saved cassette.
+    :param latency (optional): simulated latency. Either a number of
+        seconds, or a callable taking the recorded interaction and returning
+        seconds, like `uniform_latency`, `lognormal_latency` or
+        `recorded_latency`. No latency is simulated by default.
+    :param repeat: keep serving the last matching response once all of them
+        have been replayed.
+    """
+    process_attributes = ('lock',)
+
+    def __init__(self, cassette, latency=None, repeat=True):
+        if not isinstance(cassette, Cassette):
+            cassette = Cassette.load(cassette)
+        self.cassette = cassette
+        self.latency = latency
+        self.repeat = repeat
+        self._reset()
+        self.queues = defaultdict(deque)
+        for interaction in cassette.interactions:
+            self.queues[interaction['key']].append(interaction)
+
+    def _reset(self):
+        super(ReplayTransport, self)._reset()
+        self.lock = threading.Lock()
+
+    def request(self, method, url, data=None, headers=None):
+        key = request_key(method, url, join_body(data))
+        with self.lock:
+            queue = self.queues.get(key)
+            if not queue:
+                raise CassetteMiss('No recorded response for {0}'.format(key))
+            if len(queue) > 1 or not self.repeat:
+                interaction = queue.popleft()
+            else:
+                interaction = queue[0]
+        delay = self.latency
+        if callable(delay):
+            delay = delay(interaction)
+        if delay:
+            time.sleep(delay)
+        return build_response(interaction, url, elapsed=delay)
@@ -0,0 +1,261 @@
+# -*- coding: utf-8 -*-
+
+"""
+readability.urls
+~~~~~~~~~~~~~~~~
+
+This module provides url canonicalization and a persistent index of the
+urls already processed.
+
+`canonicalize_url` maps urls that only differ by tracking parameters,
+fragments, scheme and host case, default ports, parameter order or a
+trailing slash to the same url. `SeenIndex` is a Bloom filter over
+canonical urls, memory-mapped from a file so that it survives restarts and
+only costs about 1.8 bytes per url at a 0.1% false positive rate:
+
+    with SeenIndex('seen.bloom', capacity=50000000) as seen:
+        for url in urls:
+            if seen.add(url):
+                client.get_article(url=url)
+
+A false positive skips a url that was never processed; urls are never
+processed twice.
+
+"""
+
+import hashlib
+import math
+import mmap
+import os
+import re
+import string
+import struct
+import threading
+
+try:
+    from urllib.parse import parse_qsl, quote, urlencode, urlsplit, urlunsplit
+except ImportError:
+    from urllib import quote, urlencode
+    from urlparse import parse_qsl, urlsplit, urlunsplit
+
+#: Query parameters dropped by `canonicalize_url`.
+TRACKING_PARAMS = frozenset([
+    '_ga', '_hsenc', '_hsmi', 'dclid', 'fbclid', 'gclid', 'igshid', 'mc_cid',
+    'mc_eid', 'mkt_tok', 'msclkid', 'ref_src', 'spm', 'yclid',
+])
+#: Prefixes of query parameters dropped by `canonicalize_url`.
+TRACKING_PREFIXES = ('utm_',)
+
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+# Characters left unescaped in canonical paths.
+PATH_SAFE = "/:@!$&'()*+,;=-._~"
+
+# Characters whose percent-escapes mean the same as the character itself.
+UNRESERVED = frozenset(string.ascii_letters + string.digits + '-._~')
+
+ESCAPE = re.compile(r'%([0-9A-Fa-f]{2})')
+
+
+def normalize_escapes(path):
+    """
+    `path` with escapes of unreserved characters decoded, other escapes
+    uppercased and characters not allowed in paths escaped. Escapes of
+    reserved characters, such as `%2F`, are kept since they do not mean the
+    same as the character.
+    """
+    # Text and the hex digits of escapes alternate.
+    pieces = ESCAPE.split(path)
+    for index, piece in enumerate(pieces):
+        if index % 2:
+            char = chr(int(piece, 16))
+            pieces[index] = char if char in UNRESERVED else '%' + piece.upper()
+        else:
+            pieces[index] = quote(piece, safe=PATH_SAFE)
+    return ''.join(pieces)
+
+
+def is_tracking_param(name):
+    name = name.lower()
+    return name in TRACKING_PARAMS or name.startswith(TRACKING_PREFIXES)
+
+
+def canonicalize_url(url, keep_fragment=False, strip_params=is_tracking_param):
+    """
+    Canonical form of `url`.
+
+    The scheme and host are lowercased, default ports, empty queries,
+    trailing slashes and the fragment are dropped, percent-escapes are
+    normalized, tracking parameters are removed and the remaining ones are
+    sorted.
+
+    :param url: absolute url.
+    :param keep_fragment: keep the fragment, for sites routing on it.
+    :param strip_params: callable telling whether a query parameter should
+        be dropped, given its name. Defaults to `is_tracking_param`, pass
+        e.g. `lambda name: name == 'ref' or is_tracking_param(name)` to
+        also drop parameters that only some sites use for tracking.
+    """
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or '').rstrip('.')
+    if ':' in host:
+        host = '[{0}]'.format(host)
+    netloc = host
+    if parts.port and parts.port != DEFAULT_PORTS.get(scheme):
+        netloc = '{0}:{1}'.format(host, parts.port)
+    if parts.username:
+        userinfo = parts.username
+        if parts.password:
+            userinfo += ':' + parts.password
+        netloc = '{0}@{1}'.format(userinfo, netloc)
+    path = normalize_escapes(parts.path)
+    path = re.sub(r'/{2,}', '/', path)
+    if len(path) > 1:
+        path = path.rstrip('/')
+    path = path or '/'
+    params = sorted((name, value)
+        for name, value in parse_qsl(parts.query, keep_blank_values=True)
+        if not (strip_params and strip_params(name)))
+    fragment = parts.fragment if keep_fragment else ''
+    return urlunsplit((scheme, netloc, path, urlencode(params), fragment))
+
+
+class SeenIndex(object):
+    """
+    Persistent Bloom filter of canonical urls.
+
+    The file is created with the size needed for `capacity` urls at
+    `error_rate`; an existing file keeps the parameters it was created with.
+
+    :param path (optional): file backing the index. Kept in memory only
+        when None.
+    :param capacity: number of urls the index is sized for. Adding more
+        raises the false positive rate above `error_rate`.
+    :param error_rate: false positive rate at `capacity` urls.
+    :param canonicalize: callable applied to urls before they are hashed,
+        `canonicalize_url` by default. Pass None to hash urls as they are.
+    """
+    MAGIC = b'RDBLOOM1'
+    # Magic, capacity, error rate, bits, hashes, urls added.
+    HEADER = struct.Struct('<8sQdQIQ')
+
+    def __init__(self, path=None, capacity=10000000, error_rate=0.001,
+        canonicalize=canonicalize_url):
+        self.path = path
+        self.canonicalize = canonicalize
+        self.lock = threading.Lock()
+        self.file = None
+        if path is not None and os.path.exists(path) and os.path.getsize(path):
+            self.file = open(path, 'r+b')
+            header = self.file.read(self.HEADER.size)
+            if len(header) == self.HEADER.size:
+                header = self.HEADER.unpack(header)
+            if header[0] != self.MAGIC:
+                self.file.close()
+                raise ValueError('{0} is not a SeenIndex file'.format(path))
+            _, self.capacity, self.error_rate, self.bits, self.hashes, self.count = header
+        else:
+            self.capacity = capacity
+            self.error_rate = error_rate
+            self.bits = optimal_bits(capacity, error_rate)
+            self.hashes = optimal_hashes(capacity, self.bits)
+            self.count = 0
+        size = self.HEADER.size + (self.bits + 7) // 8
+        if path is None:
+            self.buffer = mmap.mmap(-1, size)
+        else:
+            if self.file is None:
+                self.file = open(path, 'w+b')
+                self.file.truncate(size)
+            self.buffer = mmap.mmap(self.file.fileno(), size)
+        self._write_header()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _write_header(self):
+        self.buffer[:self.HEADER.size] = self.HEADER.pack(self.MAGIC, self.capacity,
+            self.error_rate, self.bits, self.hashes, self.count)
+
+    def positions(self, url):
+        """
+        Bit positions of `url`, by double hashing a single digest.
+        """
+        if self.canonicalize is not None:
+            url = self.canonicalize(url)
+        digest = hashlib.sha1(url.encode('utf-8')).digest()
+        first, second = struct.unpack('<QQ', digest[:16])
+        second |= 1
+        return [(first + index * second) % self.bits for index in range(self.hashes)]
+
+    def _byte(self, offset):
+        value = self.buffer[offset]
+        return value if isinstance(value, int) else ord(value)
+
+    def __contains__(self, url):
+        offset = self.HEADER.size
+        return all(self._byte(offset + position // 8) & (1 << (position % 8))
+            for position in self.positions(url))
+
+    def add(self, url):
+        """
+        Add `url`. Returns True if it was not in the index yet.
+        """
+        positions = self.positions(url)
+        offset = self.HEADER.size
+        added = False
+        with self.lock:
+            for position in positions:
+                index = offset + position // 8
+                byte = self._byte(index)
+                mask = 1 << (position % 8)
+                if not byte & mask:
+                    self.buffer[index:index + 1] = struct.pack('B', byte | mask)
+                    added = True
+            if added:
+                self.count += 1
+        return added
+
+    def update(self, urls):
+        """
+        Add several urls. Returns those that were not in the index yet.
+        """
+        return [url for url in urls if self.add(url)]
+
+    def __len__(self):
+        """
+        Number of urls added, not counting the ones that were false
+        positives when they were added.
+        """
+        return self.count
+
+    def flush(self):
+        with self.lock:
+            self._write_header()
+            self.buffer.flush()
+
+    def close(self):
+        if self.buffer is None:
+            return
+        if self.file is not None:
+            self.flush()
+        self.buffer.close()
+        self.buffer = None
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+def optimal_bits(capacity, error_rate):
+    """
+    Number of Bloom filter bits for `capacity` items at `error_rate`.
+    """
+    return max(int(math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)), 64)
+
+
+def optimal_hashes(capacity, bits):
+    return max(int(round(bits / float(max(capacity, 1)) * math.log(2))), 1)
@@ -8,12 +8,16 @@ This module provides various utils to the rest of the package.
 
 """
 
+import json
 import logging
+import os
 
 from datetime import datetime
 
-from dateutil.parser import parse as parse_datetime
+from readability.core import lazy_import
 
+# dateutil is only needed once a datetime filter is actually cast.
+dateutil_parser = lazy_import('dateutil.parser')
 
 logger = logging.getLogger(__name__)
 
@@ -31,7 +35,7 @@ filter_type_map = {
     'favorited_since': 'datetime',
     'favorited_until': 'datetime',
     'domain': 'string',
-    'only_delete': 'int',
+    'only_deleted': 'int',
     'opened_since': 'datetime',
     'opened_until': 'datetime',
     'order': 'string',
@@ -51,7 +55,7 @@ def cast_datetime_filter(value):
 
     """
     if isinstance(value, str):
-        dtime = parse_datetime(value)
+        dtime = dateutil_parser.parse(value)
 
     elif isinstance(value, datetime):
         dtime = value
@@ -111,3 +115,21 @@ def filter_args_to_dict(filter_dict, accepted_filter_keys=[]):
         out_dict[k] = out_value
 
     return out_dict
+
+
+def write_json_atomic(path, data):
+    """
+    Write `data` as JSON to `path` so that readers see the old or the new
+    content, never a partial one.
+    """
+    temporary = path + '.tmp'
+    with open(temporary, 'w') as json_file:
+        json.dump(data, json_file, sort_keys=True)
+        json_file.flush()
+        os.fsync(json_file.fileno())
+    if hasattr(os, 'replace'):
+        os.replace(temporary, path)
+    else:
+        if os.path.exists(path):
+            os.remove(path)
+        os.rename(temporary, path)
@@ -0,0 +1,347 @@
+# -*- coding: utf-8 -*-
+
+"""
+readability.watcher
+~~~~~~~~~~~~~~~~~~~
+
+This module provides a watcher reporting bookmark changes as they happen.
+
+`BookmarkWatcher` polls `get_bookmarks` for the bookmarks updated since the
+last change it saw, for any number of users from a single scheduling
+thread, and emits a `BookmarkChange` for every bookmark added, updated or
+deleted:
+
+    with BookmarkWatcher(callback=handle_change) as watcher:
+        for client in clients:
+            watcher.watch(client)
+        ...
+
+Polls are conditional: the listing's `ETag` is sent back in
+`If-None-Match`, so that a poll finding nothing new costs a 304 without a
+body. Each user is polled more often while their bookmarks change and less
+often while they do not.
+
+"""
+
+import hashlib
+import heapq
+import itertools
+import json
+import logging
+import random
+import threading
+import time
+
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+#: Kinds of `BookmarkChange`.
+ADDED, UPDATED, DELETED = 'added', 'updated', 'deleted'
+
+
+class BookmarkChange(object):
+    """
+    A bookmark that changed.
+
+    :param key: key of the watch that saw the change.
+    :param kind: `'added'`, `'updated'` or `'deleted'`.
+    :param bookmark: the bookmark, as returned by the Reader API.
+    """
+    __slots__ = ('key', 'kind', 'bookmark')
+
+    def __init__(self, key, kind, bookmark):
+        self.key = key
+        self.kind = kind
+        self.bookmark = bookmark
+
+    def __repr__(self):
+        return '<BookmarkChange {0} {1} {2}>'.format(self.key, self.kind, self.bookmark.get('id'))
+
+
+def fingerprint(bookmark):
+    return hashlib.md5(json.dumps(bookmark, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+class Watch(object):
+    """
+    Polling state of a single watched user.
+    """
+    def __init__(self, key, client, filters, since, interval):
+        self.key = key
+        self.client = client
+        self.filters = filters
+        # Latest `date_updated` seen, and fingerprints of the bookmarks
+        # updated at that time: `updated_since` includes them again.
+        self.since = since
+        self.boundary = {}
+        self.etags = {}
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.removed = False
+
+
+class BookmarkWatcher(object):
+    """
+    Watches the bookmarks of Reader API users for changes.
+
+    Changes are passed to `callback`, put on `queue`, or both.
+
+    :param callback (optional): called with every `BookmarkChange`, in
+        order for each watch. It must not `check` the watch of the change.
+    :param queue (optional): queue, e.g. a `queue.Queue`, changes are put on.
+        A bounded queue that is full holds up the polls of the watch.
+    :param max_workers: number of polls in flight at once.
+    :param min_interval: seconds between polls of a user whose bookmarks
+        just changed.
+    :param max_interval: longest interval between polls of a user.
+    :param backoff: factor the interval of a user grows by after every poll
+        that found no change, or failed.
+    :param jitter: intervals are randomly scaled by up to this fraction.
+    :param per_page: bookmarks fetched per request.
+    :param deletions: also poll for deleted bookmarks, at the cost of a
+        second request per poll.
+    :param seed (optional): seed of the jitter.
+    """
+    def __init__(self, callback=None, queue=None, max_workers=4, min_interval=1.0,
+        max_interval=60.0, backoff=1.5, jitter=0.1, per_page=50, deletions=False, seed=None):
+        self.callback = callback
+        self.queue = queue
+        self.max_workers = max_workers
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.jitter = jitter
+        self.per_page = per_page
+        self.deletions = deletions
+        self.random = random.Random(seed)
+        #: Counter of `'polls'`, `'requests'`, `'not_modified'` responses,
+        #: `'changes'` emitted and `'errors'`.
+        self.stats = Counter()
+        self.stats_lock = threading.Lock()
+        self.condition = threading.Condition()
+        self.watches = {}
+        self.schedule = []
+        self.sequence = itertools.count()
+        self.executor = None
+        self.thread = None
+        self.closed = False
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def start(self):
+        """
+        Start the scheduling thread. Called by the first `watch`.
+        """
+        with self.condition:
+            if self.closed:
+                raise RuntimeError('BookmarkWatcher is closed.')
+            if self.thread is None:
+                self.executor = ThreadPoolExecutor(max_workers=self.max_workers)
+                self.thread = threading.Thread(target=self._run, name='BookmarkWatcher')
+                self.thread.daemon = True
+                self.thread.start()
+        return self
+
+    def close(self):
+        """
+        Stop watching. Polls in flight are finished first.
+        """
+        with self.condition:
+            self.closed = True
+            self.schedule = []
+            self.condition.notify_all()
+        if self.thread is not None:
+            self.thread.join()
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+
+    def watch(self, client, key=None, since=None, filters=None, poll=True):
+        """
+        Watch the bookmarks of a `ReaderClient`'s user.
+
+        Returns the key of the watch.
+
+        :param client: `ReaderClient` of the user.
+        :param key (optional): key identifying the watch in changes.
+            Defaults to the client's token key.
+        :param since (optional): report changes made after this date, in
+            the Reader API format. Defaults to the date of the latest
+            change, looked up on the first poll.
+        :param filters (optional): dict of `get_bookmarks` filters, e.g.
+            `{'archive': 0}`.
+        :param poll: schedule polls from the background thread. Otherwise
+            the watch is only polled by `check`.
+        """
+        key = client.token_key if key is None else key
+        item = Watch(key, client, dict(filters or {}), since, self.min_interval)
+        with self.condition:
+            if key in self.watches:
+                raise ValueError('{0!r} is already watched.'.format(key))
+            self.watches[key] = item
+        if poll:
+            self.start()
+            self._schedule(item, time.time())
+        return key
+
+    def unwatch(self, key):
+        with self.condition:
+            item = self.watches.pop(key, None)
+            if item is not None:
+                item.removed = True
+
+    def check(self, key):
+        """
+        Poll a watch now. Returns the changes found, which are also emitted.
+        """
+        with self.condition:
+            item = self.watches[key]
+        return self._poll(item)
+
+    def _schedule(self, item, due):
+        with self.condition:
+            if self.closed or item.removed:
+                return
+            heapq.heappush(self.schedule, (due, next(self.sequence), item))
+            self.condition.notify()
+
+    def _run(self):
+        while True:
+            with self.condition:
+                while not self.closed:
+                    now = time.time()
+                    if self.schedule and self.schedule[0][0] <= now:
+                        break
+                    self.condition.wait(self.schedule[0][0] - now if self.schedule else None)
+                if self.closed:
+                    return
+                _, _, item = heapq.heappop(self.schedule)
+                if item.removed:
+                    continue
+                self.executor.submit(self._scheduled_poll, item)
+
+    def _scheduled_poll(self, item):
+        try:
+            self._poll(item)
+        except Exception:
+            logger.exception('Polling %r failed', item.key)
+        delay = item.interval * (1 + self.random.uniform(-self.jitter, self.jitter))
+        self._schedule(item, time.time() + delay)
+
+    def _poll(self, item):
+        with item.lock:
+            self._count('polls')
+            try:
+                baseline = item.since is None
+                if baseline:
+                    item.since = self._latest(item)
+                changed = [(bookmark, False) for bookmark in self._changed(item, False)]
+                if self.deletions:
+                    changed.extend((bookmark, True) for bookmark in self._changed(item, True))
+            except Exception:
+                self._count('errors')
+                item.interval = min(item.interval * self.backoff, self.max_interval)
+                raise
+            changes = self._diff(item, changed)
+            if baseline:
+                # Bookmarks updated at the time of the latest change are
+                # only remembered, not reported.
+                changes = []
+            if changes:
+                item.interval = self.min_interval
+            else:
+                item.interval = min(item.interval * self.backoff, self.max_interval)
+            # Emitting under the watch's lock keeps the changes of a user in
+            # order when a `check` races a scheduled poll.
+            for change in changes:
+                self._count('changes')
+                if self.callback is not None:
+                    self.callback(change)
+                if self.queue is not None:
+                    self.queue.put(change)
+        return changes
+
+    def _count(self, name):
+        # Polls of different users update the stats concurrently.
+        with self.stats_lock:
+            self.stats[name] += 1
+
+    def _get(self, item, conditional, **filters):
+        """
+        Fetch a page of bookmarks. When `conditional`, the ETag of the last
+        response to the same query is sent along, and None is returned if
+        nothing changed since.
+        """
+        query = dict(item.filters, **filters)
+        cache_key = tuple(sorted(query.items()))
+        last_key, etag = item.etags.get(query.get('only_deleted'), (None, None))
+        headers = None
+        if conditional and last_key == cache_key:
+            headers = {'If-None-Match': etag}
+        self._count('requests')
+        response = item.client.get_bookmarks(headers=headers, **query)
+        if response.status_code == 304:
+            self._count('not_modified')
+            return None
+        response.raise_for_status()
+        if conditional and response.headers.get('ETag'):
+            item.etags[query.get('only_deleted')] = (cache_key, response.headers['ETag'])
+        return response.json()
+
+    def _latest(self, item):
+        data = self._get(item, False, order='-date_updated', per_page=1)
+        bookmarks = data.get('bookmarks') or []
+        return bookmarks[0]['date_updated'] if bookmarks else '1970-01-01 00:00:00'
+
+    def _changed(self, item, deleted):
+        """
+        Bookmarks updated since the watch's last change, including those
+        updated at the time of it.
+        """
+        filters = {'updated_since': item.since, 'order': 'date_updated', 'per_page': self.per_page}
+        if deleted:
+            filters['only_deleted'] = 1
+        bookmarks = []
+        page = num_pages = 1
+        while page <= num_pages:
+            # Only the first page is conditional: when it did not change,
+            # neither did the others.
+            data = self._get(item, page == 1, page=page, **filters)
+            if data is None:
+                return []
+            bookmarks.extend(data.get('bookmarks') or [])
+            num_pages = int((data.get('meta') or {}).get('num_pages') or 1)
+            page += 1
+        return bookmarks
+
+    def _diff(self, item, changed):
+        """
+        Changes among `(bookmark, deleted)` pairs, leaving out those already
+        reported, and move the watch's last change forward.
+        """
+        changes = []
+        since, boundary = item.since, dict(item.boundary)
+        changed.sort(key=lambda pair: pair[0].get('date_updated') or '')
+        for bookmark, deleted in changed:
+            updated = bookmark.get('date_updated') or item.since
+            bookmark_print = fingerprint(bookmark)
+            if updated == item.since and item.boundary.get((bookmark['id'], deleted)) == bookmark_print:
+                continue
+            if deleted:
+                kind = DELETED
+            elif (bookmark.get('date_added') or '') >= item.since:
+                kind = ADDED
+            else:
+                kind = UPDATED
+            changes.append(BookmarkChange(item.key, kind, bookmark))
+            if updated > since:
+                since, boundary = updated, {}
+            if updated == since:
+                boundary[bookmark['id'], deleted] = bookmark_print
+        item.since, item.boundary = since, boundary
+        return changes
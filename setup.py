@@ -15,6 +15,7 @@ required = [
 # Python 2 dependencies
 if sys.version_info[0] == 2:
     required += [
+        'futures',
         'mock',
     ]
 
@@ -27,6 +28,9 @@ setup(
     author_email='philip@readability.com',
     url='https://github.com/arc90/python-readability-api',
     packages=['readability'],
+    entry_points={
+        'console_scripts': ['readability = readability.cli:main'],
+    },
     install_requires=required,
     license='MIT',
     classifiers=(